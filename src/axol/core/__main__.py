@@ -1,29 +1,35 @@
 import dataclasses
 import importlib
 import sys
-from collections.abc import Iterator
-from concurrent.futures import ThreadPoolExecutor
+import tempfile
 from contextlib import AbstractContextManager, nullcontext
+from datetime import timedelta
 from pathlib import Path
 from typing import IO, Any
 
 import click
 from more_itertools import bucket, ilen
 
+from . import adaptive, clients, metrics, ratelimit
 from .feed import Feed, get_feeds
+from .incremental import DEFAULT_FULL_EVERY, IncrementalSettings
 from .logger import logger as global_logger
+from .planner import SearchPlanner
 from .query import compile_queries
 
 
 @click.group()
-def main() -> None:
-    pass
+@click.pass_context
+def main(ctx: click.Context) -> None:
+    # sessions/API clients are reused by all feeds, so close them once we're done
+    ctx.call_on_close(clients.close_all)
 
 
 arg_limit = click.option('--limit', type=int)
 arg_include = click.option('--include', help='name filter for feeds to use')
 arg_exclude = click.option('--exclude', help='name filter for feeds to use')
 arg_quiet = click.option('--quiet/-q', is_flag=True, help='do not print anything')
+arg_jobs = click.option('--jobs', '-j', type=int, help='parse items in parallel using this many processes')
 
 
 @main.command(name='search')
@@ -60,18 +66,85 @@ def cmd_search(*, module: str, query: str, quiet: bool, limit: int | None, raw:
 @arg_quiet
 @click.option('--parallel', is_flag=True, help='pass to run crawling in parallel, grouped by the provider type')
 @click.option('--dry', is_flag=True, help='search and print results only, do not modify storage')
+@click.option('--concurrent', is_flag=True, help="run feed's search queries concurrently (within provider's budget)")
+@click.option(
+    '--max-buffer-mb',
+    type=int,
+    help='write results to the database in chunks of this size as they arrive, instead of keeping them all in memory',
+)
+@click.option(
+    '--incremental', is_flag=True, help='for queries crawled before, only fetch new items (if feed supports it)'
+)
+@click.option(
+    '--stop-after',
+    type=int,
+    default=IncrementalSettings.stop_after,
+    show_default=True,
+    help='(with --incremental) stop once this many already stored items in a row were seen',
+)
+@click.option(
+    '--full-every-days',
+    type=float,
+    default=DEFAULT_FULL_EVERY / timedelta(days=1),
+    show_default=True,
+    help='(with --incremental) still crawl queries in full if the last full crawl was longer ago than this',
+)
+@click.option(
+    '--adaptive',
+    'use_adaptive',
+    is_flag=True,
+    help='skip queries that get few new items until they are due (configured via ADAPTIVE in the user config)',
+)
+@click.option('--metrics-json', type=Path, help='write crawl metrics (timings, requests, bytes per feed/query) as json')
+@click.option(
+    '--metrics-prom',
+    type=Path,
+    help="write crawl metrics as a Prometheus textfile (for node_exporter's textfile collector)",
+)
 def cmd_crawl(
-    *, limit: int | None, include: str | None, exclude: str | None, dry: bool, quiet: bool, parallel: bool
+    *,
+    limit: int | None,
+    include: str | None,
+    exclude: str | None,
+    dry: bool,
+    quiet: bool,
+    parallel: bool,
+    concurrent: bool,
+    max_buffer_mb: int | None,
+    incremental: bool,
+    stop_after: int,
+    full_every_days: float,
+    use_adaptive: bool,
+    metrics_json: Path | None,
+    metrics_prom: Path | None,
 ) -> None:
     """
     Search all queries in the feed and save in the databases.
     """
     feeds = get_feeds(include=include, exclude=exclude)
+    max_buffer_bytes = None if max_buffer_mb is None else max_buffer_mb * 1024 * 1024
+    # so queries shared by several feeds are only searched once
+    planner = SearchPlanner(feeds)
+    incremental_settings = None
+    if incremental:
+        incremental_settings = IncrementalSettings(
+            stop_after=stop_after,
+            full_every=timedelta(days=full_every_days),
+        )
+    adaptive_settings = adaptive.settings() if use_adaptive else None
 
     def _crawl_group(*, feeds: list[Feed]) -> list[Exception]:
         errors: list[Exception] = []
         for feed in feeds:
-            for res in feed.crawl(limit=limit, dry=dry):
+            for res in feed.crawl(
+                limit=limit,
+                dry=dry,
+                max_buffer_bytes=max_buffer_bytes,
+                concurrent=concurrent,
+                incremental=incremental_settings,
+                adaptive=adaptive_settings,
+                planner=planner,
+            ):
                 if isinstance(res, Exception):
                     feed.logger.error('', exc_info=res)
                     errors.append(res)
@@ -94,6 +167,8 @@ def cmd_crawl(
         fb = bucket(feeds, key=lambda f: f.PREFIX)
         groups = {k: list(fb[k]) for k in fb}
 
+        from concurrent.futures import ThreadPoolExecutor
+
         with ThreadPoolExecutor() as pool:
             futures = []
             for group in groups.values():
@@ -102,22 +177,129 @@ def cmd_crawl(
             for f in futures:
                 errors.extend(f.result())
 
+    planner.log_stats()
+    for host, seconds in sorted(ratelimit.waited().items()):
+        global_logger.info(f'[{host}] waited {seconds:.1f}s in total for rate limit')
+    try:
+        from . import http
+    except ImportError:
+        # requests isn't installed, so nothing could use it anyway
+        pass
+    else:
+        http_stats = http.stats()
+        if len(http_stats) > 0:
+            global_logger.info(f'http cache: {", ".join(f"{k} {v}" for k, v in sorted(http_stats.items()))}')
+    for query, seconds in metrics.registry().top('axol_search_seconds_total', by='query', n=5):
+        global_logger.info(f'slowest queries: {seconds:.1f}s {query}')
+    if metrics_json is not None:
+        metrics.write_json(metrics_json)
+    if metrics_prom is not None:
+        metrics.write_prometheus(metrics_prom)
+
     if len(errors) > 0:
         global_logger.error(f'got {len(errors)} errors')
         sys.exit(1)
 
 
+@main.command(name='daemon')
+@arg_include
+@arg_exclude
+@click.option('--concurrent', is_flag=True, help="run feed's search queries concurrently (within provider's budget)")
+@click.option(
+    '--incremental', is_flag=True, help='for queries crawled before, only fetch new items (if feed supports it)'
+)
+@click.option(
+    '--max-buffer-mb',
+    type=int,
+    help='write results to the database in chunks of this size as they arrive, instead of keeping them all in memory',
+)
+@click.option(
+    '--adaptive',
+    'use_adaptive',
+    is_flag=True,
+    help='crawl feeds/queries more or less often depending on how many new items they get (see ADAPTIVE in the user config)',
+)
+@click.option('--status-file', type=Path, help='where to keep the schedule/status (default: in the storage directory)')
+@click.option('--metrics-prom', type=Path, help='write crawl metrics as a Prometheus textfile after every crawl')
+@click.option('--status', 'show_status', is_flag=True, help='print status of the running daemon and exit')
+def cmd_daemon(
+    *,
+    include: str | None,
+    exclude: str | None,
+    concurrent: bool,
+    incremental: bool,
+    max_buffer_mb: int | None,
+    use_adaptive: bool,
+    status_file: Path | None,
+    metrics_prom: Path | None,
+    show_status: bool,
+) -> None:
+    """
+    Keep running and crawl each feed on its own schedule (configured via DAEMON in the user config).
+    """
+    import signal
+
+    from . import daemon, storage
+    from .feed import storage_dir
+
+    if status_file is None:
+        status_file = storage_dir() / 'daemon-status.json'
+
+    if show_status:
+        status = daemon.load_status(status_file)
+        if status is None:
+            global_logger.error(f'{status_file} does not exist, is the daemon running?')
+            sys.exit(1)
+        print(daemon.format_status(status))
+        return
+
+    feeds = get_feeds(include=include, exclude=exclude)
+    crawl_kwargs = {
+        'concurrent': concurrent,
+        'incremental': IncrementalSettings() if incremental else None,
+        'max_buffer_bytes': None if max_buffer_mb is None else max_buffer_mb * 1024 * 1024,
+        'adaptive': adaptive.settings() if use_adaptive else None,
+    }
+    d = daemon.Daemon(
+        feeds,
+        settings=daemon.settings(),
+        status_path=status_file,
+        metrics_prom=metrics_prom,
+        crawl_kwargs=crawl_kwargs,
+    )
+    # so it stops gracefully when stopped by systemd etc
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    with storage.keep_open():
+        d.run()
+
+
 @main.command(name='feed')
 @arg_include
 @arg_exclude
-def cmd_feed(*, include: str | None, exclude: str | None) -> None:
+@arg_jobs
+@click.option('--kind', 'kinds', multiple=True, help='only items of this kind, e.g. story/comment (can be repeated)')
+@click.option('--author', 'authors', multiple=True, help='only items by this author (can be repeated)')
+def cmd_feed(
+    *,
+    include: str | None,
+    exclude: str | None,
+    jobs: int | None,
+    kinds: tuple[str, ...],
+    authors: tuple[str, ...],
+) -> None:
     """
     Load feed from the database and print to stdout
     """
+    from .fields import Where
+
+    where = None
+    if len(kinds) > 0 or len(authors) > 0:
+        where = Where(kinds=kinds or None, authors=authors or None)
+
     feeds = get_feeds(include=include, exclude=exclude)
     errors = []
     for feed in feeds:
-        for crawl_dt, uid, o in feed.feed():
+        for crawl_dt, uid, o in feed.feed(workers=jobs, where=where):
             if isinstance(o, Exception):
                 feed.logger.error("", exc_info=o)
                 errors.append(o)
@@ -131,7 +313,8 @@ def cmd_feed(*, include: str | None, exclude: str | None) -> None:
 @main.command(name='markdown')
 @arg_include
 @click.option('--to', type=Path, required=False)
-def cmd_markdown(*, include: str | None, to: Path | None) -> None:
+@arg_jobs
+def cmd_markdown(*, include: str | None, to: Path | None, jobs: int | None) -> None:
     feeds = get_feeds(include=include)
 
     if to is None:
@@ -139,48 +322,7 @@ def cmd_markdown(*, include: str | None, to: Path | None) -> None:
     else:
         assert to.is_dir(), to
 
-    from ..renderers.markdown import MarkdownAdapterT
-
-    def iter_markdown(feed: Feed) -> Iterator[str | Exception]:
-        MdAdapter: type[MarkdownAdapterT] = feed.MarkdownAdapter
-
-        adapters = []
-        for _crawl_dt, _uid, o in feed.feed():
-            # TODO maybe use uid?
-            if isinstance(o, Exception):
-                yield o
-                continue
-            try:
-                mdo = MdAdapter(o)
-                created_at = mdo.created_at
-            except Exception as e:
-                yield e
-                continue
-            adapters.append(mdo)
-
-        # sort items so that ones that don't have date go last
-        def key(a: MarkdownAdapterT):
-            dt = a.created_at
-            if dt is not None:
-                return (False, dt)
-            else:
-                return (True,)
-
-        adapters = sorted(adapters, key=key)
-
-        for a in adapters:
-            # TODO include uid?
-            try:
-                created_at = a.created_at
-                author = a.author
-                content = a.content
-            except Exception as e:
-                yield e
-                continue
-
-            created_str = 'no timestamp' if created_at is None else created_at.strftime('%Y-%m-%d %H:%M')
-            by = f'by [{author.name}]({author.url})'
-            yield f'{content}\n\n`{created_str}` {by}'
+    from ..renderers.markdown import render_feed
 
     errors: list[Exception] = []
 
@@ -196,7 +338,7 @@ def cmd_markdown(*, include: str | None, to: Path | None) -> None:
             ctx = path.open('w')
         with ctx as sink:
             try:
-                for md in iter_markdown(feed):
+                for md in render_feed(feed, workers=jobs):
                     if isinstance(md, Exception):
                         feed.logger.error('', exc_info=md)
                         errors.append(md)
@@ -215,16 +357,27 @@ def cmd_markdown(*, include: str | None, to: Path | None) -> None:
 @arg_exclude
 @click.option('--dry', is_flag=True, help='only output items that would be pruned, do not actually prune')
 @click.option('--print', 'do_print', is_flag=True, help='whether to print out pruned items (useful with --dry mode)')
-def cmd_prune(*, include: str | None, exclude: str | None, dry: bool, do_print: bool) -> None:
+@click.option('--full', is_flag=True, help='check all items, not just the ones crawled since the previous prune')
+@arg_jobs
+def cmd_prune(
+    *,
+    include: str | None,
+    exclude: str | None,
+    dry: bool,
+    do_print: bool,
+    full: bool,
+    jobs: int | None,
+) -> None:
     """
     Prune items from the database according to the config
 
     This is useful if you excluded a bunch of items from the search and want to retroactively delete them from the db as well.
+    Only items crawled since the previous prune are checked, unless the exclusion config changed since then.
     """
     feeds = get_feeds(include=include, exclude=exclude)
     for feed in feeds:
         total = 0
-        for crawl_dt, uid, o in feed.prune_db(dry=dry):
+        for crawl_dt, uid, o in feed.prune_db(dry=dry, full=full, workers=jobs):
             total += 1
             if do_print:
                 print(crawl_dt, uid, o)
@@ -235,11 +388,36 @@ def cmd_prune(*, include: str | None, exclude: str | None, dry: bool, do_print:
             feed.logger.info(msg)
 
 
+@main.command(name='compress')
+@arg_include
+@arg_exclude
+@click.option('--dict-size', type=int, default=112640, help='size of the trained zstd dictionary in bytes')
+@click.option('--no-vacuum', is_flag=True, help="don't VACUUM the database afterwards (the file won't shrink)")
+def cmd_compress(*, include: str | None, exclude: str | None, dict_size: int, no_vacuum: bool) -> None:
+    """
+    Compress stored items with zstd, using a dictionary trained on the feed's own data.
+
+    This also works as a migration for existing databases. Reading compressed databases is transparent,
+    and once the database has a dictionary, newly crawled items are compressed as well.
+    Can be rerun occasionally to retrain the dictionary.
+    """
+    feeds = get_feeds(include=include, exclude=exclude)
+    for feed in feeds:
+        if not feed.db_path.exists():
+            feed.logger.info('no database yet, skipping')
+            continue
+        with feed._database(writable=True) as db:
+            before, after = db.recompress(dict_size=dict_size, vacuum=not no_vacuum)
+        ratio = after / before if before > 0 else 1.0
+        feed.logger.info(f'compressed {before} -> {after} bytes ({ratio:.1%})')
+
+
 @main.command(name='stats')
 @arg_include
 @arg_exclude
 @click.option('--threshold', type=float, default=0.01, help='threshold to filter against')
-def cmd_stats(*, include: str | None, exclude: str | None, threshold: float) -> None:
+@arg_jobs
+def cmd_stats(*, include: str | None, exclude: str | None, threshold: float, jobs: int | None) -> None:
     """
     Compute statistics for different fields in feed's objects.
 
@@ -250,7 +428,7 @@ def cmd_stats(*, include: str | None, exclude: str | None, threshold: float) ->
     from .misc.stats import print_stats
 
     for feed in feeds:
-        print_stats(feed=feed, threshold=threshold)
+        print_stats(feed=feed, threshold=threshold, workers=jobs)
 
 
 @main.command(name='feeds')
@@ -293,6 +471,8 @@ def cmd_feeds(*, include: str | None, exclude: str | None, search: bool, db_stat
             if db_stats:
                 db_items = ilen(feed.feed()) if feed.db_path.exists() else -1
                 d['db_items'] = db_items
+                rates = [wm.new_per_day for wm in feed.watermarks().values() if wm.new_per_day is not None]
+                d['new_per_day'] = f'{sum(rates):.1f}' if len(rates) > 0 else ''
             datas.append(d)
 
     import tabulate
@@ -300,6 +480,106 @@ def cmd_feeds(*, include: str | None, exclude: str | None, search: bool, db_stat
     print(tabulate.tabulate(datas, headers='keys', stralign='right'))
 
 
+@main.command(name='index')
+@arg_include
+@arg_exclude
+@click.option('--rebuild', is_flag=True, help='drop the existing index and index all items again')
+def cmd_index(*, include: str | None, exclude: str | None, rebuild: bool) -> None:
+    """
+    Create/update full-text index for 'axol grep'. Once created, it's kept up to date by crawl.
+    """
+    feeds = get_feeds(include=include, exclude=exclude)
+    for feed in feeds:
+        if not feed.db_path.exists():
+            continue
+        if rebuild:
+            with feed._database(writable=True) as db:
+                db.drop_fts()
+        indexed = feed.update_index(create=True)
+        global_logger.info(f'[{feed.name}] indexed {indexed} items')
+
+
+@main.command(name='grep')
+@click.argument('query', required=True)
+@arg_include
+@arg_exclude
+@click.option('--limit', type=int, default=20, show_default=True)
+@click.option('--fts5', 'use_fts5', is_flag=True, help='QUERY uses sqlite FTS5 syntax')
+def cmd_grep(*, query: str, include: str | None, exclude: str | None, limit: int, use_fts5: bool) -> None:
+    """
+    Full-text search over crawled items (see 'axol index'), best matches first.
+
+    By default QUERY is plain search terms, all of which have to match, e.g. 'node.js async'.
+
+    With --fts5, QUERY uses sqlite FTS5 syntax, e.g. 'rust AND async', '"exact phrase"', 'prefix*', 'title:python'
+    """
+    from .fts import QueryError, grep, terms
+
+    feeds = get_feeds(include=include, exclude=exclude)
+    try:
+        # NOTE: materializing, so the error is reported before any output
+        matches = list(grep(feeds, query if use_fts5 else terms(query), limit=limit))
+    except QueryError as e:
+        raise click.UsageError(f'invalid FTS5 query {e}') from e
+    for m in matches:
+        print(f'{m.feed} {m.uid} {m.crawl_dt:%Y-%m-%d} {m.title}')
+        print(f'    {m.snippet}')
+
+
+@main.command(name='bench')
+@click.option('--module', 'modules', multiple=True, help='modules to benchmark (default: all)')
+@click.option('-n', '--items', type=int, default=2000, show_default=True, help='number of synthetic items per module')
+@click.option('--rounds', type=int, default=5, show_default=True, help='how many times to run each benchmark')
+@click.option('--history', type=Path, default=None, help='sqlite file with results of previous runs')
+@click.option('--no-save', is_flag=True, help="don't add results to the history")
+def cmd_bench(*, modules: tuple[str, ...], items: int, rounds: int, history: Path | None, no_save: bool) -> None:
+    """
+    Benchmark storage, parsing and rendering on synthetic data.
+
+    Results are compared against the previous run in the history, so it's easy to spot regressions.
+    """
+    import tabulate
+
+    from .misc.bench import SAMPLES, History, report, run
+
+    if history is None:
+        history = Path(tempfile.gettempdir()) / 'axol-bench.sqlite'
+    hist = History(history)
+    timings = list(run(modules=modules or list(SAMPLES), n=items, rounds=rounds))
+    print(tabulate.tabulate(report(timings, history=hist), headers='keys', stralign='right'))
+    if not no_save:
+        hist.save(timings)
+        global_logger.info(f'saved results to {history}')
+
+
+@main.command(name='standin')
+@click.option('--fixtures', type=Path, required=True, help='directory with recorded responses')
+@click.option('--record', is_flag=True, help='forward requests without fixtures to real websites and record responses')
+@click.option('--latency', type=float, default=0.0, help='seconds to add to each response')
+@click.option('--throttle-every', type=int, default=None, help="every n-th request gets a 'too many requests' response")
+def cmd_standin(*, fixtures: Path, record: bool, latency: float, throttle_every: int | None) -> None:
+    """
+    Run local stand-in servers for search providers, serving recorded responses.
+
+    Prints AXOL_ROUTES to export, so 'axol crawl' in another shell uses the stand-ins instead of live websites.
+    """
+    import json
+    import threading
+
+    from .standin import Behaviour, serve
+
+    behaviour = Behaviour(latency=latency, throttle_every=throttle_every)
+    with serve(fixtures, behaviour=behaviour, record=record) as standins:
+        routes = {host: standin.base_url for host, standin in standins.items()}
+        print(f"export {clients.ROUTES_ENV}='{json.dumps(routes)}'")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        for host, standin in standins.items():
+            global_logger.info(f'[{host}] served {standin.requests} requests')
+
+
 # TODO special mode to run test method from search module??
 # import subprocess
 # import sys
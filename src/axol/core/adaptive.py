@@ -0,0 +1,88 @@
+# Adaptive crawl frequency.
+#
+# Some queries get a new item every few weeks, others get dozens every hour, so crawling all of them
+# on the same cadence wastes API budget on the former and misses stuff (or needs deeper crawls) for the latter.
+#
+# For each query we keep a smoothed rate of new items per day (next to its watermark, see core.incremental),
+# and only crawl the query once enough new items are expected, within min/max bounds.
+
+from dataclasses import dataclass
+from datetime import timedelta
+
+DAY_S = 24 * 60 * 60
+
+
+@dataclass(frozen=True)
+class AdaptiveSettings:
+    # crawl queries at least/at most this often
+    min_interval: timedelta = timedelta(hours=1)
+    max_interval: timedelta = timedelta(days=7)
+    # aim for this many new items per crawl of the query
+    target_new: float = 5.0
+    # weight of the latest observation in the smoothed rate, the rest is the previous rate
+    smoothing: float = 0.5
+
+    def interval(self, new_per_day: float | None) -> timedelta:
+        """
+        How long to wait between crawls of a query with this rate of new items.
+        """
+        if new_per_day is None:
+            # not enough data yet
+            return self.min_interval
+        if new_per_day <= 0:
+            return self.max_interval
+        interval = timedelta(days=self.target_new / new_per_day)
+        return max(self.min_interval, min(interval, self.max_interval))
+
+
+def settings() -> AdaptiveSettings:
+    """
+    Configured via optional ADAPTIVE in the user config
+    """
+    try:
+        import axol.user_config as C
+    except Exception:
+        return AdaptiveSettings()
+    return getattr(C, 'ADAPTIVE', AdaptiveSettings())
+
+
+def update_rate(
+    previous: float | None,
+    *,
+    new: int,
+    elapsed_s: float | None,
+    smoothing: float = AdaptiveSettings.smoothing,
+) -> float | None:
+    """
+    Returns the smoothed rate of new items per day after a crawl which found this many new items.
+
+    elapsed_s: time since the previous crawl of the query, None if it was never crawled before
+    """
+    if elapsed_s is None or elapsed_s <= 0:
+        # first crawl returns everything ever posted, so it doesn't tell anything about the rate
+        return previous
+    observed = new / (elapsed_s / DAY_S)
+    if previous is None:
+        return observed
+    return smoothing * observed + (1 - smoothing) * previous
+
+
+def test_interval() -> None:
+    s = AdaptiveSettings(min_interval=timedelta(hours=1), max_interval=timedelta(days=7), target_new=5)
+    assert s.interval(None) == timedelta(hours=1)
+    assert s.interval(0) == timedelta(days=7)
+    assert s.interval(5) == timedelta(days=1)
+    assert s.interval(0.1) == timedelta(days=7)  # would be 50 days
+    assert s.interval(1000) == timedelta(hours=1)
+
+
+def test_update_rate() -> None:
+    assert update_rate(None, new=100, elapsed_s=None) is None
+    assert update_rate(None, new=10, elapsed_s=DAY_S / 2) == 20
+    # smoothed
+    assert update_rate(20, new=0, elapsed_s=DAY_S, smoothing=0.5) == 10
+    rate: float | None = 20
+    for _ in range(10):
+        rate = update_rate(rate, new=0, elapsed_s=DAY_S)
+    assert rate is not None
+    assert rate < 0.1
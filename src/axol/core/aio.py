@@ -0,0 +1,279 @@
+# Concurrent search.
+#
+# Most of the time while crawling is spent waiting: on the network, and on sleeps between pages
+# that providers do to avoid hammering the website. So we run the compiled queries concurrently,
+# but within a per-provider budget, so we don't end up hammering it anyway.
+#
+# Providers are regular blocking functions, they are adapted by running them in threads (see from_sync).
+
+import itertools
+import queue
+import threading
+from collections.abc import AsyncIterator, Callable, Generator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Protocol
+
+from .common import SearchResult, SearchResults, make_uid
+
+if TYPE_CHECKING:
+    # NOTE: asyncio takes a while to import, and it's only needed for concurrent crawling
+    import asyncio
+
+AsyncSearchResults = AsyncIterator[SearchResult]
+
+
+class AsyncSearchF(Protocol):
+    def __call__(self, query: Any, *, limit: int | None, **kwargs: Any) -> AsyncSearchResults: ...
+
+
+@dataclass(frozen=True)
+class Budget:
+    """
+    How hard we're allowed to hit a provider.
+    """
+
+    concurrency: int = 1  # max queries running at the same time
+    interval: float = 0.0  # min seconds between starting queries
+
+
+class Limiter:
+    """
+    Keeps track of per-provider budgets, should be shared between feeds using the same provider.
+
+    NOTE: only usable within a single event loop.
+    """
+
+    def __init__(self) -> None:
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._next_start: dict[str, float] = {}
+
+    @asynccontextmanager
+    async def slot(self, key: str, budget: Budget) -> AsyncIterator[None]:
+        import asyncio
+
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(budget.concurrency)
+            self._semaphores[key] = semaphore
+        async with semaphore:
+            now = asyncio.get_running_loop().time()
+            start = max(now, self._next_start.get(key, now))
+            self._next_start[key] = start + budget.interval
+            if start > now:
+                await asyncio.sleep(start - now)
+            yield
+
+
+class _Done:
+    pass
+
+
+_DONE = _Done()
+
+
+def from_sync(search: Callable[..., SearchResults]) -> AsyncSearchF:
+    """
+    Adapts a regular (blocking) search function by running it in a thread.
+
+    Each query gets a dedicated thread, so the iterator is always advanced from the same thread.
+    If the search is stopped early (e.g. cancelled), the iterator is closed in that thread too,
+    so its cleanup (e.g. returning borrowed clients) runs without waiting for garbage collection.
+    """
+
+    async def search_async(query: Any, *, limit: int | None, **kwargs: Any) -> AsyncSearchResults:
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1)
+        it = None
+        try:
+            # NOTE: some search functions might do work before returning the iterator, so also in the thread
+            it = await loop.run_in_executor(executor, lambda: iter(search(query=query, limit=limit, **kwargs)))
+            while True:
+                res: SearchResult | _Done = await loop.run_in_executor(executor, next, it, _DONE)
+                if isinstance(res, _Done):
+                    return
+                yield res
+        finally:
+            try:
+                close = getattr(it, 'close', None)
+                if close is not None:
+                    # NOTE: queued after the next() call that might still be running, so only this query waits for it
+                    await loop.run_in_executor(executor, close)
+            finally:
+                # NOTE: not waiting here, it would block the event loop (and all other queries)
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    return search_async
+
+
+def iter_sync[T](make_iter: Callable[[], AsyncIterator[T]], *, buffer: int = 1000) -> Generator[T, None, None]:
+    """
+    Runs async iterator in a separate thread with its own event loop, and yields its items.
+    """
+    import asyncio
+
+    items: queue.Queue[tuple[bool, Any]] = queue.Queue(maxsize=buffer)
+    stopped = threading.Event()
+
+    def put_blocking(item: Any, *, done: bool) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put((done, item), timeout=0.1)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    async def put(item: Any, *, done: bool) -> bool:
+        try:
+            items.put_nowait((done, item))
+        except queue.Full:
+            # NOTE: wait in a thread, so a slow consumer only suspends the producer, not other tasks in the loop
+            return await asyncio.to_thread(put_blocking, item, done=done)
+        return True
+
+    async def produce() -> None:
+        try:
+            async for item in make_iter():
+                if not await put(item, done=False):
+                    # consumer isn't interested anymore
+                    return
+        except Exception as e:
+            await put(e, done=True)
+        else:
+            await put(None, done=True)
+
+    thread = threading.Thread(target=lambda: asyncio.run(produce()), daemon=True)
+    thread.start()
+    try:
+        while True:
+            done, item = items.get()
+            if done:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def test_limiter() -> None:
+    import asyncio
+    import time
+
+    running = 0
+    max_running = 0
+    starts: list[float] = []
+
+    async def query(limiter: Limiter) -> None:
+        nonlocal running, max_running
+        async with limiter.slot('provider', Budget(concurrency=2, interval=0.05)):
+            starts.append(time.monotonic())
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.1)
+            running -= 1
+
+    async def main() -> None:
+        limiter = Limiter()
+        await asyncio.gather(*(query(limiter) for _ in range(6)))
+
+    asyncio.run(main())
+    assert max_running == 2
+    assert all(b - a >= 0.04 for a, b in itertools.pairwise(starts))
+
+
+def test_from_sync_cancel() -> None:
+    import asyncio
+    import time
+
+    closed = threading.Event()
+
+    def slow(query: str, *, limit: int | None) -> SearchResults:  # noqa: ARG001
+        try:
+            yield make_uid(query + '0'), b''
+            time.sleep(0.5)
+            yield make_uid(query + '1'), b''
+        finally:
+            closed.set()
+
+    ticks = 0
+
+    async def tick() -> None:
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    async def consume() -> None:
+        async for _ in from_sync(slow)('q', limit=None):
+            pass
+
+    async def main() -> None:
+        ticker = asyncio.create_task(tick())
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.1)  # by now blocked in the slow call
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert closed.is_set()
+        ticker.cancel()
+
+    asyncio.run(main())
+    # other tasks kept running while the cancelled search was finishing
+    assert ticks > 25
+
+
+def test_iter_sync() -> None:
+    import asyncio
+    import time
+
+    import pytest
+
+    def search(query: str, *, limit: int | None) -> SearchResults:
+        for i in range(limit or 10):
+            yield make_uid(query + str(i)), b''
+
+    async def results(*, fail: bool) -> AsyncIterator[SearchResult]:
+        async for r in from_sync(search)('q', limit=3):
+            yield r
+        if fail:
+            raise RuntimeError('BOOM')
+
+    assert [uid for uid, _ in iter_sync(lambda: results(fail=False))] == ['q0', 'q1', 'q2']
+
+    it = iter_sync(lambda: results(fail=True))
+    assert next(it)[0] == 'q0'
+    with pytest.raises(RuntimeError, match='BOOM'):
+        list(it)
+
+    # stopping early shouldn't hang
+    it = iter_sync(lambda: results(fail=False), buffer=1)
+    next(it)
+    it.close()
+
+    # slow consumer doesn't hold up other tasks in the loop
+    ticks = 0
+
+    async def tick() -> None:
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    async def ticking() -> AsyncIterator[int]:
+        ticker = asyncio.create_task(tick())
+        try:
+            for i in range(3):
+                yield i
+        finally:
+            ticker.cancel()
+
+    it2 = iter_sync(ticking, buffer=1)
+    assert next(it2) == 0
+    time.sleep(0.3)
+    assert ticks > 10
+    assert list(it2) == [1, 2]
@@ -0,0 +1,211 @@
+# Process-wide registry of HTTP sessions and API clients.
+#
+# Creating a client per request/query means a new TCP+TLS handshake (and for some API clients, authentication)
+# every time. Instead providers get clients from here, so connections are kept alive and reused
+# between pages and queries. Everything is closed on exit (see close_all).
+
+import json
+import os
+import threading
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, override
+from urllib.parse import urlsplit, urlunsplit
+
+from . import metrics
+from .logger import logger
+
+if TYPE_CHECKING:
+    import requests
+
+
+@dataclass(frozen=True)
+class ClientSettings:
+    # max connections kept alive per host
+    pool_size: int = 10
+    # seconds, for connecting and for each read
+    timeout: float = 60.0
+
+
+_settings: ClientSettings | None = None
+
+
+def settings() -> ClientSettings:
+    """
+    Configured via optional CLIENTS in the user config
+    """
+    global _settings
+    if _settings is None:
+        res = ClientSettings()
+        try:
+            import axol.user_config as C
+        except Exception:
+            # e.g. 'axol search' without config, or running tests
+            pass
+        else:
+            res = getattr(C, 'CLIENTS', res)
+        _settings = res
+    return _settings
+
+
+# where requests to a host should go instead, e.g. local stand-in servers (see core.standin)
+# can also be set via AXOL_ROUTES environment variable, as json {host: base url}, so it's inherited by subprocesses
+ROUTES_ENV = 'AXOL_ROUTES'
+_routes: dict[str, str] = {}
+
+
+def route(host: str, base_url: str | None) -> None:
+    """
+    Sends requests to the host to base_url instead. None removes the route.
+    """
+    if base_url is None:
+        _routes.pop(host, None)
+    else:
+        _routes[host] = base_url.rstrip('/')
+
+
+def resolve(url: str) -> str:
+    """
+    Applies routes to the url, providers should call it for every url they request (or use as base url).
+    """
+    parts = urlsplit(url)
+    host = parts.hostname
+    assert host is not None, url
+    base = _routes.get(host)
+    if base is None:
+        env = os.environ.get(ROUTES_ENV)
+        if env is not None:
+            base = json.loads(env).get(host)
+    if base is None:
+        return url
+    return base + urlunsplit(('', '', parts.path, parts.query, parts.fragment))
+
+
+_lock = threading.Lock()
+# clients which are safe to share between threads, e.g. requests sessions
+_shared: dict[str, Any] = {}
+# clients which aren't thread safe, handed out one at a time
+_idle: dict[str, list[Any]] = defaultdict(list)
+# everything we created, for closing
+_created: list[tuple[str, Any, Callable[[Any], None]]] = []
+
+
+def shared[T](key: str, make: Callable[[], T], *, close: Callable[[T], None]) -> T:
+    """
+    Returns the same client for the key on every call. The client should be thread safe.
+    """
+    with _lock:
+        client = _shared.get(key)
+        if client is None:
+            client = make()
+            _shared[key] = client
+            _created.append((key, client, close))
+        return client
+
+
+@contextmanager
+def borrow[T](key: str, make: Callable[[], T], *, close: Callable[[T], None]) -> Iterator[T]:
+    """
+    For clients that aren't thread safe: reuses an idle client for the key if there is one, otherwise makes a new one.
+    The client is returned to the pool afterwards.
+    """
+    with _lock:
+        idle = _idle[key]
+        client = idle.pop() if len(idle) > 0 else None
+    if client is None:
+        client = make()
+        with _lock:
+            _created.append((key, client, close))
+    try:
+        yield client
+    finally:
+        with _lock:
+            _idle[key].append(client)
+
+
+def session(host: str) -> 'requests.Session':
+    """
+    Keep-alive requests session for the host, with pool size and default timeout from settings.
+    Requests made with it are recorded in metrics.
+    """
+
+    def make() -> 'requests.Session':
+        # NOTE: requests is an optional dependency
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        s = settings()
+
+        class TimeoutAdapter(HTTPAdapter):
+            # NOTE: same signature as HTTPAdapter.send
+            @override
+            def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+                if timeout is None:
+                    timeout = s.timeout
+                return super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+
+        def record(r: requests.Response, *_args, **kwargs) -> None:
+            status = str(r.status_code)
+            metrics.inc('axol_http_requests_total', host=host, status=status)
+            metrics.observe('axol_http_request_seconds', r.elapsed.total_seconds(), host=host)
+            if not kwargs.get('stream'):
+                metrics.inc('axol_http_response_bytes_total', len(r.content), host=host)
+
+        session = requests.Session()
+        adapter = TimeoutAdapter(pool_connections=1, pool_maxsize=s.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.hooks['response'].append(record)
+        return session
+
+    return shared(f'session:{host}', make, close=lambda session: session.close())
+
+
+def close_all() -> None:
+    with _lock:
+        created = list(_created)
+        _created.clear()
+        _shared.clear()
+        _idle.clear()
+    for key, client, close in created:
+        try:
+            close(client)
+        except Exception as e:
+            logger.warning(f'[{key}] error while closing client: {e}')
+
+
+def test_registry() -> None:
+    made: list[int] = []
+    closed: list[int] = []
+
+    def make() -> int:
+        made.append(len(made))
+        return made[-1]
+
+    try:
+        assert shared('a', make, close=closed.append) == shared('a', make, close=closed.append) == 0
+
+        with borrow('b', make, close=closed.append) as b1:
+            # in use, so have to make a new one
+            with borrow('b', make, close=closed.append) as b2:
+                assert (b1, b2) == (1, 2)
+        with borrow('b', make, close=closed.append) as b3:
+            assert b3 in {1, 2}
+        assert len(made) == 3
+    finally:
+        close_all()
+    assert sorted(closed) == [0, 1, 2]
+
+
+def test_resolve() -> None:
+    url = 'https://lobste.rs/search?q=python'
+    assert resolve(url) == url
+    route('lobste.rs', 'http://127.0.0.1:1234/')
+    try:
+        assert resolve(url) == 'http://127.0.0.1:1234/search?q=python'
+        assert resolve('https://pinboard.in/search') == 'https://pinboard.in/search'
+    finally:
+        route('lobste.rs', None)
+    assert resolve(url) == url
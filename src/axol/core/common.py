@@ -20,6 +20,9 @@ def make_uid(s: str) -> Uid:
 
 datetime_aware = datetime
 
+# when the item was crawled (i.e. inserted into the database)
+CrawlDt = datetime_aware
+
 SearchResult = tuple[Uid, bytes]
 SearchResults = Iterator[SearchResult]
 
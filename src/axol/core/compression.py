@@ -0,0 +1,120 @@
+# Transparent zstd compression for the data column.
+#
+# Compressed blobs are regular zstd frames, so we can tell them apart from raw blobs by the magic number
+# (raw blobs are json/html, so can't start with it). This means compressed and uncompressed rows can coexist
+# in the same database, and it's always safe to read regardless of whether compression is enabled.
+#
+# Zstd frames also contain id of the dictionary they were compressed with, so we can keep multiple dictionaries around.
+# Dictionaries themselves are stored in the database, see Database.recompress
+
+from collections.abc import Callable, Sequence
+from typing import Any
+
+REQUIRES = ['zstandard']
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# this is zstd default, seems like a good tradeoff
+LEVEL = 3
+
+
+def is_compressed(data: bytes) -> bool:
+    return data[:4] == ZSTD_MAGIC
+
+
+class Codec:
+    def __init__(
+        self,
+        *,
+        load_dict: Callable[[int], bytes],
+        current_dict_id: Callable[[], int | None],
+        level: int = LEVEL,
+    ) -> None:
+        """
+        load_dict: returns dictionary data by its id
+        current_dict_id: id of the dictionary to use for compression (or None to compress without dictionary)
+        """
+        self._load_dict = load_dict
+        self._current_dict_id = current_dict_id
+        self.level = level
+        # ugh, zstandard objects aren't typed
+        self._dicts: dict[int, Any] = {}
+        self._decompressors: dict[int, Any] = {}
+        self._compressor: Any = None
+
+    def _dict(self, dict_id: int):
+        import zstandard
+
+        d = self._dicts.get(dict_id)
+        if d is None:
+            d = zstandard.ZstdCompressionDict(self._load_dict(dict_id))
+            self._dicts[dict_id] = d
+        return d
+
+    def compress(self, data: bytes) -> bytes:
+        import zstandard
+
+        if self._compressor is None:
+            dict_id = self._current_dict_id()
+            dict_data = None if dict_id is None else self._dict(dict_id)
+            self._compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dict_data)
+        res = self._compressor.compress(data)
+        assert is_compressed(res)  # just in case
+        return res
+
+    def decompress(self, data: bytes) -> bytes:
+        if not is_compressed(data):
+            return data
+
+        import zstandard
+
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        decompressor = self._decompressors.get(dict_id)
+        if decompressor is None:
+            dict_data = None if dict_id == 0 else self._dict(dict_id)
+            decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+            self._decompressors[dict_id] = decompressor
+        return decompressor.decompress(data)
+
+    def reset(self) -> None:
+        """
+        Call after current dictionary changed
+        """
+        self._compressor = None
+
+
+def train_dict(samples: Sequence[bytes], *, dict_size: int) -> tuple[int, bytes]:
+    import zstandard
+
+    d = zstandard.train_dictionary(dict_size, list(samples))
+    return d.dict_id(), d.as_bytes()
+
+
+def test_codec() -> None:
+    import pytest
+
+    zstandard = pytest.importorskip('zstandard')
+
+    samples = [
+        f'{{"id": {i}, "title": "item number {i}", "author": "user{i % 7}", "url": "https://example.com/{i}"}}'.encode()
+        for i in range(1000)
+    ]
+    dict_id, dict_data = train_dict(samples, dict_size=4096)
+    dicts = {dict_id: dict_data}
+
+    plain = Codec(load_dict=dicts.__getitem__, current_dict_id=lambda: None)
+    with_dict = Codec(load_dict=dicts.__getitem__, current_dict_id=lambda: dict_id)
+
+    data = samples[123]
+    c1 = plain.compress(data)
+    c2 = with_dict.compress(data)
+    assert zstandard.get_frame_parameters(c2).dict_id == dict_id
+    # short items barely compress on their own, that's what the dictionary is for
+    assert len(c2) < len(c1)
+
+    # decompression should work regardless of the current dictionary
+    for codec in [plain, with_dict]:
+        assert codec.decompress(c1) == data
+        assert codec.decompress(c2) == data
+        # uncompressed data is returned as is
+        assert codec.decompress(data) == data
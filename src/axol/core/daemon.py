@@ -0,0 +1,291 @@
+# Long running crawler, crawls each feed on its own schedule (instead of crawling everything from cron).
+#
+# Unlike running 'axol crawl' periodically, everything is only imported once,
+# and sessions/API clients (see core.clients) and databases (see storage.keep_open) are kept open between crawls.
+#
+# Feeds of the same provider are crawled at most max_concurrent at a time, on top of that requests are
+# rate limited by core.ratelimit as usual. A failing feed doesn't affect others, it's just retried sooner.
+#
+# State of each feed (last crawl, next crawl, errors) is written to a json status file,
+# which also lets the daemon keep its schedule between restarts. See 'axol daemon --status'.
+
+import dataclasses
+import os
+import re
+import threading
+import time
+from collections import Counter
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import orjson
+
+from . import metrics
+from .adaptive import AdaptiveSettings
+from .logger import logger
+from .utils import write_atomic
+
+if TYPE_CHECKING:
+    from .feed import Feed
+
+# how long to sleep at most between checking schedules, just in case
+MAX_SLEEP_S = 60.0
+
+
+@dataclass(frozen=True)
+class DaemonSettings:
+    # how often feeds are crawled
+    every: timedelta = timedelta(hours=6)
+    # feed name regex -> how often to crawl matching feeds, first match wins
+    schedules: Mapping[str, timedelta] = field(default_factory=dict)
+    # failed feeds are retried sooner than usual
+    retry_after: timedelta = timedelta(minutes=30)
+    # how many feeds of the same provider can be crawled at once
+    max_concurrent: int = 1
+    # provider (feed PREFIX) -> max_concurrent for this provider
+    provider_concurrency: Mapping[str, int] = field(default_factory=dict)
+
+    def interval(self, feed_name: str) -> timedelta:
+        for pattern, every in self.schedules.items():
+            if re.match(pattern, feed_name):
+                return every
+        return self.every
+
+    def concurrency(self, provider: str) -> int:
+        return self.provider_concurrency.get(provider, self.max_concurrent)
+
+
+def settings() -> DaemonSettings:
+    """
+    Configured via optional DAEMON in the user config
+    """
+    try:
+        import axol.user_config as C
+    except Exception:
+        return DaemonSettings()
+    return getattr(C, 'DAEMON', DaemonSettings())
+
+
+@dataclass
+class FeedStatus:
+    name: str
+    provider: str
+    every: float  # seconds
+    next_crawl: float  # unix timestamp
+    running: bool = False
+    crawls: int = 0
+    failures: int = 0  # in a row
+    last_crawl: float | None = None  # unix timestamp
+    last_duration: float | None = None  # seconds
+    last_new: int | None = None
+    last_error: str | None = None
+
+
+def load_status(path: Path) -> dict[str, Any] | None:
+    if not path.exists():
+        return None
+    return orjson.loads(path.read_bytes())
+
+
+class Daemon:
+    def __init__(
+        self,
+        feeds: Sequence['Feed'],
+        *,
+        settings: DaemonSettings,
+        status_path: Path,
+        metrics_prom: Path | None = None,
+        crawl_kwargs: Mapping[str, Any] | None = None,
+    ) -> None:
+        """
+        crawl_kwargs: passed to Feed.crawl, e.g. concurrent/incremental
+        metrics_prom: if set, crawl metrics are written there as a Prometheus textfile after every crawl
+        """
+        names = [f.name for f in feeds]
+        assert len(names) == len(set(names)), names
+        self.feeds = {f.name: f for f in feeds}
+        self.settings = settings
+        self.status_path = status_path
+        self.metrics_prom = metrics_prom
+        self.crawl_kwargs = dict(crawl_kwargs or {})
+        # if set, feeds are crawled when their first query is due instead of on fixed schedule
+        self.adaptive: AdaptiveSettings | None = self.crawl_kwargs.get('adaptive')
+        self.started = time.time()
+
+        # keep the schedule from the previous run, otherwise every restart would recrawl everything
+        previous: dict[str, dict[str, Any]] = {}
+        prev_status = load_status(status_path)
+        if prev_status is not None:
+            previous = {s['name']: s for s in prev_status['feeds']}
+
+        self.status: dict[str, FeedStatus] = {}
+        for f in feeds:
+            every = settings.interval(f.name).total_seconds()
+            st = FeedStatus(name=f.name, provider=f.PREFIX, every=every, next_crawl=self.started)
+            prev = previous.get(f.name)
+            if prev is not None:
+                for k in ['crawls', 'failures', 'last_crawl', 'last_duration', 'last_new', 'last_error']:
+                    setattr(st, k, prev[k])
+                if st.last_crawl is not None and st.failures == 0 and self.adaptive is None:
+                    # NOTE: recomputed rather than taken from the file, in case the interval was changed in config
+                    st.next_crawl = st.last_crawl + every
+                else:
+                    st.next_crawl = prev['next_crawl']
+            self.status[f.name] = st
+
+        self._cond = threading.Condition()
+        self._running: Counter[str] = Counter()
+        self._stopping = False
+
+    def _due(self, now: float) -> list[FeedStatus]:
+        due = sorted(
+            (st for st in self.status.values() if not st.running and st.next_crawl <= now),
+            key=lambda st: st.next_crawl,
+        )
+        res = []
+        running = Counter(self._running)
+        for st in due:
+            if running[st.provider] >= self.settings.concurrency(st.provider):
+                continue
+            running[st.provider] += 1
+            res.append(st)
+        return res
+
+    def _crawl(self, feed: 'Feed') -> None:
+        st = self.status[feed.name]
+        start = time.time()
+        new = 0
+        error: Exception | None = None
+        try:
+            for res in feed.crawl(**self.crawl_kwargs):
+                if isinstance(res, Exception):
+                    # search error, already logged by the feed
+                    error = res
+                    continue
+                _crawl_dt, _uid, o = res
+                new += 1
+                if isinstance(o, Exception):
+                    # item is still saved, so doesn't count as a failed crawl
+                    feed.logger.error('', exc_info=o)
+        except Exception as e:
+            feed.logger.error('crawl failed', exc_info=e)
+            error = e
+
+        next_crawl = start + st.every
+        if error is None and self.adaptive is not None:
+            try:
+                due = feed.next_crawl(self.adaptive).timestamp()
+            except Exception as e:
+                feed.logger.error('failed to compute next crawl', exc_info=e)
+            else:
+                next_crawl = max(due, start + self.adaptive.min_interval.total_seconds())
+
+        finished = time.time()
+        with self._cond:
+            st.running = False
+            st.crawls += 1
+            st.last_crawl = start
+            st.last_duration = finished - start
+            st.last_new = new
+            if error is None:
+                st.failures = 0
+                st.last_error = None
+                st.next_crawl = next_crawl
+            else:
+                st.failures += 1
+                st.last_error = repr(error)
+                st.next_crawl = finished + min(st.every, self.settings.retry_after.total_seconds())
+            self._running[st.provider] -= 1
+            self._cond.notify_all()
+        feed.logger.info(
+            f'crawled {new} new items in {finished - start:.1f}s, next crawl in {_fmt_delta(st.next_crawl - finished)}'
+        )
+
+    def _write_status(self) -> None:
+        with self._cond:
+            status = {
+                'pid': os.getpid(),
+                'started': self.started,
+                'updated': time.time(),
+                'feeds': [dataclasses.asdict(st) for st in self.status.values()],
+            }
+        write_atomic(self.status_path, orjson.dumps(status, option=orjson.OPT_INDENT_2))
+        if self.metrics_prom is not None:
+            metrics.write_prometheus(self.metrics_prom)
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def run(self) -> None:
+        """
+        Crawls feeds until stop() is called (or KeyboardInterrupt), then waits for running crawls to finish
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        providers = {st.provider for st in self.status.values()}
+        workers = sum(self.settings.concurrency(p) for p in providers)
+        logger.info(f'crawling {len(self.feeds)} feeds, status file: {self.status_path}')
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='axol-daemon') as pool:
+            try:
+                while True:
+                    with self._cond:
+                        if self._stopping:
+                            break
+                        now = time.time()
+                        for st in self._due(now):
+                            st.running = True
+                            self._running[st.provider] += 1
+                            pool.submit(self._crawl, self.feeds[st.name])
+                    self._write_status()
+                    with self._cond:
+                        if self._stopping:
+                            break
+                        # NOTE: running feeds notify when they are done, so no need to wake up for them
+                        # (or for feeds that are waiting for other feeds of the same provider)
+                        busy = {p for p in providers if self._running[p] >= self.settings.concurrency(p)}
+                        waiting = [
+                            st.next_crawl for st in self.status.values() if not st.running and st.provider not in busy
+                        ]
+                        sleep = min([*(t - time.time() for t in waiting), MAX_SLEEP_S])
+                        if sleep > 0:
+                            self._cond.wait(timeout=sleep)
+            except KeyboardInterrupt:
+                pass
+            running = [st.name for st in self.status.values() if st.running]
+            if len(running) > 0:
+                logger.info(f'stopping, waiting for running crawls to finish: {", ".join(running)}')
+        self._write_status()
+
+
+def _fmt_delta(seconds: float) -> str:
+    seconds = max(seconds, 0)
+    if seconds < 60:
+        return f'{seconds:.0f}s'
+    if seconds < 60 * 60:
+        return f'{seconds / 60:.0f}m'
+    if seconds < 48 * 60 * 60:
+        return f'{seconds / 60 / 60:.1f}h'
+    return f'{seconds / 60 / 60 / 24:.1f}d'
+
+
+def format_status(status: Mapping[str, Any]) -> str:
+    """
+    Human readable table for the status file
+    """
+    now = time.time()
+    lines = [
+        f'pid {status["pid"]}, started {_fmt_delta(now - status["started"])} ago, updated {_fmt_delta(now - status["updated"])} ago'
+    ]
+    for st in sorted(status['feeds'], key=lambda st: st['next_crawl']):
+        last = 'never' if st['last_crawl'] is None else f'{_fmt_delta(now - st["last_crawl"])} ago'
+        state = 'running' if st['running'] else f'next in {_fmt_delta(st["next_crawl"] - now)}'
+        line = f'{st["name"]:<40} every {_fmt_delta(st["every"]):>6}  last {last:>10}  new {"-" if st["last_new"] is None else st["last_new"]:>5}  {state}'
+        if st['last_error'] is not None:
+            line += f'  ERROR ({st["failures"]} in a row): {st["last_error"]}'
+        lines.append(line)
+    return '\n'.join(lines)
@@ -1,21 +1,41 @@
+import dataclasses
+import pickle
 import re
+import time
 from abc import abstractmethod
-from collections.abc import Callable, Iterable, Iterator, Sequence
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator, Mapping, Sequence
+from contextlib import AbstractContextManager, nullcontext
 from dataclasses import dataclass
 from datetime import UTC, datetime
-from functools import cached_property
+from functools import cached_property, partial
 from pathlib import Path
-from typing import Any, ClassVar, Protocol, Self
+from typing import TYPE_CHECKING, Any, ClassVar, Protocol, Self
 
-import loguru
+from more_itertools import chunked
 
 from ..renderers.markdown import (
     MarkdownAdapterT,  # todo meh, this import kinda doesn't belong here...
 )
-from .common import SearchResults, Uid
+from . import metrics
+from .adaptive import AdaptiveSettings
+from .aio import AsyncSearchF, Budget, Limiter, from_sync, iter_sync
+from .common import CrawlDt, SearchResults, Uid
+from .fields import Extractor, Fields, Order, Where
+from .fts import Match, Text
+from .incremental import IncrementalSettings, Plan, Watermark, query_key
 from .logger import logger as main_logger
+from .planner import SearchPlanner
 from .query import Compilable, compile_queries
-from .storage import CrawlDt, Database
+from .rules import Pushdown, Rule, Sql, pushdown
+from .utils import chunked_by_size
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+    import loguru
+
+    from .storage import Database, StorageProfile
 
 # the searcher decides on the query type itself?
 # TODO make these two typed? not sure how.. maybe use Compilable protocol?
@@ -35,158 +55,1107 @@ class Feed[ResultType, QueryType: Compilable]:
     # QueryCls: ClassVar[type[QueryType]]
     QueryCls: ClassVar[type]
     MarkdownAdapter: ClassVar[type[MarkdownAdapterT]]
+    # bump when parse() output changes (modules keep it next to the parsing code, as model.PARSER_VERSION)
+    # this invalidates parsed objects cached in the database
+    # None means parsed objects are never cached, see StorageProfile.parse_cache
+    PARSER_VERSION: ClassVar[int | None] = None
+    # bump when fields() output changes, this makes fields of stored items extracted again
+    FIELDS_VERSION: ClassVar[int] = 1
+    # how hard concurrent search can hit the provider, shared by all feeds of the same type
+    SEARCH_BUDGET: ClassVar[Budget] = Budget()
+    # whether search accepts 'incremental' argument, see core.incremental
+    INCREMENTAL: ClassVar[bool] = False
     name: str
     queries: Sequence[QueryType]
     db_path: Path
     exclude: Callable[[ResultType], bool] | None
     exclude_raw: Callable[[bytes], bool] | None
+    storage: 'StorageProfile | None' = None  # None means default sqlite settings
+    # declarative exclusion, evaluated by the database where possible, see core.rules
+    exclude_rules: Rule | None = None
+    # bump when exclusion changes in a way that isn't visible from its source (see core.fingerprint)
+    exclude_version: str | int | None = None
 
     @cached_property
     def logger(self) -> 'loguru.Logger':
         return main_logger.bind(feed=self.name)
 
+    def _database(self, *, writable: bool = False) -> 'AbstractContextManager[Database]':
+        # NOTE: imported lazily, sqlalchemy takes a while to import (and not every command needs the database)
+        from .storage import open_database
+
+        return open_database(self.db_path, writable=writable, logger=self.logger, profile=self.storage)
+
     @abstractmethod
     def parse(self, data: bytes) -> ResultType:
         raise NotImplementedError
 
+    def text(self, o: ResultType) -> Text | None:  # noqa: ARG002
+        """
+        Text to index for full-text search (see core.fts), None means the item isn't indexed.
+        """
+        return None
+
+    def fields(self, o: ResultType) -> Fields | None:  # noqa: ARG002
+        """
+        Fields stored in indexed columns next to the item, so the feed can be filtered/ordered in sql (see core.fields).
+        None means nothing is extracted.
+        """
+        return None
+
+    @property
+    def extracts_fields(self) -> bool:
+        return type(self).fields is not Feed.fields
+
+    def _fields_safe(self, o: ResultType | Exception) -> Fields | None:
+        if isinstance(o, Exception):
+            return None
+        try:
+            return self.fields(o)
+        except Exception as e:
+            self.logger.error('error while extracting fields', exc_info=e)
+            return None
+
+    def _extractor(self, preparsed: dict[Uid, ResultType | Exception]) -> Extractor | None:
+        """
+        Parsed objects are put in preparsed, so they don't have to be parsed again after insert
+        """
+        if not self.extracts_fields:
+            return None
+
+        def extract(uid: Uid, data: bytes) -> Fields | None:
+            o = preparsed.get(uid)
+            if o is None:
+                o = self._parse_counted(data)
+                preparsed[uid] = o
+            return self._fields_safe(o)
+
+        return Extractor(version=self.FIELDS_VERSION, extract=extract)
+
     @property
     @abstractmethod
     def search(self) -> SearchF:
         raise NotImplementedError
 
-    @property
-    def _excluder(self) -> Callable[[bytes], bool] | None:
+    def _exclude_defensive[T](self, exclude: Callable[[T], bool], data: T) -> bool:
+        try:
+            return exclude(data)
+        except Exception as e:
+            msg = 'error while evaluating exclude function for {data!r}'
+            # ugh.. kinda annoying, maybe loguru isn't really for me..
+            # https://github.com/Delgan/loguru/issues/1008
+            self.logger.error(msg, exc_info=e, data=data)
+
+            # stay on the safe side
+            return False
+
+    def _exclude_raw(self, data: bytes) -> bool:
         exclude_raw = self.exclude_raw
-        exclude = self.exclude
-        if exclude is not None:
-            assert exclude_raw is None  # otherwise unclear which to pick
+        return exclude_raw is not None and self._exclude_defensive(exclude_raw, data)
+
+    @cached_property
+    def exclude_fingerprint(self) -> str:
+        """
+        Changes whenever exclusion results might change
+        """
+        from .fingerprint import fingerprint
 
-            exclude_raw = lambda blob: exclude(self.parse(blob))
+        config: tuple = (self.exclude, self.exclude_raw, self.exclude_rules)
+        if self.exclude_version is not None:
+            config = (self.exclude_version,)
+        return fingerprint(self.PARSER_VERSION, self.FIELDS_VERSION, *config)
 
-        if exclude_raw is None:
-            return None
+    @cached_property
+    def _pushdown(self) -> Pushdown | None:
+        return None if self.exclude_rules is None else pushdown(self.exclude_rules)
 
-        def exclude_raw_defensive(data: bytes) -> bool:
-            try:
-                return exclude_raw(data)
-            except Exception as e:
-                msg = 'error while evaluating exclude function for {data!r}'
-                # ugh.. kinda annoying, maybe loguru isn't really for me..
-                # https://github.com/Delgan/loguru/issues/1008
-                self.logger.error(msg, exc_info=e, data=data)
+    def _python_rules(self, *, pushed_down: bool) -> Rule | None:
+        """
+        pushed_down: whether the database already excluded items matching the sql part of the rules
+        """
+        if not pushed_down:
+            return self.exclude_rules
+        pd = self._pushdown
+        return None if pd is None else pd.rest
+
+    def _exclude_parsed(self, o: ResultType | Exception, *, pushed_down: bool = False) -> bool:
+        # if we failed to parse, stay on the safe side
+        if isinstance(o, Exception):
+            return False
+        exclude = self.exclude
+        if exclude is not None and self._exclude_defensive(exclude, o):
+            return True
+        rule = self._python_rules(pushed_down=pushed_down)
+        if rule is None:
+            return False
+        fields = self._fields_safe(o) or Fields()
+        return self._exclude_defensive(lambda o: rule.matches(o, fields), o)
+
+    def _check_exclude(
+        self,
+        data: bytes,
+        *,
+        pushed_down: bool = False,
+    ) -> tuple[bool, ResultType | Exception | None]:
+        """
+        Returns whether item should be excluded, and parsed object if it had to be parsed to decide that
+        (so the caller doesn't have to parse it again)
+        """
+        assert not (self.exclude is not None and self.exclude_raw is not None)  # otherwise unclear which to pick
+        if self._exclude_raw(data):
+            return True, None
+        if self.exclude is None and self._python_rules(pushed_down=pushed_down) is None:
+            return False, None
+        o = self._parse_counted(data)
+        return self._exclude_parsed(o, pushed_down=pushed_down), o
 
-                # stay on the safe side
-                return False
+    @property
+    def _excluder(self) -> Callable[[bytes], bool] | None:
+        if self.exclude is None and self.exclude_raw is None and self.exclude_rules is None:
+            return None
+        return lambda data: self._check_exclude(data)[0]
 
-        return exclude_raw_defensive
+    @property
+    def search_async(self) -> AsyncSearchF:
+        """
+        Override to provide native async search, by default regular search is run in threads
+        """
+        return from_sync(self._searcher(None))
 
     def search_all(self, *, limit: int | None) -> Iterator[tuple[Uid, bytes]]:
-        excluder = self._excluder
-        search_queries = compile_queries(self.queries)
+        for uid, data, _ in self._search_all(limit=limit):
+            yield uid, data
+
+    def _search_all(
+        self,
+        *,
+        limit: int | None,
+        plan: Plan | None = None,
+        planner: SearchPlanner | None = None,
+    ) -> Iterator[tuple[Uid, bytes, ResultType | Exception | None]]:
+        """
+        Same as search_all, but also returns parsed object if it was parsed during exclusion
+        """
+        search = self._searcher(planner)
+        search_queries = self._due_queries(plan=plan, planner=planner, limit=limit)
         handled = set()
         for search_query in search_queries:
-            for uid, data in self.search(query=search_query, limit=limit):
+            kwargs = self._search_kwargs(search_query, plan=plan)
+            for uid, data in search(query=search_query, limit=limit, **kwargs):
                 # TODO check that items coming from the same search query are already made unique?
                 # dunno if this is really necessary though
                 # but could be a sign of wrong pagination or smth like that
                 if uid in handled:
                     continue
                 handled.add(uid)
+                if plan is not None:
+                    plan.found(search_query, uid)
 
-                if excluder is not None and excluder(data):
+                excluded, o = self._check_exclude(data)
+                if excluded:
                     continue
 
                 # todo could yield query here? not sure if super useful
-                yield uid, data
+                yield uid, data, o
+            self._search_complete(search_query, plan=plan, limit=limit, kwargs=kwargs)
+
+    def _searcher(self, planner: SearchPlanner | None) -> SearchF:
+        search = self.search if planner is None else partial(planner.search, self)
+
+        def instrumented(query: SearchQuery, *, limit: int | None, **kwargs: Any) -> SearchResults:
+            return self._instrumented(query, lambda: search(query=query, limit=limit, **kwargs))
+
+        return instrumented
+
+    def _instrumented(self, search_query: SearchQuery, search: Callable[[], SearchResults]) -> SearchResults:
+        """
+        Records search metrics. Everything recorded while the search function runs (e.g. http requests)
+        is labelled with the feed and the query.
+        """
+        lbls = {'feed': self.name, 'query': query_key(search_query)}
+        count = 0
+        spent = 0.0
+        try:
+            start = time.perf_counter()
+            with metrics.labels(**lbls):
+                it = iter(search())
+            spent += time.perf_counter() - start
+            while True:
+                start = time.perf_counter()
+                with metrics.labels(**lbls):
+                    res = next(it, None)
+                spent += time.perf_counter() - start
+                if res is None:
+                    return
+                count += 1
+                yield res
+        finally:
+            metrics.inc('axol_searches_total', 1, **lbls)
+            metrics.inc('axol_search_seconds_total', spent, **lbls)
+            metrics.inc('axol_search_results_total', count, **lbls)
+
+    def _due_queries(
+        self,
+        *,
+        plan: Plan | None,
+        planner: SearchPlanner | None,
+        limit: int | None,
+    ) -> list[SearchQuery]:
+        search_queries = list(compile_queries(self.queries))
+        if plan is None:
+            return search_queries
+        due = []
+        for search_query in search_queries:
+            if plan.due(search_query):
+                due.append(search_query)
+            elif planner is not None:
+                planner.skip(self, query=search_query, limit=limit)
+        skipped = len(search_queries) - len(due)
+        if skipped > 0:
+            self.logger.info(f'skipping {skipped} queries which are not due yet (not many new items expected)')
+        return due
+
+    def _search_kwargs(self, search_query: SearchQuery, *, plan: Plan | None) -> dict[str, Any]:
+        if plan is None:
+            return {}
+        incremental = plan.incremental(search_query)
+        if incremental is None:
+            return {}
+        return {'incremental': incremental}
+
+    def _search_complete(
+        self,
+        search_query: SearchQuery,
+        *,
+        plan: Plan | None,
+        limit: int | None,
+        kwargs: dict[str, Any],
+    ) -> None:
+        if plan is None or limit is not None:
+            # limited crawl doesn't count as complete
+            return
+        plan.complete(search_query, full='incremental' not in kwargs)
+
+    def _plan(self, incremental: IncrementalSettings | None, adaptive: AdaptiveSettings | None) -> Plan | None:
+        if not self.INCREMENTAL:
+            if adaptive is None:
+                return None
+            # still need a plan to keep track of queries' watermarks
+            incremental = None
+        now = datetime.now(tz=UTC)
+        if not self.db_path.exists():
+            # nothing was crawled before
+            return Plan(settings=incremental, watermarks={}, known=lambda _uid: False, now=now, adaptive=adaptive)
+        with self._database() as db:
+            watermarks = db.get_watermarks()
+        # NOTE: lookup uses separate connections, so fine to use after closing
+        known = db.uid_lookup()
+        return Plan(settings=incremental, watermarks=watermarks, known=known, now=now, adaptive=adaptive)
+
+    def watermarks(self) -> dict[str, Watermark]:
+        """
+        Query key -> watermark (when it was crawled, how many new items it gets)
+        """
+        if not self.db_path.exists():
+            return {}
+        with self._database() as db:
+            return db.get_watermarks()
+
+    def next_crawl(self, adaptive: AdaptiveSettings) -> datetime:
+        """
+        When the first of the queries is due, according to their rates of new items.
+        """
+        now = datetime.now(tz=UTC)
+        watermarks = self.watermarks()
+        res: datetime | None = None
+        for search_query in compile_queries(self.queries):
+            wm = watermarks.get(query_key(search_query))
+            if wm is None:
+                return now
+            due = datetime.fromtimestamp(wm.last_crawl_utc, tz=UTC) + adaptive.interval(wm.new_per_day)
+            res = due if res is None else min(res, due)
+        assert res is not None  # at least one query
+        return res
+
+    async def search_all_async(
+        self,
+        *,
+        limit: int | None,
+        limiter: Limiter | None = None,
+    ) -> AsyncIterator[tuple[Uid, bytes]]:
+        """
+        Same as search_all, but runs compiled queries concurrently (within SEARCH_BUDGET).
+        Results from different queries are interleaved, so the order isn't deterministic.
+
+        limiter: pass to share the budget with other feeds of the same type
+        """
+        async for uid, data, _ in self._search_all_async(limit=limit, limiter=limiter):
+            yield uid, data
+
+    async def _search_all_async(
+        self,
+        *,
+        limit: int | None,
+        limiter: Limiter | None = None,
+        plan: Plan | None = None,
+        planner: SearchPlanner | None = None,
+    ) -> AsyncIterator[tuple[Uid, bytes, ResultType | Exception | None]]:
+        import asyncio
+
+        if limiter is None:
+            limiter = Limiter()
+        search = self.search_async if planner is None else from_sync(self._searcher(planner))
+        results: asyncio.Queue[tuple[Uid, bytes] | Exception | None] = asyncio.Queue(maxsize=1000)
+
+        async def run_query(search_query: SearchQuery) -> None:
+            kwargs = self._search_kwargs(search_query, plan=plan)
+            try:
+                async with limiter.slot(self.PREFIX, self.SEARCH_BUDGET):
+                    async for res in search(query=search_query, limit=limit, **kwargs):
+                        if plan is not None:
+                            # NOTE: results are consumed in the same order, so same query wins as during dedup
+                            plan.found(search_query, res[0])
+                        await results.put(res)
+            except Exception as e:
+                await results.put(e)
+            else:
+                self._search_complete(search_query, plan=plan, limit=limit, kwargs=kwargs)
+                await results.put(None)
+
+        tasks = [asyncio.create_task(run_query(q)) for q in self._due_queries(plan=plan, planner=planner, limit=limit)]
+        try:
+            remaining = len(tasks)
+            # NOTE: dedup doesn't depend on the order, whichever query got the item first wins
+            handled = set()
+            while remaining > 0:
+                res = await results.get()
+                if res is None:
+                    remaining -= 1
+                    continue
+                if isinstance(res, Exception):
+                    # same as sync search, bail on first error
+                    raise res
+                uid, data = res
+                if uid in handled:
+                    continue
+                handled.add(uid)
+
+                excluded, o = self._check_exclude(data)
+                if excluded:
+                    continue
+
+                yield uid, data, o
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _search_results(
+        self,
+        *,
+        limit: int | None,
+        concurrent: bool,
+        plan: Plan | None = None,
+        planner: SearchPlanner | None = None,
+    ) -> Iterator[tuple[Uid, bytes, ResultType | Exception | None]]:
+        if not concurrent:
+            return self._search_all(limit=limit, plan=plan, planner=planner)
+        return iter_sync(lambda: self._search_all_async(limit=limit, plan=plan, planner=planner))
 
     def _insert(
         self,
         results: Iterable[tuple[Uid, bytes]],
         *,
         dry: bool,
+        extractor: Extractor | None = None,
     ) -> Iterator[tuple[CrawlDt, Uid, bytes]]:
         writable = not dry
-        with Database(self.db_path, writable=writable, logger=self.logger) as db:
-            yield from db.insert(results, dry=dry)
+        with self._database(writable=writable) as db:
+            yield from db.insert(results, dry=dry, extractor=extractor)
 
-    def _select_all(self) -> Iterator[tuple[CrawlDt, Uid, bytes]]:
-        excluder = self._excluder
+    def update_index(self, *, create: bool = False, page_size: int = 1000) -> int:
+        """
+        Adds items crawled since the last update to the full-text index, returns how many were indexed.
+
+        create: create the index if it doesn't exist yet (and index all items), otherwise only update existing index
+        """
+        if type(self).text is Feed.text:
+            if create:
+                self.logger.warning("feed doesn't support full-text search (text isn't implemented)")
+            return 0
+        if not self.db_path.exists():
+            return 0
         total = 0
-        excluded = 0
-        # TODO when querying, also use stored procedure like in prune_db?
-        # compare performance??
-        # another nice thing is that we can log how many we excluded before yielding
-        with Database(self.db_path, logger=self.logger) as db:
-            for crawl_timestamp_utc, uid, blob in db.select_all():
-                total += 1
-                if excluder is not None and excluder(blob):
-                    excluded += 1
-                    continue
+        with self._database(writable=True) as db:
+            if not create and not db.has_fts():
+                return 0
+            cursor = db.fts_cursor()
+            while True:
+                # NOTE: each page is committed separately, so it's fine to interrupt
+                page = db.select_since(*cursor, limit=page_size)
+                if len(page) == 0:
+                    break
+                rows = [(datetime.fromtimestamp(ts, tz=UTC), uid, data) for ts, uid, data in page]
+                items: list[tuple[Uid, str, str]] = []
+                for _crawl_dt, uid, o in self._parsed(rows):
+                    if isinstance(o, Exception):
+                        continue
+                    text = self.text(o)
+                    if text is None:
+                        continue
+                    items.append((uid, text.title, text.body))
+                ts, uid, _ = page[-1]
+                cursor = (ts, uid)
+                total += db.put_fts(items, cursor=cursor)
+        if total > 0:
+            self.logger.info(f'indexed {total} items for full-text search')
+        return total
+
+    def update_fields(self, *, page_size: int = 1000) -> int:
+        """
+        Extracts fields for items that don't have them yet (e.g. crawled by an older version), returns how many were updated.
+        """
+        if not self.extracts_fields or not self.db_path.exists():
+            return 0
+        total = 0
+        with self._database(writable=True) as db:
+            while True:
+                # NOTE: each page is committed separately, so it's fine to interrupt
+                page = db.select_fields_pending(version=self.FIELDS_VERSION, limit=page_size)
+                if len(page) == 0:
+                    break
+                rows = [(datetime.fromtimestamp(ts, tz=UTC), uid, data) for ts, uid, data in page]
+                items = [(uid, self._fields_safe(o)) for _crawl_dt, uid, o in self._parsed(rows)]
+                total += db.put_fields(items, version=self.FIELDS_VERSION)
+        if total > 0:
+            self.logger.info(f'extracted fields for {total} items')
+        return total
+
+    def grep(self, query: str, *, limit: int) -> list[Match]:
+        """
+        Best full-text matches (FTS5 query syntax), requires the index (see update_index).
+        """
+        if not self.db_path.exists():
+            return []
+        res: list[Match] = []
+        offset = 0
+        with self._database() as db:
+            # NOTE: some matches might be filtered out below, so keep fetching until there are enough
+            while len(res) < limit:
+                found = db.fts_search(query, limit=limit, offset=offset)
+                offset += len(found)
+                rows = {uid: (ts, data) for ts, uid, data in db.select_uids([uid for uid, _, _, _ in found])}
+                for uid, rank, title, snippet in found:
+                    row = rows.get(uid)
+                    if row is None:
+                        # e.g. pruned by an older version that didn't update the index
+                        continue
+                    ts, data = row
+                    # NOTE: exclude might have changed since the item was indexed
+                    excluded, _ = self._check_exclude(data)
+                    if excluded:
+                        continue
+                    crawl_dt = datetime.fromtimestamp(ts, tz=UTC)
+                    res.append(
+                        Match(feed=self.name, uid=uid, crawl_dt=crawl_dt, rank=rank, title=title, snippet=snippet)
+                    )
+                if len(found) < limit:
+                    break
+        return res[:limit]
+
+    def _select_all(
+        self,
+        *,
+        since: CrawlDt | None = None,
+        where: Where | None = None,
+        order: Order = 'crawl',
+        exclude: Sql | None = None,
+    ) -> Iterator[tuple[CrawlDt, Uid, bytes]]:
+        # NOTE: exclusion happens in feed(), so objects are only parsed once
+        # (apart from exclude rules compiled to sql, those are evaluated by the database)
+        use_fields = where is not None or order != 'crawl' or exclude is not None
+        if use_fields:
+            if not self.extracts_fields:
+                raise RuntimeError(f"{self.name}: feed doesn't extract fields, can't filter/order by them")
+            if self._fields_pending():
+                # NOTE: not backfilling here, reading shouldn't need a write lock (e.g. while crawl is running)
+                # crawl backfills fields anyway, until then items are filtered/ordered in python
+                yield from self._select_all_python(since=since, where=where, order=order, exclude=exclude is not None)
+                return
+        with self._database() as db:
+            rows: Iterable[tuple[int, Uid, bytes]]
+            if use_fields:
+                since_ts = None if since is None else int(since.timestamp())
+                rows = db.select_where(where, order=order, since_ts=since_ts, exclude=exclude)
+            elif since is None:
+                rows = db.select_all()
+            else:
+                rows = self._select_since(db, since=since)
+            for crawl_timestamp_utc, uid, blob in rows:
                 # TODO crawl_dt deserialize could be inside the db bit?
                 # or the other way round.. move timestamp generation into
                 crawl_dt = datetime.fromtimestamp(crawl_timestamp_utc, tz=UTC)
                 yield (crawl_dt, uid, blob)
-        if excluded > 0:
-            self.logger.warning(
-                f"excluded {excluded}/{total} items based on config. Run 'prune' to purge them from the db."
-            )
 
-    def prune_db(self, *, dry: bool = False) -> Iterator[tuple[CrawlDt, Uid, ResultType | Exception]]:
+    def _fields_pending(self) -> bool:
+        """
+        Whether some items don't have fields extracted by the current version yet
+        """
+        if not self.db_path.exists():
+            return False
+        with self._database() as db:
+            if not db.has_fields():
+                return True
+            return len(db.select_fields_pending(version=self.FIELDS_VERSION, limit=1)) > 0
+
+    def _select_all_python(
+        self,
+        *,
+        since: CrawlDt | None,
+        where: Where | None,
+        order: Order,
+        exclude: bool,
+    ) -> Iterator[tuple[CrawlDt, Uid, bytes]]:
+        """
+        Same as _select_all with fields, but fields are extracted in python instead of read from the database.
+
+        exclude: whether to exclude items matching exclude rules (the database would only evaluate the sql part)
+        """
+        rules = self.exclude_rules if exclude else None
+        selected: list[tuple[int | None, CrawlDt, Uid, bytes]] = []
+        for crawl_dt, uid, data in self._select_all(since=since):
+            # meh, items are parsed again by the caller, but it's only until fields are backfilled
+            o = self._parse_counted(data)
+            fields = self._fields_safe(o) or Fields()
+            if where is not None and not where.matches(fields):
+                continue
+            if rules is not None and not isinstance(o, Exception):
+                if self._exclude_defensive(partial(rules.matches, fields=fields), o):
+                    continue
+            if order == 'crawl':
+                yield crawl_dt, uid, data
+            else:
+                created_utc, _, _, _ = fields.columns()
+                selected.append((created_utc, crawl_dt, uid, data))
+        # same order as Database.select_where: by creation time, items without it go last
+        selected.sort(key=lambda x: (x[0] is None, x[0] or 0, x[1], x[2]))
+        for _, crawl_dt, uid, data in selected:
+            yield crawl_dt, uid, data
+
+    @staticmethod
+    def _select_since(db: 'Database', *, since: CrawlDt, page_size: int = 1000) -> Iterator[tuple[int, Uid, bytes]]:
+        # empty uid is less than any valid uid, so this includes items crawled exactly at 'since'
+        cursor: tuple[int, str] = (int(since.timestamp()), '')
+        while True:
+            page = db.select_since(*cursor, limit=page_size)
+            yield from page
+            if len(page) < page_size:
+                break
+            ts, uid, _ = page[-1]
+            cursor = (ts, uid)
+
+    def prune_db(
+        self,
+        *,
+        dry: bool = False,
+        full: bool = False,
+        workers: int | None = None,
+        page_size: int = 1000,
+    ) -> Iterator[tuple[CrawlDt, Uid, ResultType | Exception]]:
         """
-        Returns number of pruned items
+        Deletes excluded items from the database, yields deleted items
+
+        Only items crawled since the previous prune are checked, unless exclusion changed since then
+        (see exclude_fingerprint) or full is set.
+        Items are checked and deleted in pages, each page in a separate transaction.
+
+        workers: if set, parse items in a process pool with this many processes
         """
-        # TODO would be nice to yield items to be pruned? at least for dry mode?
-        excluder = self._excluder
-        if excluder is None:
+        if self._excluder is None:
             self.logger.info('feed has no exclude function defined, nothing to do')
             # fast path
             return
 
-        writable = not dry
-        with Database(self.db_path, writable=writable, logger=self.logger) as db:
-            pruned = db.delete(dry=dry, predicate=excluder)
+        pd = self._pushdown
+        exclude_sql = None if pd is None else pd.sql
+        if exclude_sql is not None:
+            if not dry:
+                # otherwise items without extracted fields wouldn't match
+                self.update_fields()
+            elif self._fields_pending():
+                # backfilling would write to the database, so evaluate all rules in python instead
+                exclude_sql = None
+        pushed_down = exclude_sql is not None
+
+        fingerprint = self.exclude_fingerprint
+        cursor = (-1, '')
+        with self._database(writable=not dry) as db:
+            state = db.get_prune_state()
+        if state is not None and not full:
+            last_cursor, last_fingerprint = state
+            if last_fingerprint == fingerprint:
+                # NOTE: items crawled since then have later crawl timestamps
+                # meh. unless prune ran in the middle of a streaming crawl, then some items might be skipped until --full
+                cursor = last_cursor
+            else:
+                self.logger.info('exclusion changed since the last prune, checking all items')
 
-            def it() -> Iterator[tuple[CrawlDt, Uid, bytes]]:
-                for ts, uid, data in pruned:
-                    # meh.. some duplication with above
+        # only need to parse if there is something that can't be evaluated on raw data
+        needs_parse = self.exclude is not None or self._python_rules(pushed_down=pushed_down) is not None
+        pool = None
+        if workers is not None and needs_parse:
+            from concurrent.futures import ProcessPoolExecutor
+
+            pool = ProcessPoolExecutor(max_workers=workers)
+
+        checked = 0
+        with self._database(writable=not dry) as db, nullcontext() if pool is None else pool:
+            while True:
+                rows = db.select_page(*cursor, limit=page_size, exclude=exclude_sql)
+                if len(rows) == 0:
+                    break
+                checked += len(rows)
+                cursor = rows[-1][:2]
+                pruned = self._prune_page(rows, needs_parse=needs_parse, pushed_down=pushed_down, pool=pool)
+                if not dry:
+                    db.prune([uid for _, uid, _, _ in pruned], cursor=cursor, fingerprint=fingerprint)
+                for ts, uid, data, o in pruned:
                     crawl_dt = datetime.fromtimestamp(ts, tz=UTC)
-                    yield crawl_dt, uid, data
+                    yield crawl_dt, uid, self._parse_safe(data) if o is None else o
+            if not dry:
+                db.drop_excluded_verdicts()
+        self.logger.info(f'checked {checked} items for pruning')
+
+    def _prune_page(
+        self,
+        rows: Sequence[tuple[int, Uid, bytes, bool]],
+        *,
+        needs_parse: bool,
+        pushed_down: bool,
+        pool: 'Executor | None',
+    ) -> list[tuple[int, Uid, bytes, ResultType | Exception | None]]:
+        """
+        Returns excluded items, along with parsed object if it had to be parsed to decide that
+
+        pushed_down: whether rows were already checked against the sql part of the rules
+        """
+        excluded: dict[Uid, ResultType | Exception | None] = {}
+        to_parse: list[tuple[Uid, bytes]] = []
+        for _, uid, data, sql_excluded in rows:
+            if sql_excluded or self._exclude_raw(data):
+                excluded[uid] = None
+            elif needs_parse:
+                to_parse.append((uid, data))
 
-            yield from self._parsed(it())
+        datas = [data for _, data in to_parse]
+        if pool is None:
+            parsed: Iterable[ResultType | Exception] = map(self._parse_counted, datas)
+        else:
+            # NOTE: only parsing in workers, exclusion is evaluated here since exclude functions often can't be pickled
+            chunks = pool.map(partial(_parse_chunk, self._parser()), chunked(datas, PARSE_CHUNK_SIZE))
+            parsed = (o for chunk in chunks for o in chunk)
+        for (uid, _), o in zip(to_parse, parsed, strict=True):
+            if self._exclude_parsed(o, pushed_down=pushed_down):
+                excluded[uid] = o
+
+        return [(ts, uid, data, excluded[uid]) for ts, uid, data, _ in rows if uid in excluded]
 
     def crawl(
-        self, *, limit: int | None = None, dry: bool = False
+        self,
+        *,
+        limit: int | None = None,
+        dry: bool = False,
+        max_buffer_bytes: int | None = None,
+        concurrent: bool = False,
+        incremental: IncrementalSettings | None = None,
+        adaptive: AdaptiveSettings | None = None,
+        planner: SearchPlanner | None = None,
+    ) -> Iterator[tuple[CrawlDt, Uid, ResultType | Exception] | Exception]:
+        """
+        concurrent: run search queries concurrently, see search_all_async
+        incremental: if set, queries crawled in full recently only fetch new items (for feeds that support it)
+        adaptive: if set, queries that don't get many new items are skipped until they are due, see core.adaptive
+        planner: pass to share search results with other feeds crawled in the same run
+        max_buffer_bytes: if set, search results are written to the database in chunks as they arrive
+            instead of keeping all of them in memory first.
+            Each chunk is inserted in a separate transaction, so chunks inserted before a search error are kept.
+            NOTE: results of queries shared via planner are still fully buffered, see core.planner
+        """
+        start = time.perf_counter()
+        try:
+            if max_buffer_bytes is not None:
+                yield from self._crawl_streaming(
+                    limit=limit,
+                    dry=dry,
+                    max_buffer_bytes=max_buffer_bytes,
+                    concurrent=concurrent,
+                    incremental=incremental,
+                    adaptive=adaptive,
+                    planner=planner,
+                )
+            else:
+                yield from self._crawl_buffered(
+                    limit=limit,
+                    dry=dry,
+                    concurrent=concurrent,
+                    incremental=incremental,
+                    adaptive=adaptive,
+                    planner=planner,
+                )
+            if not dry:
+                try:
+                    self.update_fields()
+                except Exception as e:
+                    # not a big deal, will catch up next time
+                    self.logger.warning('failed to backfill fields', exc_info=e)
+                try:
+                    self.update_index()
+                except Exception as e:
+                    # not a big deal, will catch up next time
+                    self.logger.warning('failed to update full-text index', exc_info=e)
+        finally:
+            metrics.inc('axol_crawl_seconds_total', time.perf_counter() - start, feed=self.name)
+
+    def _crawl_buffered(
+        self,
+        *,
+        limit: int | None,
+        dry: bool,
+        concurrent: bool,
+        incremental: IncrementalSettings | None,
+        adaptive: AdaptiveSettings | None,
+        planner: SearchPlanner | None,
     ) -> Iterator[tuple[CrawlDt, Uid, ResultType | Exception] | Exception]:
+        plan = self._plan(incremental, adaptive)
         # convert to list to make sure the connection in _insert isn't open for long
         # sort by crawl_dt and uid cause why not?
         try:
-            results = sorted(self.search_all(limit=limit))
+            results = sorted(
+                self._search_results(limit=limit, concurrent=concurrent, plan=plan, planner=planner),
+                key=lambda r: (r[0], r[1]),
+            )
         except Exception as e:
             self.logger.error('exception while searching; bailing', exc_info=e)
             yield e
             return
 
+        preparsed = {uid: o for uid, _, o in results if o is not None}
+        extractor = self._extractor(preparsed)
+
         # convert to list to make sure we actually inserted things before attempting to parse
-        inserted = list(self._insert(results, dry=dry))
+        with metrics.labels(feed=self.name):
+            inserted = list(self._insert([(uid, data) for uid, data, _ in results], dry=dry, extractor=extractor))
+        if plan is not None and not dry:
+            with self._database(writable=True) as db:
+                self._save_watermarks(plan, db=db, new_uids=[uid for _, uid, _ in inserted])
 
-        yield from self._parsed(inserted)
+        yield from self._parsed(inserted, cache=not dry, preparsed=preparsed)
 
-    def feed(self) -> Iterator[tuple[CrawlDt, Uid, ResultType | Exception]]:
-        yield from self._parsed(self._select_all())
+    def _save_watermarks(self, plan: Plan, *, db: 'Database', new_uids: Iterable[Uid]) -> None:
+        full = sum(plan.completed.values())
+        self.logger.info(f'crawled {full} queries in full, {len(plan.completed) - full} incrementally')
+        db.set_watermarks(plan.completed, crawl_dt=plan.now, rates=plan.rates(new_uids))
 
-    def _parsed(
-        self, results: Iterable[tuple[CrawlDt, Uid, bytes]]
-    ) -> Iterator[tuple[CrawlDt, Uid, ResultType | Exception]]:
-        for crawl_dt, uid, data in results:
-            o: ResultType | Exception
+    def _crawl_streaming(
+        self,
+        *,
+        limit: int | None,
+        dry: bool,
+        max_buffer_bytes: int,
+        concurrent: bool,
+        incremental: IncrementalSettings | None,
+        adaptive: AdaptiveSettings | None,
+        planner: SearchPlanner | None,
+    ) -> Iterator[tuple[CrawlDt, Uid, ResultType | Exception] | Exception]:
+        errors: list[Exception] = []
+        plan = self._plan(incremental, adaptive)
+
+        def results() -> Iterator[tuple[Uid, bytes, ResultType | Exception | None]]:
             try:
-                o = self.parse(data)
+                yield from self._search_results(limit=limit, concurrent=concurrent, plan=plan, planner=planner)
             except Exception as e:
-                # todo maybe log or something?
-                e.add_note(f'^ while parsing {data!r}')
-                o = e
+                # stop searching, but still insert whatever we got so far
+                self.logger.error('exception while searching; bailing', exc_info=e)
+                errors.append(e)
+
+        chunks = chunked_by_size(results(), max_bytes=max_buffer_bytes, size=lambda r: len(r[0]) + len(r[1]))
+
+        # same timestamp for all chunks, as if it was inserted in one go
+        crawl_dt = datetime.now(tz=UTC)
+        new_uids: list[Uid] = []
+        writable = not dry
+        with self._database(writable=writable) as db:
+            for chunk in chunks:
+                preparsed = {uid: o for uid, _, o in chunk if o is not None}
+                extractor = self._extractor(preparsed)
+                items = sorted((uid, data) for uid, data, _ in chunk)
+                if plan is not None:
+                    plan.inserting(uid for uid, _ in items)
+                # convert to list to make sure we actually inserted things before attempting to parse
+                with metrics.labels(feed=self.name):
+                    inserted = list(db.insert(items, dry=dry, crawl_dt=crawl_dt, extractor=extractor))
+                new_uids.extend(uid for _, uid, _ in inserted)
+                yield from self._parsed(inserted, cache=not dry, preparsed=preparsed)
+            if plan is not None and not dry:
+                # NOTE: queries that completed before the search error still count
+                self._save_watermarks(plan, db=db, new_uids=new_uids)
+        self.logger.info(f'inserted {len(new_uids)} new items')
+
+        yield from errors
+
+    def feed(
+        self,
+        *,
+        since: CrawlDt | None = None,
+        workers: int | None = None,
+        where: Where | None = None,
+        order: Order = 'crawl',
+    ) -> Iterator[tuple[CrawlDt, Uid, ResultType | Exception]]:
+        """
+        since: only return items crawled at or after this time
+        workers: if set, parse items in a process pool with this many processes (order is preserved)
+        where/order: filter/order by extracted fields in the database (only for feeds that implement fields)
+        """
+        total = 0
+        excluded = 0
+        pd = self._pushdown
+        exclude_sql = None if pd is None else pd.sql
+        use_cache = self._use_exclude_cache()
+        fingerprint = self.exclude_fingerprint if use_cache else None
+        # items which need exclusion evaluated after parsing -> their content hash (if using the cache)
+        pending: dict[Uid, bytes | None] = {}
+        # exclusion results to cache
+        misses: list[tuple[bytes, bool]] = []
+        stale = False
+
+        def rows() -> Iterator[tuple[CrawlDt, Uid, bytes]]:
+            nonlocal total, excluded, stale
+            from .fingerprint import content_hash
+
+            selected = self._select_all(since=since, where=where, order=order, exclude=exclude_sql)
+            with self._database() if use_cache else nullcontext() as db:
+                for chunk in chunked(selected, 1000):
+                    hashes: list[bytes | None] = [None] * len(chunk)
+                    cached: dict[bytes, bool] = {}
+                    if db is not None:
+                        assert fingerprint is not None
+                        chunk_hashes = [content_hash(data) for _, _, data in chunk]
+                        cached, chunk_stale = db.get_verdicts(chunk_hashes, fingerprint=fingerprint)
+                        hashes = list(chunk_hashes)
+                        stale |= chunk_stale
+                    for row, h in zip(chunk, hashes, strict=True):
+                        total += 1
+                        verdict = None if h is None else cached.get(h)
+                        if verdict is True:
+                            excluded += 1
+                            continue
+                        if verdict is False:
+                            yield row
+                            continue
+                        # raw exclusion is cheap, so do it before parsing
+                        if self._exclude_raw(row[2]):
+                            excluded += 1
+                            if h is not None:
+                                misses.append((h, True))
+                            continue
+                        pending[row[1]] = h
+                        yield row
+
+        for crawl_dt, uid, o in self._parsed(rows(), workers=workers):
+            if uid not in pending:
+                # cached as not excluded
+                yield crawl_dt, uid, o
+                continue
+            h = pending.pop(uid)
+            is_excluded = self._exclude_parsed(o, pushed_down=True)
+            if h is not None and not isinstance(o, Exception):
+                misses.append((h, is_excluded))
+            if is_excluded:
+                excluded += 1
+                continue
             yield crawl_dt, uid, o
 
+        if excluded > 0:
+            self.logger.warning(
+                f"excluded {excluded}/{total} items based on config. Run 'prune' to purge them from the db."
+            )
+
+        # NOTE: writing after we're done reading, otherwise in rollback journal mode we'd block ourselves
+        if fingerprint is None or (len(misses) == 0 and not stale):
+            return
+        try:
+            with self._database(writable=True) as db:
+                db.put_verdicts(misses, fingerprint=fingerprint, purge_stale=stale)
+        except Exception as e:
+            # e.g. if the database is locked by crawl -- not a big deal, will be cached next time
+            self.logger.warning('failed to update exclude cache', exc_info=e)
+        else:
+            self.logger.info(f'cached exclusion results for {len(misses)} items')
+
+    def _use_exclude_cache(self) -> bool:
+        # NOTE: only exclusion evaluated in python is cached, rules compiled to sql are cheap anyway
+        evaluated_in_python = (
+            self.exclude is not None or self.exclude_raw is not None or self._python_rules(pushed_down=True) is not None
+        )
+        return evaluated_in_python and self.storage is not None and self.storage.exclude_cache and self.db_path.exists()
+
+    def _parse_safe(self, data: bytes) -> ResultType | Exception:
+        try:
+            return self.parse(data)
+        except Exception as e:
+            # todo maybe log or something?
+            e.add_note(f'^ while parsing {data!r}')
+            return e
+
+    def _parse_counted(self, data: bytes) -> ResultType | Exception:
+        start = time.perf_counter()
+        o = self._parse_safe(data)
+        metrics.inc('axol_parse_seconds_total', time.perf_counter() - start, feed=self.name)
+        metrics.inc('axol_parsed_items_total', feed=self.name)
+        return o
+
+    def _parser(self) -> Self:
+        """
+        Copy of the feed that can be sent to worker processes
+        """
+        # exclude functions are often lambdas, which can't be pickled (and aren't needed for parsing anyway)
+        return dataclasses.replace(self, exclude=None, exclude_raw=None, exclude_rules=None)
+
+    def _parse_all[K](
+        self,
+        items: Iterable[tuple[K, bytes, ResultType | Exception | None]],
+        *,
+        workers: int | None,
+    ) -> Iterator[tuple[K, ResultType | Exception]]:
+        """
+        Parses items which aren't parsed yet (i.e. None), preserving the order.
+        K is any extra data that should be passed through along with the item.
+
+        workers: if set, parse in a process pool with this many processes
+        """
+        if workers is None:
+            parsed = 0
+            spent = 0.0
+            try:
+                for k, data, o in items:
+                    if o is None:
+                        start = time.perf_counter()
+                        o = self._parse_safe(data)
+                        spent += time.perf_counter() - start
+                        parsed += 1
+                    yield k, o
+            finally:
+                metrics.inc('axol_parse_seconds_total', spent, feed=self.name)
+                metrics.inc('axol_parsed_items_total', parsed, feed=self.name)
+            return
+
+        from concurrent.futures import Future, ProcessPoolExecutor
+
+        parser = self._parser()
+
+        # NOTE: not using pool.map since it consumes the whole input upfront, we only want to read ahead a bit
+        pending: deque[tuple[list[tuple[K, ResultType | Exception | None]], Future[list]]] = deque()
+
+        def ready() -> Iterator[tuple[K, ResultType | Exception]]:
+            chunk, future = pending.popleft()
+            parsed = iter(future.result())
+            for k, o in chunk:
+                yield k, next(parsed) if o is None else o
+
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            for chunk in chunked(items, PARSE_CHUNK_SIZE):
+                to_parse = [data for _, data, o in chunk if o is None]
+                pending.append(([(k, o) for k, _, o in chunk], pool.submit(_parse_chunk, parser, to_parse)))
+                if len(pending) >= 2 * workers:
+                    yield from ready()
+            while len(pending) > 0:
+                yield from ready()
+        finally:
+            # in case the consumer stopped early, no need to wait for the rest
+            pool.shutdown(cancel_futures=True)
+
+    def _parsed(
+        self,
+        results: Iterable[tuple[CrawlDt, Uid, bytes]],
+        *,
+        cache: bool = True,
+        preparsed: Mapping[Uid, ResultType | Exception] | None = None,
+        workers: int | None = None,
+    ) -> Iterator[tuple[CrawlDt, Uid, ResultType | Exception]]:
+        """
+        cache: whether results are stored in the database, so it's fine to cache parsed objects for them
+        preparsed: objects that were already parsed (e.g. during exclusion), to avoid parsing them again
+        workers: if set, parse in a process pool with this many processes
+        """
+        if preparsed is None:
+            preparsed = {}
+        parser_version = self.PARSER_VERSION
+        use_cache = (
+            cache
+            and parser_version is not None
+            and self.storage is not None
+            and self.storage.parse_cache
+            and self.db_path.exists()
+        )
+        if not use_cache:
+            items = (((crawl_dt, uid), data, preparsed.get(uid)) for crawl_dt, uid, data in results)
+            for (crawl_dt, uid), o in self._parse_all(items, workers=workers):
+                yield crawl_dt, uid, o
+            return
+        assert parser_version is not None  # ugh, mypy can't infer this
+        yield from self._parsed_cached(results, parser_version=parser_version, preparsed=preparsed, workers=workers)
+
+    def _parsed_cached(
+        self,
+        results: Iterable[tuple[CrawlDt, Uid, bytes]],
+        *,
+        parser_version: int,
+        preparsed: Mapping[Uid, ResultType | Exception],
+        workers: int | None,
+    ) -> Iterator[tuple[CrawlDt, Uid, ResultType | Exception]]:
+        # NOTE: pickle is fine here, the cache is only ever written by us
+        # and it's much faster than reconstructing objects from json
+        misses: list[tuple[Uid, bytes]] = []
+        stale = False
+        with self._database() as db:
+
+            def lookup() -> Iterator[tuple[tuple[CrawlDt, Uid, bool], bytes, ResultType | Exception | None]]:
+                nonlocal stale
+                for chunk in chunked(results, 1000):
+                    cached, chunk_stale = db.get_parsed([uid for _, uid, _ in chunk], parser_version=parser_version)
+                    stale |= chunk_stale
+                    for crawl_dt, uid, data in chunk:
+                        o: ResultType | Exception | None = None
+                        pickled = cached.get(uid)
+                        if pickled is not None:
+                            try:
+                                o = pickle.loads(pickled)
+                            except Exception as e:
+                                # e.g. model class was renamed, but PARSER_VERSION wasn't bumped
+                                self.logger.warning(f'failed to unpickle cached object for {uid}: {e}')
+                        hit = o is not None
+                        if o is None:
+                            o = preparsed.get(uid)
+                        yield (crawl_dt, uid, hit), data, o
+
+            for (crawl_dt, uid, hit), o in self._parse_all(lookup(), workers=workers):
+                if not hit and not isinstance(o, Exception):
+                    misses.append((uid, pickle.dumps(o, protocol=pickle.HIGHEST_PROTOCOL)))
+                yield crawl_dt, uid, o
+
+        # NOTE: writing after we're done reading, otherwise in rollback journal mode we'd block ourselves
+        if len(misses) == 0 and not stale:
+            return
+        try:
+            with self._database(writable=True) as db:
+                cached_count = db.put_parsed(misses, parser_version=parser_version, purge_stale=stale)
+        except Exception as e:
+            # e.g. if the database is locked by crawl -- not a big deal, will be cached next time
+            self.logger.warning('failed to update parse cache', exc_info=e)
+        else:
+            self.logger.info(f'cached {cached_count} parsed items')
+
     @classmethod
     def make(
         cls: type[Self],
@@ -196,6 +1165,9 @@ class Feed[ResultType, QueryType: Compilable]:
         queries: Sequence[QueryType | str],
         exclude: Callable[[ResultType], bool] | None = None,
         exclude_raw: Callable[[bytes], bool] | None = None,
+        exclude_rules: Rule | None = None,
+        exclude_version: str | int | None = None,
+        storage: 'StorageProfile | None' = None,
     ) -> Self:
         assert re.fullmatch(r'[\w\.]+', query_name)
 
@@ -222,7 +1194,42 @@ class Feed[ResultType, QueryType: Compilable]:
         assert len(_queries) > 0
 
         assert not (exclude is not None and exclude_raw is not None)
-        return cls(name=name, db_path=db_path, queries=_queries, exclude=exclude, exclude_raw=exclude_raw)
+        # NOTE: rules are evaluated on extracted fields
+        assert exclude_rules is None or cls.fields is not Feed.fields, (
+            f"{cls.PREFIX} feed doesn't support exclude_rules"
+        )
+        return cls(
+            name=name,
+            db_path=db_path,
+            queries=_queries,
+            exclude=exclude,
+            exclude_raw=exclude_raw,
+            exclude_rules=exclude_rules,
+            exclude_version=exclude_version,
+            storage=storage,
+        )
+
+
+# items per task when parsing in a process pool
+# big enough to amortize pickling overhead, small enough to keep all workers busy
+PARSE_CHUNK_SIZE = 100
+
+
+def _parse_chunk(feed: Feed, datas: list[bytes]) -> list:
+    res = []
+    for data in datas:
+        o = feed._parse_safe(data)
+        if isinstance(o, Exception):
+            try:
+                pickle.dumps(o)
+            except Exception:
+                # otherwise the whole chunk would fail when sending results back
+                e = RuntimeError(repr(o))
+                for note in getattr(o, '__notes__', []):
+                    e.add_note(note)
+                o = e
+        res.append(o)
+    return res
 
 
 def storage_dir() -> Path:
@@ -238,6 +1245,12 @@ def get_feeds(*, include: str | None = None, exclude: str | None = None) -> list
     import axol.user_config as C
 
     feeds = list(C.feeds())
+
+    # optional, e.g. set to WAL_PROFILE to allow reading feeds while crawling
+    profile: StorageProfile | None = getattr(C, 'STORAGE_PROFILE', None)
+    if profile is not None:
+        feeds = [f if f.storage is not None else dataclasses.replace(f, storage=profile) for f in feeds]
+
     if include is not None:
         feeds = [c for c in feeds if re.match(include, c.name)]
     if exclude is not None:
@@ -0,0 +1,127 @@
+# Fields extracted from items and stored in indexed columns next to them.
+#
+# Feeds are normally read in crawl order and filtered/sorted in python, which means parsing every item.
+# Instead feeds can extract a few fields (see Feed.fields) when items are inserted, so the database
+# can filter and order by them, e.g. 'axol markdown' reads items ordered by creation time.
+#
+# Items inserted before a feed implemented fields (or before FIELDS_VERSION was bumped)
+# are backfilled in batches by crawl, see Feed.update_fields. Until then reading extracts fields in python.
+
+from collections.abc import Callable, Collection, Mapping
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Literal
+
+import orjson
+
+from .common import Uid, datetime_aware
+
+# order of items returned by Feed.feed
+# created: by creation time (items without it go last), then by crawl time
+Order = Literal['crawl', 'created']
+
+
+@dataclass(frozen=True)
+class Fields:
+    created_at: datetime_aware | None = None
+    author: str | None = None
+    kind: str | None = None  # e.g. 'story'/'comment'
+    # anything else worth filtering by (e.g. tags, subreddit), stored as json
+    # can be queried with sqlite json functions, e.g. json_extract(extra, '$.subreddit')
+    extra: Mapping[str, Any] = field(default_factory=dict)
+
+    def columns(self) -> tuple[int | None, str | None, str | None, str | None]:
+        """
+        Values for (created_utc, author, kind, extra) columns
+        """
+        created_utc = None if self.created_at is None else int(self.created_at.timestamp())
+        extra = None if len(self.extra) == 0 else orjson.dumps(self.extra, option=orjson.OPT_SORT_KEYS).decode()
+        return created_utc, self.author, self.kind, extra
+
+
+@dataclass(frozen=True)
+class Extractor:
+    # stored along with the fields, items extracted by an older version are backfilled
+    version: int
+    # (uid, raw item data) -> fields, shouldn't throw
+    extract: Callable[[Uid, bytes], Fields | None]
+
+
+@dataclass(frozen=True)
+class Where:
+    """
+    Filter on extracted fields, None means no filtering on the field
+    """
+
+    kinds: Collection[str] | None = None
+    authors: Collection[str] | None = None
+    created_after: datetime_aware | None = None  # inclusive
+    created_before: datetime_aware | None = None  # exclusive
+
+    def sql(self) -> tuple[str, list[Any]]:
+        """
+        Returns sql condition over results table columns, and its parameters
+        """
+        conds: list[str] = []
+        params: list[Any] = []
+        for column, values in [('kind', self.kinds), ('author', self.authors)]:
+            if values is None:
+                continue
+            values = list(values)
+            conds.append(f'{column} IN ({",".join("?" * len(values))})')
+            params.extend(values)
+        if self.created_after is not None:
+            conds.append('created_utc >= ?')
+            params.append(_ts(self.created_after))
+        if self.created_before is not None:
+            conds.append('created_utc < ?')
+            params.append(_ts(self.created_before))
+        if len(conds) == 0:
+            return '1', params
+        return ' AND '.join(conds), params
+
+    def matches(self, fields: Fields) -> bool:
+        """
+        Same condition as sql(), evaluated in python
+        """
+        if self.kinds is not None and fields.kind not in self.kinds:
+            return False
+        if self.authors is not None and fields.author not in self.authors:
+            return False
+        created_utc = None if fields.created_at is None else _ts(fields.created_at)
+        if self.created_after is not None and (created_utc is None or created_utc < _ts(self.created_after)):
+            return False
+        if self.created_before is not None and (created_utc is None or created_utc >= _ts(self.created_before)):
+            return False
+        return True
+
+
+def _ts(dt: datetime) -> int:
+    return int(dt.timestamp())
+
+
+def test_columns() -> None:
+    from datetime import UTC
+
+    f = Fields(
+        created_at=datetime(2024, 1, 1, tzinfo=UTC), author='karlicoss', kind='story', extra={'tags': ['b', 'a']}
+    )
+    assert f.columns() == (1704067200, 'karlicoss', 'story', '{"tags":["b","a"]}')
+    assert Fields().columns() == (None, None, None, None)
+
+
+def test_where() -> None:
+    from datetime import UTC
+
+    assert Where().sql() == ('1', [])
+    assert Where(kinds=['story'], created_after=datetime(2024, 1, 1, tzinfo=UTC)).sql() == (
+        'kind IN (?) AND created_utc >= ?',
+        ['story', 1704067200],
+    )
+
+    story = Fields(created_at=datetime(2024, 1, 2, tzinfo=UTC), kind='story')
+    assert Where().matches(Fields())
+    assert Where(kinds=['story'], created_after=datetime(2024, 1, 1, tzinfo=UTC)).matches(story)
+    assert not Where(created_before=datetime(2024, 1, 2, tzinfo=UTC)).matches(story)
+    assert not Where(authors=['karlicoss']).matches(story)
+    assert not Where(created_after=datetime(2024, 1, 1, tzinfo=UTC)).matches(Fields())
@@ -0,0 +1,173 @@
+# Fingerprints of exclude configuration, to tell whether cached exclusion results are still valid.
+#
+# Exclude functions are described by their source code, plus values they capture (closures)
+# or refer to (globals), e.g. a set of blocked authors defined elsewhere in the config.
+# This can't cover everything (e.g. helper functions from other modules changing), for such cases
+# set exclude_version in the feed config and bump it when exclusion changes.
+# Values that can't be described at all (arbitrary objects) only match within the same process.
+
+import dataclasses
+import functools
+import hashlib
+import inspect
+import re
+import types
+import uuid
+from collections.abc import Callable
+from datetime import date, time, timedelta
+from pathlib import PurePath
+from typing import Any
+
+# don't follow references too deep, e.g. helper calling helper calling helper
+MAX_DEPTH = 5
+
+# for values that can't be described, so they never match a fingerprint from another run
+_PROCESS_ID = uuid.uuid4().hex
+
+
+def content_hash(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def fingerprint(*parts: Any) -> str:
+    return hashlib.blake2b(describe(parts).encode(), digest_size=16).hexdigest()
+
+
+def describe(x: Any, *, _depth: int = 0, _seen: frozenset[int] = frozenset()) -> str:
+    """
+    Deterministic description of the value, stable between runs (unlike repr of functions)
+
+    If the value can't be described, the description is unique to the current process,
+    so anything cached with it is considered stale in the next run.
+    """
+    if _depth > MAX_DEPTH:
+        return _opaque(x)
+
+    def d(y: Any) -> str:
+        return describe(y, _depth=_depth + 1, _seen=_seen | {id(x)})
+
+    if x is None or isinstance(x, (str, bytes, int, float, bool)):
+        return repr(x)
+    if id(x) in _seen:
+        # e.g. recursive function referring to itself, already being described
+        return f'<cycle {type(x).__qualname__}>'
+    if isinstance(x, (set, frozenset)):
+        return '{' + ','.join(sorted(d(v) for v in x)) + '}'
+    if isinstance(x, (list, tuple)):
+        return f'{type(x).__name__}({",".join(d(v) for v in x)})'
+    if isinstance(x, dict):
+        return '{' + ','.join(sorted(f'{d(k)}:{d(v)}' for k, v in x.items())) + '}'
+    if isinstance(x, (date, time, timedelta, PurePath)):
+        return repr(x)
+    if isinstance(x, re.Pattern):
+        return f're({x.pattern!r},{x.flags})'
+    if dataclasses.is_dataclass(x) and not isinstance(x, type):
+        fields = ','.join(f'{f.name}={d(getattr(x, f.name))}' for f in dataclasses.fields(x))
+        return f'{type(x).__qualname__}({fields})'
+    if isinstance(x, functools.partial):
+        return f'partial({d(x.func)},{d(x.args)},{d(x.keywords)})'
+    if isinstance(x, types.MethodType):
+        return f'method({d(x.__func__)},{d(x.__self__)})'
+    if isinstance(x, types.FunctionType):
+        return _describe_function(x, d=d)
+    if isinstance(x, types.BuiltinFunctionType) and not isinstance(x.__self__, (types.ModuleType, type(None))):
+        # e.g. blocked.__contains__
+        return f'method({x.__qualname__},{d(x.__self__)})'
+    if isinstance(x, (type, types.BuiltinFunctionType)):
+        # NOTE: only by name, similar to helpers from other modules
+        return f'{x.__module__}.{x.__qualname__}'
+    state = getattr(x, '__dict__', None)
+    if callable(x) and state is not None and isinstance(call := type(x).__call__, types.FunctionType):
+        # callable instance, e.g. class with configuration and __call__ method
+        return f'{type(x).__qualname__}({d(state)},{d(call)})'
+    # e.g. some arbitrary object, nothing sensible we can do
+    return _opaque(x)
+
+
+def _opaque(x: Any) -> str:
+    return f'{type(x).__qualname__}@{_PROCESS_ID}:{id(x)}'
+
+
+def _describe_function(fn: types.FunctionType, *, d: Callable[[Any], str]) -> str:
+    code = fn.__code__
+    try:
+        source = inspect.getsource(fn)
+    except (OSError, TypeError):
+        # e.g. defined in repl
+        source = code.co_code.hex()
+    res = [source]
+    if fn.__defaults__ is not None:
+        res.append(f'defaults={d(fn.__defaults__)}')
+    if fn.__kwdefaults__ is not None:
+        res.append(f'kwdefaults={d(fn.__kwdefaults__)}')
+    for name, cell in zip(code.co_freevars, fn.__closure__ or (), strict=True):
+        try:
+            value = cell.cell_contents
+        except ValueError:  # empty cell
+            continue
+        res.append(f'{name}={d(value)}')
+    for name in code.co_names:
+        if name not in fn.__globals__:
+            continue  # builtin or attribute name
+        value = fn.__globals__[name]
+        if isinstance(value, types.ModuleType):
+            continue
+        res.append(f'{name}={d(value)}')
+    return f'fn({"|".join(res)})'
+
+
+def test_describe() -> None:
+    assert describe({'b', 'a'}) == describe({'a', 'b'})
+
+    blocked = {'alice'}
+    f = lambda o: o['author'] in blocked
+    before = describe(f)
+    assert before == describe(f)
+    assert "'alice'" in before
+    # same source, but captured value changed
+    blocked.add('bob')
+    assert describe(f) != before
+
+    def make(blocked: str):
+        return lambda o: o == blocked
+
+    assert fingerprint(1, make('a')) == fingerprint(1, make('a'))
+    assert fingerprint(1, make('a')) != fingerprint(1, make('b'))
+    assert fingerprint(1, make('a')) != fingerprint(2, make('a'))
+
+    def recursive(n: int) -> int:
+        return 0 if n == 0 else recursive(n - 1)
+
+    assert 'recursive' in describe(recursive)
+
+    # defaults are part of the configuration as well
+    def with_default(o, *, blocked=('alice',)) -> bool:
+        return o in blocked
+
+    before = describe(with_default)
+    assert "'alice'" in before
+    with_default.__kwdefaults__ = {'blocked': ('bob',)}
+    assert describe(with_default) != before
+
+    p = lambda blocked: functools.partial(with_default, blocked=blocked)
+    assert describe(p(('bob',))) == describe(p(('bob',)))
+    assert describe(p(('bob',))) != describe(p(('carol',)))
+
+    blocked_set = {'alice'}
+    assert "'alice'" in describe(blocked_set.__contains__)
+
+    class Blocked:
+        def __init__(self, authors: set[str]) -> None:
+            self.authors = authors
+
+        def __call__(self, o) -> bool:
+            return o in self.authors
+
+    assert describe(Blocked({'alice'})) == describe(Blocked({'alice'}))
+    assert describe(Blocked({'alice'})) != describe(Blocked({'bob'}))
+
+    # can't tell what's inside, so shouldn't match anything from another run
+    opaque = object()
+    assert describe(opaque) == describe(opaque)
+    assert describe(opaque) != describe(object())
+    assert _PROCESS_ID in describe(opaque)
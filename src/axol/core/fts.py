@@ -0,0 +1,90 @@
+# Full-text search over stored items, see 'axol grep'.
+#
+# Feed databases can have an sqlite FTS5 index of items' text (as extracted by Feed.text).
+# The index is created by 'axol index', after that it's kept up to date by crawl:
+# only items crawled since the last update are parsed and added, so it's cheap.
+
+import html as htmllib
+import re
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from .common import CrawlDt, Uid
+
+if TYPE_CHECKING:
+    from .feed import Feed
+
+
+class QueryError(ValueError):
+    """
+    Query isn't valid FTS5 syntax
+    """
+
+
+@dataclass(frozen=True)
+class Text:
+    title: str  # weighted higher when ranking
+    body: str
+
+
+@dataclass(frozen=True)
+class Match:
+    feed: str
+    uid: Uid
+    crawl_dt: CrawlDt
+    rank: float  # bm25, lower is better
+    title: str
+    snippet: str  # matched terms are marked with [ ]
+
+
+def strip_html(s: str) -> str:
+    # NOTE: good enough for indexing, no need for a proper html parser
+    s = re.sub(r'<[^>]+>', ' ', s)
+    s = htmllib.unescape(s)
+    return ' '.join(s.split())
+
+
+def join(*parts: str | Iterable[str] | None) -> str:
+    """
+    Helper for Feed.text implementations, skips missing parts
+    """
+    res: list[str] = []
+    for part in parts:
+        if part is None:
+            continue
+        if isinstance(part, str):
+            res.append(part)
+        else:
+            res.extend(part)
+    return '\n'.join(p for p in res if len(p) > 0)
+
+
+def terms(query: str) -> str:
+    """
+    Plain search terms to FTS5 query: each term is quoted, so punctuation (e.g. node.js, c++, foo-bar) is matched as is.
+    All terms have to match.
+    """
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def grep(feeds: Iterable['Feed'], query: str, *, limit: int) -> Iterator[Match]:
+    """
+    Best matches across all feeds (FTS5 query syntax)
+    """
+    matches = [m for feed in feeds for m in feed.grep(query, limit=limit)]
+    # NOTE: bm25 scores from different databases aren't strictly comparable, but close enough
+    yield from sorted(matches, key=lambda m: m.rank)[:limit]
+
+
+def test_strip_html() -> None:
+    assert strip_html('<p>Hello &amp; <a href="x">world</a></p>\n<p>bye</p>') == 'Hello & world bye'
+
+
+def test_terms() -> None:
+    assert terms('node.js  c++ foo-bar') == '"node.js" "c++" "foo-bar"'
+    assert terms('say "hi"') == '"say" """hi"""'
+
+
+def test_join() -> None:
+    assert join('title', None, ['a', 'b'], '') == 'title\na\nb'
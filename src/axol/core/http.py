@@ -0,0 +1,261 @@
+# Caching HTTP client for providers that do plain GET requests (lobsters, pinboard, hackernews).
+#
+# Responses are kept in a small sqlite database:
+# - by default, they are revalidated with a conditional request (ETag/Last-Modified), if the server supports it
+# - within the ttl (if set) they are served straight from the cache
+# - in offline mode only the cache is used, which is handy for developing parsers against previously crawled pages
+#
+# Requests that actually hit the network go through the shared rate limiter (see core.ratelimit).
+
+import dataclasses
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Mapping
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import orjson
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from . import clients, ratelimit
+
+REQUIRES = ['requests']
+
+Params = Mapping[str, str]
+
+
+class OfflineCacheMiss(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class HttpCacheSettings:
+    # responses younger than this are used without any requests
+    # NOTE: off by default, otherwise crawling again within the ttl would silently miss new items on search pages
+    ttl: timedelta = timedelta(0)
+    # responses older than this are removed from the cache altogether
+    max_age: timedelta = timedelta(days=30)
+    # only use cached responses, fail if there isn't one
+    offline: bool = False
+    # temporary directory by default
+    db_path: Path | None = None
+
+
+class HttpCache:
+    def __init__(self, db_path: Path, *, settings: HttpCacheSettings) -> None:
+        self.db_path = db_path
+        self.settings = settings
+        # hit: served from cache, revalidated: server said it's unchanged, miss: fetched from the server
+        self.stats: Counter[str] = Counter()
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=wal')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'url TEXT PRIMARY KEY, headers BLOB NOT NULL, body BLOB NOT NULL, fetched REAL NOT NULL'
+                ') STRICT'
+            )
+            if not settings.offline:
+                expired = time.time() - settings.max_age.total_seconds()
+                conn.execute('DELETE FROM responses WHERE fetched < ?', (expired,))
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+
+    def _lookup(self, url: str) -> tuple[CaseInsensitiveDict[str], bytes, float] | None:
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT headers, body, fetched FROM responses WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        headers, body, fetched = row
+        return CaseInsensitiveDict(orjson.loads(headers)), body, fetched
+
+    def _store(self, url: str, *, headers: Mapping[str, str], body: bytes) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'INSERT INTO responses (url, headers, body, fetched) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (url) DO UPDATE SET headers = excluded.headers, body = excluded.body, fetched = excluded.fetched',
+                (url, orjson.dumps(dict(headers)), body, time.time()),
+            )
+
+    def _touch(self, url: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute('UPDATE responses SET fetched = ? WHERE url = ?', (time.time(), url))
+
+    def _fetch(self, url: str, *, host: str, headers: Mapping[str, str]) -> requests.Response:
+        ratelimit.wait(host)
+        return clients.session(host).get(url, headers=headers)
+
+    def get(
+        self,
+        url: str,
+        *,
+        params: Params | None = None,
+        cacheable: Callable[[requests.Response], bool] = lambda _r: True,
+    ) -> requests.Response:
+        """
+        cacheable: for responses that come back as 200, but shouldn't be reused (e.g. 'you are throttled' pages)
+        """
+        host = urlsplit(url).hostname
+        assert host is not None, url
+        url = requests.Request('GET', url, params=params).prepare().url or url
+        resolved = clients.resolve(url)
+        if resolved != url:
+            # e.g. local stand-in server (see core.standin), no point caching
+            return self._fetch(resolved, host=host, headers={})
+        cached = self._lookup(url)
+
+        if cached is not None:
+            cheaders, cbody, fetched = cached
+            age = time.time() - fetched
+            if self.settings.offline or age < self.settings.ttl.total_seconds():
+                self.stats['hit'] += 1
+                return _response(url, headers=cheaders, body=cbody)
+
+        if self.settings.offline:
+            raise OfflineCacheMiss(f'{url} is not cached')
+
+        conditional: dict[str, str] = {}
+        if cached is not None:
+            cheaders, _, _ = cached
+            etag = cheaders.get('ETag')
+            if etag is not None:
+                conditional['If-None-Match'] = etag
+            last_modified = cheaders.get('Last-Modified')
+            if last_modified is not None:
+                conditional['If-Modified-Since'] = last_modified
+
+        r = self._fetch(url, host=host, headers=conditional)
+        if r.status_code == 304 and cached is not None:
+            self.stats['revalidated'] += 1
+            self._touch(url)
+            cheaders, cbody, _ = cached
+            return _response(url, headers=cheaders, body=cbody)
+
+        self.stats['miss'] += 1
+        if r.status_code == 200 and cacheable(r):
+            self._store(url, headers=r.headers, body=r.content)
+        return r
+
+
+def _response(url: str, *, headers: CaseInsensitiveDict[str], body: bytes) -> requests.Response:
+    r = requests.Response()
+    r.url = url
+    r.status_code = 200
+    r.reason = 'OK'
+    r.headers = headers
+    r._content = body
+    r.encoding = get_encoding_from_headers(headers)
+    return r
+
+
+_cache: HttpCache | None = None
+_cache_lock = threading.Lock()
+
+
+def cache() -> HttpCache:
+    """
+    Global cache, configured via optional HTTP_CACHE in the user config.
+    Offline mode can also be enabled via AXOL_HTTP_OFFLINE=1 environment variable.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            settings = HttpCacheSettings()
+            try:
+                import axol.user_config as C
+            except Exception:
+                # e.g. 'axol search' without config, or running tests
+                pass
+            else:
+                settings = getattr(C, 'HTTP_CACHE', settings)
+            if os.environ.get('AXOL_HTTP_OFFLINE') == '1':
+                settings = dataclasses.replace(settings, offline=True)
+            db_path = settings.db_path
+            if db_path is None:
+                db_path = Path(tempfile.gettempdir()) / f'axol-http-cache-{os.getuid()}.sqlite'
+            _cache = HttpCache(db_path, settings=settings)
+        return _cache
+
+
+def get(
+    url: str,
+    *,
+    params: Params | None = None,
+    cacheable: Callable[[requests.Response], bool] = lambda _r: True,
+) -> requests.Response:
+    """
+    Cached and rate limited GET request, see HttpCache.get
+    """
+    return cache().get(url, params=params, cacheable=cacheable)
+
+
+def stats() -> dict[str, int]:
+    """
+    Cache hits/misses by this process
+    """
+    if _cache is None:
+        return {}
+    return dict(_cache.stats)
+
+
+def test_http_cache(tmp_path: Path) -> None:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    import pytest
+
+    requested: list[str] = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            requested.append(self.path)
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = b'throttled' if 'throttled' in self.path else f'page {self.path}'.encode()
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/search'
+    db_path = tmp_path / 'cache.sqlite'
+    try:
+        c = HttpCache(db_path, settings=HttpCacheSettings(ttl=timedelta(minutes=30)))
+        assert c.get(url, params={'q': 'a'}).text == 'page /search?q=a'
+        assert c.get(url, params={'q': 'a'}).text == 'page /search?q=a'
+        assert len(requested) == 1  # within ttl
+        assert c.stats == {'miss': 1, 'hit': 1}
+
+        c = HttpCache(db_path, settings=HttpCacheSettings())
+        assert c.get(url, params={'q': 'a'}).text == 'page /search?q=a'
+        assert len(requested) == 2  # conditional request
+        assert c.stats == {'revalidated': 1}
+
+        # uncacheable responses are refetched every time
+        for _ in range(2):
+            assert c.get(url, params={'q': 'throttled'}, cacheable=lambda r: r.text != 'throttled').text == 'throttled'
+        assert len(requested) == 4
+
+        c = HttpCache(db_path, settings=HttpCacheSettings(offline=True))
+        assert c.get(url, params={'q': 'a'}).text == 'page /search?q=a'
+        with pytest.raises(OfflineCacheMiss):
+            c.get(url, params={'q': 'b'})
+        assert len(requested) == 4
+    finally:
+        server.shutdown()
@@ -0,0 +1,224 @@
+# Incremental crawling.
+#
+# On steady-state crawls almost every item returned by search is already in the database.
+# For queries that were crawled before, providers only do their newest-first pass
+# and stop it once they hit a run of already stored items.
+#
+# Per-query watermarks (when the query was last crawled completely) are kept in the database,
+# so queries that were never crawled completely (or not for a while) still get a full crawl.
+# Watermarks also keep the rate of new items, so queries with few new items can be crawled less often (see core.adaptive).
+
+from collections import Counter
+from collections.abc import Callable, Iterable, Mapping
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any
+
+from .adaptive import AdaptiveSettings, update_rate
+from .common import Uid, make_uid
+
+DEFAULT_FULL_EVERY = timedelta(days=7)
+
+
+@dataclass(frozen=True)
+class Watermark:
+    last_crawl_utc: int
+    last_full_crawl_utc: int | None  # None if the query was never crawled in full
+    new_per_day: float | None = None  # smoothed rate of new items, see core.adaptive
+
+
+@dataclass(frozen=True)
+class IncrementalSettings:
+    # how many already stored items in a row newest-first pass should see before stopping
+    stop_after: int = 20
+    # do a full crawl of the query if the last one was longer ago than this, None means never
+    full_every: timedelta | None = DEFAULT_FULL_EVERY
+
+
+@dataclass(frozen=True)
+class Incremental:
+    """
+    Passed to search functions of feeds with INCREMENTAL = True, when it's fine to only crawl new items.
+
+    Search should only do the newest-first pass (other passes are unlikely to return anything new),
+    and stop it as soon as stopper() says so.
+    """
+
+    known: Callable[[Uid], bool]  # whether the item is already in the database
+    stop_after: int
+
+    def stopper(self) -> Callable[[Uid], bool]:
+        """
+        Returns a function to call on each item of a newest-first pass (in order), returns True when it's time to stop.
+        """
+        run = 0
+
+        def seen(uid: Uid) -> bool:
+            nonlocal run
+            run = run + 1 if self.known(uid) else 0
+            return run >= self.stop_after
+
+        return seen
+
+
+def query_key(search_query: Any) -> str:
+    # compiled queries are frozen dataclasses, so repr is stable
+    return repr(search_query)
+
+
+@dataclass
+class Plan:
+    """
+    Decides which queries are crawled (and how), and keeps track of completed ones during the crawl.
+    """
+
+    settings: IncrementalSettings | None  # None means everything is crawled in full
+    watermarks: Mapping[str, Watermark]
+    known: Callable[[Uid], bool]
+    now: datetime
+    adaptive: AdaptiveSettings | None = None  # None means all queries are crawled every time
+    # query key -> whether it was crawled in full
+    completed: dict[str, bool] = field(default_factory=dict)
+    # uid -> key of the query which found it first
+    origin: dict[Uid, str] = field(default_factory=dict)
+    # items that weren't in the database before this crawl, see inserting
+    fresh: set[Uid] = field(default_factory=set)
+
+    def due(self, search_query: Any) -> bool:
+        """
+        Whether it's time to crawl the query again, according to its rate of new items.
+        """
+        adaptive = self.adaptive
+        if adaptive is None:
+            return True
+        wm = self.watermarks.get(query_key(search_query))
+        if wm is None:
+            return True
+        since = self.now.timestamp() - wm.last_crawl_utc
+        return since >= adaptive.interval(wm.new_per_day).total_seconds()
+
+    def inserting(self, uids: Iterable[Uid]) -> None:
+        """
+        Should be called before inserting items in the middle of the crawl (i.e. streaming).
+        Otherwise queries overlapping with the ones searched earlier would consider these items known,
+        and might stop before reaching their own new items.
+        """
+        self.fresh.update(uid for uid in uids if not self.known(uid))
+
+    def _known_before(self, uid: Uid) -> bool:
+        return uid not in self.fresh and self.known(uid)
+
+    def found(self, search_query: Any, uid: Uid) -> None:
+        # NOTE: if several queries find the item, it's only counted for the first one, same as dedup during search
+        self.origin.setdefault(uid, query_key(search_query))
+
+    def incremental(self, search_query: Any) -> Incremental | None:
+        settings = self.settings
+        if settings is None:
+            return None
+        wm = self.watermarks.get(query_key(search_query))
+        if wm is None or wm.last_full_crawl_utc is None:
+            return None  # never crawled in full
+        if settings.full_every is not None:
+            since_full = self.now.timestamp() - wm.last_full_crawl_utc
+            if since_full >= settings.full_every.total_seconds():
+                return None
+        return Incremental(known=self._known_before, stop_after=settings.stop_after)
+
+    def complete(self, search_query: Any, *, full: bool) -> None:
+        self.completed[query_key(search_query)] = full
+
+    def rates(self, new_uids: Iterable[Uid]) -> dict[str, float | None]:
+        """
+        Updated rates of new items for completed queries, given uids that turned out to be new.
+        """
+        smoothing = (self.adaptive or AdaptiveSettings()).smoothing
+        new = Counter(self.origin[uid] for uid in new_uids if uid in self.origin)
+        res = {}
+        for key in self.completed:
+            wm = self.watermarks.get(key)
+            previous = None if wm is None else wm.new_per_day
+            elapsed = None if wm is None else self.now.timestamp() - wm.last_crawl_utc
+            res[key] = update_rate(previous, new=new[key], elapsed_s=elapsed, smoothing=smoothing)
+        return res
+
+
+def test_stopper() -> None:
+    stored = {make_uid(x) for x in ['a', 'b', 'c', 'd']}
+    inc = Incremental(known=lambda uid: uid in stored, stop_after=2)
+
+    stop = inc.stopper()
+    # run of known items is reset by a new one
+    assert [stop(make_uid(x)) for x in ['a', 'new', 'b', 'c']] == [False, False, False, True]
+
+    # each pass gets its own stopper
+    stop = inc.stopper()
+    assert not stop(make_uid('d'))
+
+
+def test_plan_inserting() -> None:
+    from datetime import UTC
+
+    stored = {make_uid('old')}
+    now = datetime(2024, 1, 10, tzinfo=UTC)
+    ts = int(now.timestamp())
+    watermarks = {query_key('q'): Watermark(last_crawl_utc=ts, last_full_crawl_utc=ts)}
+    plan = Plan(settings=IncrementalSettings(), watermarks=watermarks, known=lambda uid: uid in stored, now=now)
+
+    # as if inserted by an earlier chunk of the same crawl
+    plan.inserting([make_uid('old'), make_uid('new')])
+    stored.add(make_uid('new'))
+    inc = plan.incremental('q')
+    assert inc is not None
+    assert inc.known(make_uid('old'))
+    assert not inc.known(make_uid('new'))
+
+
+def test_plan() -> None:
+    from datetime import UTC
+
+    now = datetime(2024, 1, 10, tzinfo=UTC)
+    day = 24 * 60 * 60
+    ts = int(now.timestamp())
+    watermarks = {
+        query_key('recent'): Watermark(last_crawl_utc=ts - day, last_full_crawl_utc=ts - day),
+        query_key('stale'): Watermark(last_crawl_utc=ts - day, last_full_crawl_utc=ts - 10 * day),
+        query_key('partial'): Watermark(last_crawl_utc=ts - day, last_full_crawl_utc=None),
+    }
+
+    def plan(settings: IncrementalSettings | None) -> Plan:
+        return Plan(settings=settings, watermarks=watermarks, known=lambda _uid: False, now=now)
+
+    p = plan(IncrementalSettings())
+    assert p.incremental('recent') is not None
+    assert p.incremental('stale') is None
+    assert p.incremental('partial') is None
+    assert p.incremental('never crawled') is None
+
+    assert plan(IncrementalSettings(full_every=None)).incremental('stale') is not None
+    assert plan(None).incremental('recent') is None
+
+
+def test_plan_adaptive() -> None:
+    from datetime import UTC
+
+    now = datetime(2024, 1, 10, tzinfo=UTC)
+    hour = 60 * 60
+    ts = int(now.timestamp())
+    watermarks = {
+        query_key('hot'): Watermark(last_crawl_utc=ts - 2 * hour, last_full_crawl_utc=None, new_per_day=100),
+        query_key('cold'): Watermark(last_crawl_utc=ts - 2 * hour, last_full_crawl_utc=None, new_per_day=0.1),
+    }
+    adaptive = AdaptiveSettings(min_interval=timedelta(hours=1), max_interval=timedelta(days=7), target_new=5)
+    plan = Plan(settings=None, watermarks=watermarks, known=lambda _uid: False, now=now, adaptive=adaptive)
+    assert plan.due('hot')
+    assert not plan.due('cold')
+    assert plan.due('never crawled')
+
+    for q, uid in [('hot', 'a'), ('hot', 'b'), ('never crawled', 'b'), ('never crawled', 'c')]:
+        plan.found(q, make_uid(uid))
+    plan.complete('hot', full=True)
+    plan.complete('never crawled', full=True)
+    rates = plan.rates([make_uid(x) for x in ['a', 'b', 'c']])
+    # 2 new items in 2 hours is 24 per day, smoothed with the previous rate
+    assert rates == {query_key('hot'): 62.0, query_key('never crawled'): None}
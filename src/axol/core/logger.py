@@ -1,6 +1,9 @@
 import sys
+from functools import cache
+from typing import TYPE_CHECKING, Any, cast
 
-from loguru import logger
+if TYPE_CHECKING:
+    import loguru
 
 fmt = (
     "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | "
@@ -25,4 +28,20 @@ config = {
     "patcher": _add_exc_info,
 }
 
-logger.configure(**config)  # type: ignore[arg-type]  # ty: ignore[invalid-argument-type]
+
+@cache
+def _logger() -> 'loguru.Logger':
+    from loguru import logger
+
+    logger.configure(**config)  # type: ignore[arg-type]  # ty: ignore[invalid-argument-type]
+    return logger
+
+
+class _LazyLogger:
+    # loguru takes a while to import (mostly because it pulls in asyncio)
+    # so it's only imported once something actually logs, which keeps cli startup fast
+    def __getattr__(self, name: str) -> Any:
+        return getattr(_logger(), name)
+
+
+logger = cast('loguru.Logger', _LazyLogger())
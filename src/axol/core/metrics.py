@@ -0,0 +1,260 @@
+# Crawl metrics: how much time/requests/bytes each feed and query takes.
+#
+# Everything is kept in memory for the current process, and can be dumped as json
+# or as a Prometheus textfile (for node_exporter's textfile collector) at the end of the crawl.
+#
+# Labels like feed/query are set by whoever knows them (see labels()), so code deep down
+# (e.g. http requests made by providers) doesn't have to pass them around.
+
+import math
+import threading
+import time
+from collections.abc import Iterator, Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Literal
+
+import orjson
+
+from .utils import write_atomic
+
+Kind = Literal['counter', 'histogram']
+
+# fmt: off
+METRICS: dict[str, tuple[Kind, str]] = {
+    'axol_searches_total'                 : ('counter'  , 'search queries run'),
+    'axol_search_seconds_total'           : ('counter'  , 'time spent in search functions (including network and sleeps)'),
+    'axol_search_results_total'           : ('counter'  , 'results returned by search, before dedup and exclusion'),
+    'axol_http_requests_total'            : ('counter'  , 'http requests made by providers'),
+    'axol_http_response_bytes_total'      : ('counter'  , 'http response body bytes'),
+    'axol_http_request_seconds'           : ('histogram', 'http request latency'),
+    'axol_ratelimit_wait_seconds_total'   : ('counter'  , 'time spent waiting for the shared rate limiter'),
+    'axol_parse_seconds_total'            : ('counter'  , 'time spent parsing items'),
+    'axol_parsed_items_total'             : ('counter'  , 'items parsed'),
+    'axol_insert_seconds_total'           : ('counter'  , 'time spent inserting items into the database'),
+    'axol_insert_items_total'             : ('counter'  , 'items passed to insert, by whether they were new'),
+    'axol_crawl_seconds_total'            : ('counter'  , 'total crawl time'),
+}
+# fmt: on
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+_labels: ContextVar[Mapping[str, str]] = ContextVar('axol_metrics_labels', default={})  # noqa: B039
+
+
+@contextmanager
+def labels(**kwargs: str) -> Iterator[None]:
+    """
+    Everything recorded within the context (in the same thread) gets these labels.
+
+    NOTE: shouldn't wrap a yield in generators, otherwise labels would leak into the consumer
+    """
+    token = _labels.set({**_labels.get(), **kwargs})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    counts: list[int] = field(default_factory=lambda: [0] * len(DEFAULT_BUCKETS))
+    count: int = 0
+    sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        res = []
+        total = 0
+        for b, c in zip(self.buckets, self.counts, strict=True):
+            total += c
+            res.append((b, total))
+        res.append((math.inf, self.count))
+        return res
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.histograms: dict[tuple[str, Labels], Histogram] = {}
+
+    @staticmethod
+    def _key(name: str, kind: Kind, kwargs: Mapping[str, str]) -> tuple[str, Labels]:
+        expected, _ = METRICS[name]
+        assert kind == expected, (name, kind)
+        merged = {**_labels.get(), **kwargs}
+        return name, tuple(sorted(merged.items()))
+
+    def inc(self, name: str, value: float = 1, **kwargs: str) -> None:
+        key = self._key(name, 'counter', kwargs)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **kwargs: str) -> None:
+        key = self._key(name, 'histogram', kwargs)
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = Histogram()
+                self.histograms[key] = h
+            h.observe(value)
+
+    def report(self) -> dict:
+        """
+        Json friendly dump of all metrics
+        """
+        with self._lock:
+            metrics: list[dict] = [
+                {'name': name, 'type': 'counter', 'labels': dict(lbls), 'value': value}
+                for (name, lbls), value in sorted(self.counters.items())
+            ]
+            metrics.extend(
+                {
+                    'name': name,
+                    'type': 'histogram',
+                    'labels': dict(lbls),
+                    'count': h.count,
+                    'sum': h.sum,
+                    'buckets': {_fmt(b): c for b, c in h.cumulative()},
+                }
+                for (name, lbls), h in sorted(self.histograms.items())
+            )
+        return {'timestamp': time.time(), 'metrics': metrics}
+
+    def prometheus(self) -> str:
+        """
+        Prometheus text exposition format
+        """
+        lines: list[str] = []
+        with self._lock:
+            for name, (kind, help_) in METRICS.items():
+                counters = sorted((lbls, v) for (n, lbls), v in self.counters.items() if n == name)
+                histograms = sorted(
+                    ((lbls, h) for (n, lbls), h in self.histograms.items() if n == name), key=lambda p: p[0]
+                )
+                if len(counters) == 0 and len(histograms) == 0:
+                    continue
+                lines.append(f'# HELP {name} {help_}')
+                lines.append(f'# TYPE {name} {kind}')
+                for lbls, value in counters:
+                    lines.append(f'{name}{_fmt_labels(lbls)} {_fmt(value)}')
+                for lbls, h in histograms:
+                    for b, c in h.cumulative():
+                        lines.append(f'{name}_bucket{_fmt_labels((*lbls, ("le", _fmt(b))))} {c}')
+                    lines.append(f'{name}_sum{_fmt_labels(lbls)} {_fmt(h.sum)}')
+                    lines.append(f'{name}_count{_fmt_labels(lbls)} {h.count}')
+        # so it's possible to alert if crawl hasn't run for a while
+        lines.append('# HELP axol_metrics_timestamp_seconds when these metrics were written')
+        lines.append('# TYPE axol_metrics_timestamp_seconds gauge')
+        lines.append(f'axol_metrics_timestamp_seconds {_fmt(time.time())}')
+        return '\n'.join(lines) + '\n'
+
+    def top(self, name: str, *, by: str, n: int) -> list[tuple[str, float]]:
+        """
+        Biggest values of the counter, summed by a label
+        """
+        totals: dict[str, float] = {}
+        with self._lock:
+            for (nm, lbls), value in self.counters.items():
+                if nm != name:
+                    continue
+                label = dict(lbls).get(by)
+                if label is None:
+                    continue
+                totals[label] = totals.get(label, 0) + value
+        return sorted(totals.items(), key=lambda p: p[1], reverse=True)[:n]
+
+
+def _fmt(x: float) -> str:
+    if math.isinf(x):
+        return '+Inf'
+    if float(x).is_integer():
+        return str(int(x))
+    return repr(float(x))
+
+
+def _fmt_labels(lbls: Labels) -> str:
+    if len(lbls) == 0:
+        return ''
+
+    def escape(v: str) -> str:
+        return v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in lbls) + '}'
+
+
+_registry = Registry()
+
+
+def registry() -> Registry:
+    return _registry
+
+
+def reset() -> None:
+    global _registry
+    _registry = Registry()
+
+
+def inc(name: str, value: float = 1, **kwargs: str) -> None:
+    _registry.inc(name, value, **kwargs)
+
+
+def observe(name: str, value: float, **kwargs: str) -> None:
+    _registry.observe(name, value, **kwargs)
+
+
+def write_json(path: Path) -> None:
+    write_atomic(path, orjson.dumps(_registry.report(), option=orjson.OPT_INDENT_2))
+
+
+def write_prometheus(path: Path) -> None:
+    # node_exporter might read the file while we're writing it
+    # NOTE: tmp file doesn't end with .prom, so the textfile collector ignores it
+    write_atomic(path, _registry.prometheus().encode())
+
+
+def test_registry() -> None:
+    r = Registry()
+    with labels(feed='hn'):
+        r.inc('axol_searches_total', query='a')
+        with labels(query='b'):
+            r.inc('axol_searches_total')
+            r.inc('axol_searches_total')
+            r.observe('axol_http_request_seconds', 0.07, host='example.com')
+            r.observe('axol_http_request_seconds', 100, host='example.com')
+    r.inc('axol_searches_total')
+
+    assert r.counters == {
+        ('axol_searches_total', (('feed', 'hn'), ('query', 'a'))): 1,
+        ('axol_searches_total', (('feed', 'hn'), ('query', 'b'))): 2,
+        ('axol_searches_total', ()): 1,
+    }
+    assert r.top('axol_searches_total', by='query', n=1) == [('b', 2)]
+
+    prom = r.prometheus()
+    assert 'axol_searches_total{feed="hn",query="b"} 2\n' in prom
+    assert 'axol_http_request_seconds_bucket{feed="hn",host="example.com",query="b",le="0.05"} 0\n' in prom
+    assert 'axol_http_request_seconds_bucket{feed="hn",host="example.com",query="b",le="0.1"} 1\n' in prom
+    assert 'axol_http_request_seconds_bucket{feed="hn",host="example.com",query="b",le="+Inf"} 2\n' in prom
+    assert 'axol_http_request_seconds_count{feed="hn",host="example.com",query="b"} 2\n' in prom
+
+    [h] = [m for m in r.report()['metrics'] if m['type'] == 'histogram']
+    assert h['buckets']['+Inf'] == 2
+    assert h['sum'] == 100.07
+
+
+def test_escape() -> None:
+    assert _fmt_labels((('query', 'Query(query="a\\b")'),)) == '{query="Query(query=\\"a\\\\b\\")"}'
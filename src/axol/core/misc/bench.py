@@ -0,0 +1,385 @@
+# Benchmarks for the storage/parsing/rendering paths, run via 'axol bench'.
+#
+# Each module gets a synthetic database with n items shaped like real search results,
+# and each operation is timed for several rounds (we keep min/median/mean, like pytest-benchmark does).
+# Results are appended to a small sqlite history, so it's easy to spot regressions between versions.
+
+import contextlib
+import io
+import platform
+import sqlite3
+import statistics
+import tempfile
+import time
+import zlib
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+
+import orjson
+from more_itertools import ilen
+
+from ..common import Uid, make_uid
+from ..feed import Feed
+from ..logger import logger
+from ..storage import StorageProfile
+
+Sample = Callable[[int], tuple[Uid, bytes]]
+
+BASE_TS = int(datetime(2024, 1, 1, tzinfo=UTC).timestamp())
+
+
+def _dt(i: int) -> datetime:
+    return datetime.fromtimestamp(BASE_TS + i * 60, tz=UTC)
+
+
+# NOTE: these mimic what search functions store, see model.parse in each module for the shapes
+
+
+def _hackernews(i: int) -> tuple[Uid, bytes]:
+    j: dict = {
+        'objectID': str(i),
+        'author': f'user{i % 100}',
+        'created_at': _dt(i).isoformat(),
+        'created_at_i': BASE_TS + i * 60,
+        'updated_at': _dt(i).isoformat(),
+        'children': [],
+    }
+    if i % 2 == 0:
+        j |= {
+            'story_id': i,
+            'title': f'Show HN: story {i}',
+            'url': f'https://example.com/{i}',
+            'story_text': '',
+            'points': i % 50,
+            'num_comments': i % 10,
+        }
+    else:
+        j |= {
+            'story_id': i - 1,
+            'parent_id': i - 1,
+            'story_title': f'Show HN: story {i - 1}',
+            'story_url': f'https://example.com/{i - 1}',
+            'comment_text': f'<p>comment {i} with a <a href="https://example.com">link</a> and <i>some</i> markup</p>',
+            'points': None,
+        }
+    return make_uid(str(i)), orjson.dumps(j)
+
+
+def _lobsters(i: int) -> tuple[Uid, bytes]:
+    sid = f's{i:05d}'
+    ts = BASE_TS + i * 60
+    author = f'user{i % 100}'
+    data = f'''
+<li class="story" data-shortid="{sid}" id="story_{sid}">
+<div class="story_liner h-entry">
+<div class="voters"><a class="upvoter" href="/login">{i % 50}</a></div>
+<div class="details">
+<span aria-level="1" class="link h-cite u-repost-of" role="heading">
+<a class="u-url" href="https://example.com/{i}" rel="ugc noreferrer">Story {i}</a>
+</span>
+<span class="tags">
+<a class="tag tag_python" href="/t/python" title="Python programming">python</a>
+<a class="tag tag_databases" href="/t/databases" title="Databases">databases</a>
+</span>
+<div class="byline">
+<a href="/~{author}">{author}</a>
+<time data-at-unix="{ts}" datetime="{_dt(i)}" title="{_dt(i)}">2 years ago</time>
+</div>
+</div>
+</div>
+<a class="mobile_comments" href="/s/{sid}/story_{i}" style="display: none;"><span>{i % 10}</span></a>
+</li>
+    '''.strip()
+    return make_uid(sid), data.encode()
+
+
+def _pinboard(i: int) -> tuple[Uid, bytes]:
+    slug = f'b{i:08x}'
+    j = {
+        'id': i,
+        'slug': slug,
+        'url': f'https://example.com/{i}',
+        'url_id': i,
+        'url_slug': f'u{i:08x}',
+        'title': f'Bookmark {i}',
+        'description': f'description of bookmark {i}' if i % 3 != 0 else None,
+        'author': f'user{i % 100}',
+        'tags': ['python', 'Databases', f'tag{i % 7}'],
+        'created': _dt(i).strftime('%Y-%m-%d %H:%M:%S'),
+        'toread': '0',
+        'private': '0',
+    }
+    return make_uid(slug), orjson.dumps(j)
+
+
+def _reddit(i: int) -> tuple[Uid, bytes]:
+    sid = f'r{i:06d}'
+    j = {
+        'id': sid,
+        'created_utc': float(BASE_TS + i * 60),
+        'subreddit': {'display_name': f'sub{i % 20}'},
+        'author': {'name': f'user{i % 100}'},
+        'downs': 0,
+        'ups': i % 100,
+        'permalink': f'/r/sub{i % 20}/comments/{sid}/submission_{i}/',
+        'title': f'Submission {i}',
+        'url': f'https://example.com/{i}',
+        'selftext': f'text of submission {i}\n\nwith a couple of paragraphs',
+        'selftext_html': f'<div class="md"><p>text of submission {i}</p></div>',
+    }
+    return make_uid(sid), orjson.dumps(j)
+
+
+def _github(i: int) -> tuple[Uid, bytes]:
+    user = {'login': f'user{i % 100}', 'html_url': f'https://github.com/user{i % 100}'}
+    repo = f'user{i % 100}/repo{i % 30}'
+    j: dict
+    if i % 3 == 0:
+        j = {
+            'html_url': f'https://github.com/{repo}/issues/{i}',
+            'repository_url': f'https://api.github.com/repos/{repo}',
+            'state': 'open',
+            'title': f'Issue {i}',
+            'body': f'body of issue {i}\n\n```\nsome code\n```',
+            'created_at': _dt(i).isoformat(),
+            'user': user,
+        }
+        uid = f'issue_{i}'
+    elif i % 3 == 1:
+        j = {
+            'html_url': f'https://github.com/{repo}/commit/{i:040x}',
+            'repository': {'full_name': repo},
+            'commit': {'author': {'date': _dt(i).isoformat()}, 'message': f'commit {i}'},
+            'author': user,
+        }
+        uid = f'commit_{i:040x}'
+    else:
+        j = {
+            'html_url': f'https://github.com/{repo}',
+            'full_name': repo,
+            'created_at': _dt(i).isoformat(),
+            'description': f'repository {i}',
+            'topics': ['python', 'search'],
+            'stargazers_count': i % 1000,
+            'forks_count': i % 10,
+            'owner': user,
+        }
+        uid = f'repo_{repo.replace("/", "_")}_{i}'
+    return make_uid(uid), orjson.dumps(j)
+
+
+SAMPLES: dict[str, Sample] = {
+    'hackernews': _hackernews,
+    'lobsters': _lobsters,
+    'pinboard': _pinboard,
+    'reddit': _reddit,
+    'github': _github,
+}
+
+
+@dataclass(frozen=True)
+class Timing:
+    bench: str
+    module: str
+    n: int
+    rounds: int
+    min: float
+    median: float
+    mean: float
+
+
+def _time(fn: Callable[[], object], *, setup: Callable[[], object] | None = None, rounds: int) -> list[float]:
+    res = []
+    for _ in range(rounds):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        res.append(time.perf_counter() - start)
+    return res
+
+
+def _feed_cls(module: str) -> type[Feed]:
+    import importlib
+
+    return importlib.import_module(f'axol.modules.{module}.feed').Feed
+
+
+def bench_module(module: str, *, n: int, rounds: int, workdir: Path) -> Iterator[Timing]:
+    from ...renderers.markdown import render_feed
+    from .stats import print_stats
+
+    feed_cls = _feed_cls(module)
+    sample = SAMPLES[module]
+    items = [sample(i) for i in range(n)]
+
+    def make(name: str, **kwargs) -> Feed:
+        return feed_cls.make(query_name=name, queries=['bench'], db_path=workdir / f'{module}_{name}.sqlite', **kwargs)
+
+    def timing(bench: str, times: list[float]) -> Timing:
+        return Timing(
+            bench=bench,
+            module=module,
+            n=n,
+            rounds=len(times),
+            min=min(times),
+            median=statistics.median(times),
+            mean=statistics.mean(times),
+        )
+
+    ## insert into a fresh database each round
+    insert_feed = make('insert')
+
+    def reset() -> None:
+        insert_feed.db_path.unlink(missing_ok=True)
+
+    def insert() -> None:
+        with insert_feed._database(writable=True) as db:
+            ilen(db.insert(items, dry=False))
+
+    yield timing('insert', _time(insert, setup=reset, rounds=rounds))
+    ##
+
+    feed = make('main')
+    with feed._database(writable=True) as db:
+        ilen(db.insert(items, dry=False))
+
+    def select_all() -> None:
+        with feed._database() as db:
+            ilen(db.select_all())
+
+    yield timing('select_all', _time(select_all, rounds=rounds))
+
+    yield timing('feed', _time(lambda: ilen(feed.feed()), rounds=rounds))
+
+    cached = make('cached', storage=StorageProfile(parse_cache=True))
+    cached.db_path.write_bytes(feed.db_path.read_bytes())
+    ilen(cached.feed())  # warm up the parse cache
+    yield timing('feed_cached', _time(lambda: ilen(cached.feed()), rounds=rounds))
+
+    # exclude roughly 10% of items; dry, so each round does the same work
+    prune_feed = make('prune', exclude_raw=lambda data: zlib.crc32(data) % 10 == 0)
+    prune_feed.db_path.write_bytes(feed.db_path.read_bytes())
+    yield timing('prune_db', _time(lambda: ilen(prune_feed.prune_db(dry=True)), rounds=rounds))
+
+    def stats() -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            print_stats(feed=feed, threshold=0.01)
+
+    yield timing('print_stats', _time(stats, rounds=rounds))
+
+    feed.update_fields()  # otherwise the first round would include backfilling fields
+    yield timing('markdown', _time(lambda: ilen(render_feed(feed)), rounds=rounds))
+
+
+def run(*, modules: Sequence[str], n: int, rounds: int) -> Iterator[Timing]:
+    with tempfile.TemporaryDirectory() as td:
+        for module in modules:
+            try:
+                _feed_cls(module)
+            except ImportError as e:
+                # e.g. optional dependency isn't installed
+                logger.warning(f'[{module}] skipping: {e}')
+                continue
+            logger.info(f'[{module}] benchmarking with {n} items')
+            yield from bench_module(module, n=n, rounds=rounds, workdir=Path(td))
+
+
+class History:
+    """
+    Benchmark results from previous runs
+    """
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = db_path
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS runs ('
+                'run_id INTEGER PRIMARY KEY, ts INTEGER NOT NULL, version TEXT NOT NULL, python TEXT NOT NULL'
+                ') STRICT'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'run_id INTEGER NOT NULL REFERENCES runs(run_id), bench TEXT NOT NULL, module TEXT NOT NULL, '
+                'n INTEGER NOT NULL, rounds INTEGER NOT NULL, min REAL NOT NULL, median REAL NOT NULL, mean REAL NOT NULL'
+                ') STRICT'
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, isolation_level=None)
+
+    def last(self, *, bench: str, module: str, n: int) -> float | None:
+        """
+        Median from the most recent run with the same parameters
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                'SELECT median FROM results WHERE bench = ? AND module = ? AND n = ? ORDER BY run_id DESC LIMIT 1',
+                (bench, module, n),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def save(self, timings: Sequence[Timing]) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute('BEGIN')
+            (run_id,) = conn.execute(
+                'INSERT INTO runs (ts, version, python) VALUES (?, ?, ?) RETURNING run_id',
+                (int(time.time()), _version(), platform.python_version()),
+            ).fetchone()
+            conn.executemany(
+                'INSERT INTO results (run_id, bench, module, n, rounds, min, median, mean) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, t.bench, t.module, t.n, t.rounds, t.min, t.median, t.mean) for t in timings],
+            )
+
+
+def _version() -> str:
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version('axol')
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+def report(timings: Sequence[Timing], *, history: History) -> list[dict]:
+    """
+    Rows for printing, compared against the previous run
+    """
+    rows = []
+    for t in timings:
+        prev = history.last(bench=t.bench, module=t.module, n=t.n)
+        change = '' if prev is None else f'{t.median / prev - 1:+.1%}'
+        rows.append(
+            {
+                'module': t.module,
+                'bench': t.bench,
+                'n': t.n,
+                'min, ms': f'{t.min * 1000:.1f}',
+                'median, ms': f'{t.median * 1000:.1f}',
+                'mean, ms': f'{t.mean * 1000:.1f}',
+                'µs/item': f'{t.median / t.n * 1_000_000:.1f}',
+                'previous, ms': '' if prev is None else f'{prev * 1000:.1f}',
+                'change': change,
+            }
+        )
+    return rows
+
+
+def test_bench(tmp_path: Path) -> None:
+    # just check that the samples are parseable and renderable, and the whole thing works end to end
+    for module, sample in SAMPLES.items():
+        feed_cls = _feed_cls(module)
+        _uid, data = sample(1)
+        o = feed_cls.make(query_name='test', queries=['test'], db_path=tmp_path / 'test.sqlite').parse(data)
+        assert feed_cls.MarkdownAdapter(o).content
+
+    timings = list(run(modules=['hackernews', 'pinboard'], n=20, rounds=2))
+    assert {(t.module, t.bench) for t in timings} >= {('hackernews', 'insert'), ('pinboard', 'markdown')}
+
+    history = History(tmp_path / 'bench.sqlite')
+    assert all(row['change'] == '' for row in report(timings, history=history))
+    history.save(timings)
+    assert all(row['change'] != '' for row in report(timings, history=history))
@@ -17,7 +17,7 @@ EXCLUDE_KEYS: set[Key] = {
 }
 
 
-def print_stats(*, feed: Feed, threshold: float) -> None:
+def print_stats(*, feed: Feed, threshold: float, workers: int | None = None) -> None:
     counters: dict[Key, Counter] = {}
     otypes: Counter[str] = Counter()
 
@@ -27,7 +27,7 @@ def print_stats(*, feed: Feed, threshold: float) -> None:
         counters[key][item] += 1
 
     total = 0
-    for _crawl_dt, _uid, o in feed.feed():
+    for _crawl_dt, _uid, o in feed.feed(workers=workers):
         if isinstance(o, Exception):
             raise o
         total += 1
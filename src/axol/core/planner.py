@@ -0,0 +1,90 @@
+# Sharing search results between feeds.
+#
+# compile_queries only dedupes within a feed, but several feeds of the same type
+# might well compile to the same search queries (e.g. two github feeds both searching issues for "foo").
+# The planner knows about all feeds in the crawl, so each such query is only searched once,
+# and the results are handed to every feed using it (each feed still applies its own exclude and database).
+#
+# NOTE: results of shared queries are kept in memory until every feed using them is done with them,
+# so crawl's max_buffer_bytes doesn't bound memory for these queries. Queries that aren't shared are streamed as usual.
+
+import threading
+from collections import Counter
+from collections.abc import Iterable
+from typing import Any
+
+from .common import SearchResult, SearchResults
+from .logger import logger
+from .query import compile_queries
+
+Key = tuple[type, Any]  # feed type and compiled query
+
+
+class SearchPlanner:
+    """
+    Safe to share between threads (e.g. crawl --parallel).
+    """
+
+    def __init__(self, feeds: Iterable[Any]) -> None:
+        # NOTE: Any since importing Feed would be circular
+        subscribers: Counter[Key] = Counter()
+        for feed in feeds:
+            for search_query in compile_queries(feed.queries):
+                subscribers[(type(feed), search_query)] += 1
+        self._shared = {key for key, count in subscribers.items() if count > 1}
+        # how many feeds are still going to search for the query
+        self._pending = subscribers
+        self._results: dict[tuple[Key, int | None], list[SearchResult]] = {}
+        self._locks: dict[Key, threading.Lock] = {key: threading.Lock() for key in self._shared}
+        self._lock = threading.Lock()
+        self.saved = 0  # number of searches we didn't have to run, for stats
+
+    def search(self, feed: Any, *, query: Any, limit: int | None, **kwargs: Any) -> SearchResults:
+        key: Key = (type(feed), query)
+        if key not in self._shared:
+            yield from feed.search(query=query, limit=limit, **kwargs)
+            return
+
+        try:
+            # NOTE: the lock is so concurrent feeds wait for the results instead of searching again
+            with self._locks[key]:
+                results = self._results.get((key, limit))
+                if results is not None:
+                    feed.logger.debug(f'{query} -- reusing results from another feed')
+                    with self._lock:
+                        self.saved += 1
+                elif len(kwargs) == 0:
+                    # only complete results are kept, if the search fails the next feed just retries it
+                    results = list(feed.search(query=query, limit=limit))
+                    self._results[(key, limit)] = results
+        finally:
+            # even if the search failed, this feed won't ask for the results again
+            self._done(key, limit=limit)
+
+        if results is None:
+            # incremental search depends on the feed's database, so can't be shared
+            # (but it's pretty cheap anyway)
+            yield from feed.search(query=query, limit=limit, **kwargs)
+            return
+        yield from results
+
+    def skip(self, feed: Any, *, query: Any, limit: int | None) -> None:
+        """
+        For queries the feed isn't going to search after all (e.g. not due yet, see core.adaptive)
+        """
+        key: Key = (type(feed), query)
+        if key in self._shared:
+            self._done(key, limit=limit)
+
+    def _done(self, key: Key, *, limit: int | None) -> None:
+        with self._lock:
+            self._pending[key] -= 1
+            if self._pending[key] <= 0:
+                # nobody else needs it, so no need to keep in memory
+                self._results.pop((key, limit), None)
+
+    def log_stats(self) -> None:
+        if len(self._shared) > 0:
+            logger.info(
+                f'{len(self._shared)} queries are used by multiple feeds, skipped {self.saved} duplicate searches'
+            )
@@ -0,0 +1,222 @@
+# Shared per-host rate limiting.
+#
+# Token bucket state lives in a small sqlite database, so the limit is shared between threads
+# and processes (e.g. several 'axol crawl' instances, or crawl --parallel/--concurrent) hitting the same host.
+# Providers call wait(host) before each request instead of sleeping for a fixed amount of time.
+
+import itertools
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterable, Iterator, Mapping
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import metrics
+from .logger import logger
+
+
+@dataclass(frozen=True)
+class Rate:
+    per_second: float  # sustained request rate
+    burst: int = 1  # how many requests can be made at once after being idle
+
+
+# fmt: off
+DEFAULT_RATES: dict[str, Rate] = {
+    # lobsters asks to sleep between hits otherwise, seems like 1 second is enough
+    'lobste.rs'       : Rate(per_second=0.5),
+    # pinboard doesn't have a documented limit for website, but no need to spam it
+    'pinboard.in'     : Rate(per_second=0.2),
+    # algolia allows 10000 requests per hour per ip
+    'hn.algolia.com'  : Rate(per_second=2.0, burst=5),
+    # authenticated search api allows 30 requests per minute
+    'api.github.com'  : Rate(per_second=0.5, burst=5),
+    # oauth api allows 100 requests per minute
+    'oauth.reddit.com': Rate(per_second=1.5, burst=5),
+}
+# fmt: on
+
+
+class RateLimiter:
+    def __init__(self, db_path: Path, *, rates: Mapping[str, Rate]) -> None:
+        self.db_path = db_path
+        self.rates = rates
+        # total seconds waited per host, for stats
+        self.waited: defaultdict[str, float] = defaultdict(float)
+        self._waited_lock = threading.Lock()
+        # NOTE: sqlite connections can't be shared between threads
+        # connections are closed when the thread exits, or when the limiter is garbage collected
+        self._local = threading.local()
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=wal')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets (host TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL) STRICT'
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # NOTE: isolation_level=None so we control transactions ourselves
+        return sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+
+    def _connection(self) -> sqlite3.Connection:
+        # NOTE: reused by the thread, so each request doesn't pay for connecting
+        conn: sqlite3.Connection | None = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, host: str) -> float:
+        """
+        Blocks until a request to the host is allowed. Returns how many seconds it waited.
+
+        Hosts without a configured rate aren't limited.
+        """
+        rate = self.rates.get(host)
+        if rate is None:
+            return 0.0
+
+        # NOTE: if there are no tokens, we still take one (so the bucket goes into debt) and sleep until it's refilled
+        # this way concurrent waiters queue up fairly and we don't need to poll the database
+        conn = self._connection()
+        # immediate, so concurrent acquirers are serialized
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()  # NOTE: wall clock, since it's shared between processes
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE host = ?', (host,)).fetchone()
+            if row is None:
+                tokens = float(rate.burst)
+            else:
+                tokens, updated = row
+                tokens = min(float(rate.burst), tokens + max(0.0, now - updated) * rate.per_second)
+            tokens -= 1
+            conn.execute(
+                'INSERT INTO buckets (host, tokens, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT (host) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                (host, tokens, now),
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        delay = 0.0 if tokens >= 0 else -tokens / rate.per_second
+        if delay > 0:
+            logger.debug(f'[{host}] rate limited, waiting for {delay:.1f}s')
+            with self._waited_lock:
+                self.waited[host] += delay
+            time.sleep(delay)
+        return delay
+
+
+_limiter: RateLimiter | None = None
+_limiter_lock = threading.Lock()
+
+
+def limiter() -> RateLimiter:
+    """
+    Global limiter, configured via optional RATE_LIMITS/RATE_LIMIT_DB in the user config
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            rates: dict[str, Rate] = dict(DEFAULT_RATES)
+            db_path: Path | None = None
+            try:
+                import axol.user_config as C
+            except Exception:
+                # e.g. 'axol search' without config, or running tests
+                pass
+            else:
+                rates.update(getattr(C, 'RATE_LIMITS', {}))
+                db_path = getattr(C, 'RATE_LIMIT_DB', None)
+            if db_path is None:
+                # shared by all processes of the same user, doesn't matter if it's wiped
+                db_path = Path(tempfile.gettempdir()) / f'axol-ratelimit-{os.getuid()}.sqlite'
+            _limiter = RateLimiter(db_path, rates=rates)
+        return _limiter
+
+
+def wait(host: str) -> float:
+    """
+    Blocks until a request to the host is allowed by the shared rate limit. Returns how many seconds it waited.
+    """
+    waited = limiter().acquire(host)
+    metrics.inc('axol_ratelimit_wait_seconds_total', waited, host=host)
+    return waited
+
+
+def paced[T](items: Iterable[T], *, host: str, page_size: int) -> Iterator[T]:
+    """
+    For clients that paginate internally and don't let us hook into their requests.
+    Waits before each item that would trigger fetching the next page.
+    """
+    it = iter(items)
+    for i in itertools.count():
+        if i % page_size == 0:
+            wait(host)
+        try:
+            x = next(it)
+        except StopIteration:
+            return
+        yield x
+
+
+@contextmanager
+def unlimited(hosts: Iterable[str]) -> Iterator[None]:
+    """
+    Temporarily disables rate limits for the hosts, e.g. while they are routed to local stand-ins (see core.standin)
+    """
+    rl = limiter()
+    rates = rl.rates
+    skip = set(hosts)
+    rl.rates = {host: rate for host, rate in rates.items() if host not in skip}
+    try:
+        yield
+    finally:
+        rl.rates = rates
+
+
+def waited() -> dict[str, float]:
+    """
+    Total seconds waited per host by this process
+    """
+    if _limiter is None:
+        return {}
+    with _limiter._waited_lock:
+        return dict(_limiter.waited)
+
+
+def test_rate_limiter(tmp_path: Path) -> None:
+    from concurrent.futures import ThreadPoolExecutor
+
+    import pytest
+
+    db_path = tmp_path / 'ratelimit.sqlite'
+    rates = {'example.com': Rate(per_second=20.0, burst=5)}
+    rl = RateLimiter(db_path, rates=rates)
+
+    # burst is allowed right away
+    assert [rl.acquire('example.com') for _ in range(5)] == [0.0] * 5
+    # then we have to wait
+    assert rl.acquire('example.com') > 0
+    # unknown hosts aren't limited
+    assert rl.acquire('other.com') == 0.0
+
+    # separate instances (e.g. in different processes) share the bucket
+    time.sleep(0.5)  # refill
+    limiters = [RateLimiter(db_path, rates=rates) for _ in range(4)]
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        waits = list(pool.map(lambda i: limiters[i % 4].acquire('example.com'), range(25)))
+    elapsed = time.monotonic() - start
+    # 5 from the burst, remaining 20 at 20 per second
+    assert elapsed > 0.9, elapsed
+    assert sum(w == 0.0 for w in waits) == 5
+    assert rl.waited['example.com'] > 0
+    # each waiting thread counted
+    assert sum(other.waited['example.com'] for other in limiters) == pytest.approx(sum(waits))
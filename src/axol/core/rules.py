@@ -0,0 +1,250 @@
+# Declarative exclude rules, e.g.
+#
+#   exclude_rules=Or(In('author', {'spammer', 'bot'}), Eq('subreddit', 'cryptocurrency'), Regex('repo', r'^awesome-'))
+#
+# Unlike exclude callables, rules on extracted fields (see core.fields) compile to sql,
+# so excluded items are filtered by the database (using indexes where possible) without parsing them.
+# For anything more complicated, Predicate wraps a regular callable, it's evaluated in python after parsing.
+#
+# Field names: 'author' and 'kind' refer to the indexed columns, anything else refers to a key in Fields.extra.
+# If the field is a list (e.g. tags), the rule matches if any of its elements matches. Missing fields never match.
+
+import re
+from abc import abstractmethod
+from collections.abc import Callable, Collection, Sequence
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+from .fields import Fields
+
+Sql = tuple[str, list[Any]]
+
+COLUMNS = ('author', 'kind')
+
+
+class Rule:
+    @abstractmethod
+    def matches(self, o: Any, fields: Fields) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def sql(self) -> Sql | None:
+        """
+        Condition over results table which is true for matching items, None if the rule can't be compiled
+        """
+        raise NotImplementedError
+
+
+@dataclass(frozen=True)
+class _FieldRule(Rule):
+    field: str
+
+    def __post_init__(self) -> None:
+        # NOTE: used in json path
+        assert re.fullmatch(r'\w+', self.field), self.field
+
+    def _values(self, fields: Fields) -> list[Any]:
+        value = getattr(fields, self.field) if self.field in COLUMNS else fields.extra.get(self.field)
+        if value is None:
+            return []
+        if isinstance(value, (list, tuple)):
+            return list(value)
+        return [value]
+
+    @abstractmethod
+    def _match(self, value: Any) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _cond(self, column: str) -> Sql:
+        raise NotImplementedError
+
+    def matches(self, o: Any, fields: Fields) -> bool:  # noqa: ARG002
+        return any(self._match(v) for v in self._values(fields))
+
+    def sql(self) -> Sql:
+        if self.field in COLUMNS:
+            return self._cond(self.field)
+        cond, params = self._cond('value')
+        # NOTE: json_each of a scalar is just the scalar itself, so this works for both scalars and lists
+        return f"EXISTS (SELECT 1 FROM json_each(extra, '$.{self.field}') WHERE {cond})", params
+
+
+@dataclass(frozen=True)
+class Eq(_FieldRule):
+    value: str | int
+
+    def _match(self, value: Any) -> bool:
+        return value == self.value
+
+    def _cond(self, column: str) -> Sql:
+        return f'{column} = ?', [self.value]
+
+
+@dataclass(frozen=True)
+class In(_FieldRule):
+    values: Collection[str | int]
+
+    def _match(self, value: Any) -> bool:
+        return value in self.values
+
+    def _cond(self, column: str) -> Sql:
+        values = sorted(self.values, key=str)  # sorted so sql is deterministic
+        return f'{column} IN ({",".join("?" * len(values))})', values
+
+
+@dataclass(frozen=True)
+class Contains(_FieldRule):
+    """
+    Case sensitive substring
+    """
+
+    substring: str
+
+    def _match(self, value: Any) -> bool:
+        return isinstance(value, str) and self.substring in value
+
+    def _cond(self, column: str) -> Sql:
+        return f"instr({column}, ?) > 0 AND typeof({column}) = 'text'", [self.substring]
+
+
+@dataclass(frozen=True)
+class Regex(_FieldRule):
+    """
+    Python regex, matched with re.search
+
+    NOTE: in sql it's still a python call per item, but it's much cheaper than parsing
+    """
+
+    pattern: str
+
+    def _match(self, value: Any) -> bool:
+        return regexp(self.pattern, value)
+
+    def _cond(self, column: str) -> Sql:
+        return f'{column} REGEXP ?', [self.pattern]
+
+
+@dataclass(frozen=True)
+class Predicate(Rule):
+    """
+    Fallback for anything that can't be expressed with other rules, receives the parsed object
+    """
+
+    predicate: Callable[[Any], bool]
+
+    def matches(self, o: Any, fields: Fields) -> bool:  # noqa: ARG002
+        return self.predicate(o)
+
+    def sql(self) -> None:
+        return None
+
+
+@dataclass(frozen=True, init=False)
+class Or(Rule):
+    rules: Sequence[Rule]
+
+    def __init__(self, *rules: Rule) -> None:
+        object.__setattr__(self, 'rules', rules)
+
+    def matches(self, o: Any, fields: Fields) -> bool:
+        return any(r.matches(o, fields) for r in self.rules)
+
+    def sql(self) -> Sql | None:
+        return _join(self.rules, 'OR')
+
+
+@dataclass(frozen=True, init=False)
+class And(Rule):
+    rules: Sequence[Rule]
+
+    def __init__(self, *rules: Rule) -> None:
+        object.__setattr__(self, 'rules', rules)
+
+    def matches(self, o: Any, fields: Fields) -> bool:
+        return all(r.matches(o, fields) for r in self.rules)
+
+    def sql(self) -> Sql | None:
+        return _join(self.rules, 'AND')
+
+
+def _join(rules: Sequence[Rule], op: str) -> Sql | None:
+    conds: list[str] = []
+    params: list[Any] = []
+    for rule in rules:
+        compiled = rule.sql()
+        if compiled is None:
+            return None
+        cond, ps = compiled
+        # NOTE: coalesce so missing fields (NULL) count as not matching, otherwise NULL would propagate
+        conds.append(f'coalesce(({cond}), 0)')
+        params.extend(ps)
+    if len(conds) == 0:
+        return ('0' if op == 'OR' else '1'), params
+    return f' {op} '.join(conds), params
+
+
+@dataclass(frozen=True)
+class Pushdown:
+    # items matching this are excluded by the database
+    sql: Sql | None
+    # the rest is evaluated in python
+    rest: Rule | None
+
+
+def pushdown(rule: Rule) -> Pushdown:
+    """
+    Splits the rule into the part that can be evaluated by the database and the part that needs python.
+    """
+    rules = list(rule.rules) if isinstance(rule, Or) else [rule]
+    compiled: list[Rule] = []
+    rest: list[Rule] = []
+    for r in rules:
+        (compiled if r.sql() is not None else rest).append(r)
+    # NOTE: And with a predicate inside can't be split, so it's evaluated in python as a whole
+    return Pushdown(
+        sql=None if len(compiled) == 0 else Or(*compiled).sql(),
+        rest=None if len(rest) == 0 else Or(*rest),
+    )
+
+
+@lru_cache(maxsize=256)
+def _compile(pattern: str) -> re.Pattern[str]:
+    return re.compile(pattern)
+
+
+def regexp(pattern: str, value: Any) -> bool:
+    """
+    Used as sqlite REGEXP function (which isn't defined by default)
+    """
+    return isinstance(value, str) and _compile(pattern).search(value) is not None
+
+
+def test_matches() -> None:
+    fields = Fields(author='alice', kind='story', extra={'tags': ['rust', 'python'], 'repo': 'alice/awesome-rust'})
+    assert Eq('author', 'alice').matches(None, fields)
+    assert not Eq('author', 'bob').matches(None, fields)
+    assert In('tags', {'go', 'python'}).matches(None, fields)
+    assert Contains('repo', 'awesome').matches(None, fields)
+    assert Regex('repo', r'/awesome-').matches(None, fields)
+    assert not Eq('subreddit', 'python').matches(None, fields)  # missing field
+    assert And(Eq('kind', 'story'), Predicate(lambda o: o == 1)).matches(1, fields)
+    assert not Or(Eq('kind', 'comment'), Predicate(lambda o: o == 1)).matches(2, fields)
+
+
+def test_pushdown() -> None:
+    p = pushdown(Or(Eq('author', 'alice'), Predicate(bool), In('tags', ['b', 'a'])))
+    assert p.sql == (
+        "coalesce((author = ?), 0) OR coalesce((EXISTS (SELECT 1 FROM json_each(extra, '$.tags') WHERE value IN (?,?))), 0)",
+        ['alice', 'a', 'b'],
+    )
+    assert p.rest is not None
+    assert p.rest.matches(1, Fields())
+
+    p = pushdown(And(Eq('author', 'alice'), Predicate(bool)))
+    assert p.sql is None
+
+    p = pushdown(Eq('kind', 'comment'))
+    assert p.sql == ('coalesce((kind = ?), 0)', ['comment'])
+    assert p.rest is None
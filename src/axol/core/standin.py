@@ -0,0 +1,352 @@
+# Local stand-ins for search providers' HTTP endpoints.
+#
+# Each host gets its own local server, serving previously recorded responses (fixtures).
+# Providers are pointed at them via routes (see clients.resolve), so the whole crawl pipeline
+# can be exercised, load tested and benchmarked without hitting live websites.
+#
+# In record mode, requests without a fixture are forwarded to the real host, and the response is saved.
+# Fixtures are plain json files (one per request), so they can be inspected/edited by hand.
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections.abc import Iterator, Mapping
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Self
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import orjson
+
+from . import clients, ratelimit
+from .logger import logger
+
+REQUIRES = ['requests']  # for recording
+
+# fmt: off
+HOSTS = [
+    'lobste.rs',
+    'pinboard.in',
+    'hn.algolia.com',
+    'api.github.com',
+    'oauth.reddit.com',
+    'www.reddit.com',  # reddit auth
+]
+# fmt: on
+
+# set to 1 so replay() records missing fixtures from the live websites
+RECORD_ENV = 'AXOL_STANDIN_RECORD'
+
+# only these response headers are kept, the rest is mostly noise (or cookies)
+KEEP_HEADERS = {'content-type', 'etag', 'last-modified', 'link', 'retry-after'}
+KEEP_HEADERS_PREFIXES = ('x-ratelimit-',)
+
+
+@dataclass(frozen=True)
+class Behaviour:
+    latency: float = 0.0  # seconds added to each response
+    throttle_every: int | None = None  # every n-th request gets a 'too many requests' response
+
+
+@dataclass(frozen=True)
+class Recorded:
+    status: int
+    headers: dict[str, str]
+    body: bytes
+
+
+def _throttled(host: str) -> Recorded:
+    if host == 'lobste.rs':
+        # lobsters returns a regular page asking to slow down
+        return Recorded(
+            status=200, headers={'Content-Type': 'text/html'}, body=b'Throttled, sleep 1 second between hits'
+        )
+    return Recorded(
+        status=429,
+        headers={'Content-Type': 'application/json', 'Retry-After': '1'},
+        body=b'{"message": "too many requests"}',
+    )
+
+
+def _normalise(target: str) -> str:
+    # query parameters might come in different order
+    parts = urlsplit(target)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return parts.path + ('?' + query if query else '')
+
+
+class Fixtures:
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def _path(self, host: str, method: str, target: str) -> Path:
+        target = _normalise(target)
+        digest = hashlib.sha256(f'{method} {target}'.encode()).hexdigest()[:16]
+        # readable prefix, so it's easier to find the fixture
+        prefix = re.sub(r'[^\w.-]+', '_', urlsplit(target).path).strip('_')[:60]
+        return self.root / host / f'{method}_{prefix}_{digest}.json'
+
+    def load(self, host: str, method: str, target: str) -> Recorded | None:
+        path = self._path(host, method, target)
+        if not path.exists():
+            return None
+        j = orjson.loads(path.read_bytes())
+        return Recorded(status=j['status'], headers=j['headers'], body=j['body'].encode('utf8'))
+
+    def save(self, host: str, method: str, target: str, recorded: Recorded) -> None:
+        path = self._path(host, method, target)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        j = {
+            'method': method,
+            'target': _normalise(target),
+            'status': recorded.status,
+            'headers': recorded.headers,
+            # NOTE: all providers return text (html/json), so no need to bother with binary
+            'body': recorded.body.decode('utf8'),
+        }
+        path.write_bytes(orjson.dumps(j, option=orjson.OPT_INDENT_2))
+
+
+class StandIn:
+    def __init__(
+        self,
+        host: str,
+        *,
+        fixtures: Fixtures,
+        behaviour: Behaviour = Behaviour(),  # noqa: B008
+        upstream: str | None = None,
+    ) -> None:
+        """
+        upstream: if set, requests without a fixture are forwarded there, and the responses are recorded
+        """
+        self.host = host
+        self.fixtures = fixtures
+        self.behaviour = behaviour
+        self.upstream = upstream
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:
+                standin._handle(self)
+
+            def do_POST(self) -> None:
+                standin._handle(self)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self) -> Self:
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        method = handler.command
+        target = handler.path
+        length = int(handler.headers.get('Content-Length', 0))
+        body = handler.rfile.read(length) if length > 0 else b''
+
+        with self._lock:
+            self.requests += 1
+            count = self.requests
+
+        behaviour = self.behaviour
+        if behaviour.latency > 0:
+            time.sleep(behaviour.latency)
+
+        recorded: Recorded | None
+        if behaviour.throttle_every is not None and count % behaviour.throttle_every == 0:
+            recorded = _throttled(self.host)
+        else:
+            recorded = self.fixtures.load(self.host, method, target)
+            if recorded is None and self.upstream is not None:
+                recorded = self._record(handler, method=method, target=target, body=body)
+        if recorded is None:
+            logger.warning(f'[{self.host}] no fixture for {method} {target}')
+            recorded = Recorded(status=404, headers={'Content-Type': 'text/plain'}, body=b'no fixture')
+
+        # so pagination links point back at us
+        # NOTE: body is served as is, urls in it are part of the data (e.g. github's repository_url)
+        origin = f'https://{self.host}'
+        rbody = recorded.body
+        handler.send_response(recorded.status)
+        for k, v in recorded.headers.items():
+            handler.send_header(k, v.replace(origin, self.base_url))
+        handler.send_header('Content-Length', str(len(rbody)))
+        handler.end_headers()
+        handler.wfile.write(rbody)
+
+    def _record(self, handler: BaseHTTPRequestHandler, *, method: str, target: str, body: bytes) -> Recorded:
+        import requests
+
+        assert self.upstream is not None
+        # NOTE: only passing headers that matter, e.g. so the upstream doesn't compress the response
+        headers = {
+            k: v
+            for k, v in handler.headers.items()
+            if k.lower() in {'authorization', 'user-agent', 'accept', 'content-type'}
+        }
+        r = requests.request(method, self.upstream + target, headers=headers, data=body or None, timeout=60)
+        rheaders = {
+            k: v
+            for k, v in r.headers.items()
+            if k.lower() in KEEP_HEADERS or k.lower().startswith(KEEP_HEADERS_PREFIXES)
+        }
+        rbody = r.content
+        if self.host == 'www.reddit.com' and 'access_token' in target:
+            # don't want to keep actual tokens in fixtures
+            rbody = re.sub(rb'"access_token": ?"[^"]*"', b'"access_token": "standin"', rbody)
+        recorded = Recorded(status=r.status_code, headers=rheaders, body=rbody)
+        if r.status_code == 200:
+            self.fixtures.save(self.host, method, target, recorded)
+            logger.info(f'[{self.host}] recorded {method} {target}')
+        return recorded
+
+
+@contextmanager
+def serve(
+    fixtures: Path,
+    *,
+    hosts: list[str] = HOSTS,
+    behaviour: Behaviour = Behaviour(),  # noqa: B008
+    record: bool = False,
+    upstreams: Mapping[str, str] | None = None,
+) -> Iterator[dict[str, StandIn]]:
+    """
+    Runs stand-ins for the hosts, and routes requests to them while in the context.
+
+    record: forward requests without fixtures to the real hosts (or upstreams, if specified), and record responses
+    """
+    fx = Fixtures(fixtures)
+    with ExitStack() as stack:
+        standins: dict[str, StandIn] = {}
+        for host in hosts:
+            upstream = None
+            if record:
+                upstream = (upstreams or {}).get(host, f'https://{host}')
+            standin = stack.enter_context(StandIn(host, fixtures=fx, behaviour=behaviour, upstream=upstream))
+            standins[host] = standin
+            clients.route(host, standin.base_url)
+            stack.callback(clients.route, host, None)
+        yield standins
+
+
+@contextmanager
+def replay(fixtures: Path, *, hosts: list[str]) -> Iterator[dict[str, StandIn]]:
+    """
+    For provider tests: serves fixtures committed next to the provider instead of hitting live websites.
+
+    With AXOL_STANDIN_RECORD=1, missing fixtures are recorded from the live websites (respecting rate limits).
+    """
+    record = os.environ.get(RECORD_ENV) == '1'
+    # NOTE: pooled api clients keep the base url they were made with, so shouldn't outlive the stand-ins
+    clients.close_all()
+    try:
+        with serve(fixtures, hosts=hosts, record=record) as standins:
+            if record:
+                yield standins
+            else:
+                with ratelimit.unlimited(hosts):
+                    yield standins
+    finally:
+        clients.close_all()
+
+
+def test_standin_hackernews(tmp_path: Path) -> None:
+    from datetime import UTC, datetime
+
+    from ..modules.hackernews.feed import Feed
+
+    # pretend to be algolia api
+    total = 1500
+    base_ts = int(datetime(2024, 1, 1, tzinfo=UTC).timestamp())
+
+    def hit(i: int) -> dict:
+        ts = base_ts + i * 60
+        return {
+            'objectID': str(i),
+            'story_id': i,
+            'author': 'user',
+            'created_at': datetime.fromtimestamp(ts, tz=UTC).isoformat(),
+            'created_at_i': ts,
+            'title': f'story {i}',
+            'url': f'https://example.com/{i}',
+            'points': 1,
+            'num_comments': 0,
+        }
+
+    class Algolia(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            params = dict(parse_qsl(urlsplit(self.path).query))
+            before = int(params.get('numericFilters', f'created_at_i<{base_ts + total * 60}').split('<')[1])
+            hits = [hit(i) for i in reversed(range(total)) if hit(i)['created_at_i'] < before]
+            body = orjson.dumps({'hits': hits[: int(params['hitsPerPage'])]})
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    algolia = ThreadingHTTPServer(('127.0.0.1', 0), Algolia)
+    threading.Thread(target=algolia.serve_forever, daemon=True).start()
+
+    fixtures = tmp_path / 'fixtures'
+
+    def crawl(name: str) -> int:
+        feed = Feed.make(query_name=name, queries=['whatever'], db_path=tmp_path / f'{name}.sqlite')
+        return len([x for x in feed.crawl() if not isinstance(x, Exception)])
+
+    try:
+        with serve(
+            fixtures,
+            hosts=['hn.algolia.com'],
+            record=True,
+            upstreams={'hn.algolia.com': f'http://127.0.0.1:{algolia.server_port}'},
+        ):
+            assert crawl('record') == total
+    finally:
+        algolia.shutdown()
+    # 2 pages + empty page at the end
+    assert len(list((fixtures / 'hn.algolia.com').iterdir())) == 3
+
+    # now replay, upstream isn't available anymore
+    with serve(fixtures, hosts=['hn.algolia.com']) as standins:
+        assert crawl('replay') == total
+        assert standins['hn.algolia.com'].requests == 3
+
+
+def test_standin_behaviour(tmp_path: Path) -> None:
+    import requests
+
+    fixtures = Fixtures(tmp_path)
+    fixtures.save('lobste.rs', 'GET', '/search?q=a&page=1', Recorded(status=200, headers={}, body=b'page 1'))
+
+    with serve(tmp_path, hosts=['lobste.rs'], behaviour=Behaviour(latency=0.1, throttle_every=2)):
+        url = clients.resolve('https://lobste.rs/search?page=1&q=a')
+        start = time.monotonic()
+        assert requests.get(url, timeout=10).text == 'page 1'
+        assert time.monotonic() - start >= 0.1
+        assert 'Throttled' in requests.get(url, timeout=10).text
+        assert requests.get(clients.resolve('https://lobste.rs/search?q=b'), timeout=10).status_code == 404
+    # route is removed after
+    assert clients.resolve('https://lobste.rs/search') == 'https://lobste.rs/search'
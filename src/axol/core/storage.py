@@ -1,28 +1,44 @@
+import copy
+import itertools
 import sqlite3
-from collections.abc import Callable, Iterable, Iterator
-from contextlib import AbstractContextManager
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from contextlib import AbstractContextManager, closing, contextmanager, nullcontext
+from dataclasses import dataclass
 from datetime import UTC, datetime
 from pathlib import Path
-from typing import cast
+from typing import Literal
 
-import loguru
 import sqlalchemy
+from more_itertools import chunked
 from sqlalchemy import (
     Column,
+    Connection,
+    Index,
     Table,
     event,
-    func,
     select,
 )
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
+from . import metrics
 from .common import (
+    CrawlDt,
     Uid,
-    datetime_aware,
     make_uid,
 )
+from .compression import Codec, train_dict
+from .fields import Extractor, Fields, Order, Where
+from .fts import QueryError
+from .incremental import Watermark
+from .logger import logger as main_logger
+from .rules import Sql, regexp
 from .utils import sqlalchemy_strict_sqlite
 
-CrawlDt = datetime_aware
+# rows per INSERT statement
+# sqlite has a limit on the number of query parameters (32766 on recent versions), we use 3 per row
+INSERT_CHUNK_SIZE = 1000
 
 
 class Columns:
@@ -31,11 +47,106 @@ class Columns:
     DATA = 'data'
 
 
+# columns with fields extracted from items, see core.fields
+# NOTE: not part of results_table, since readonly databases created by older versions don't have them
+FIELDS_COLUMNS = ('created_utc', 'author', 'kind', 'extra')
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """
+    Sqlite connection settings for feed databases.
+
+    None means 'leave sqlite default as is'.
+    """
+
+    # NOTE: journal mode is persistent, so once a database is switched to wal, it stays wal
+    journal_mode: Literal['delete', 'wal'] | None = None
+    synchronous: Literal['off', 'normal', 'full'] | None = None
+    # seconds to wait for a lock held by another connection (same as sqlite3.connect timeout)
+    busy_timeout: float = 5.0
+    mmap_size: int | None = None  # bytes
+    cache_size: int | None = None  # same semantics as sqlite pragma, i.e. negative value means KiB
+    # how many times to retry starting a write transaction if the database is still locked after busy_timeout
+    retries: int = 0
+    # compress newly inserted items with zstd, even if the database doesn't have a trained dictionary yet
+    # NOTE: databases with a dictionary (see 'axol compress') always compress new items
+    compress: bool = False
+    # keep parsed objects in a side table, so reading the feed doesn't have to parse all items every time
+    # only works for feeds that define PARSER_VERSION
+    parse_cache: bool = False
+    # remember which items were excluded by exclude functions, so reading the feed doesn't have to
+    # parse/evaluate them every time. Invalidated when exclusion config changes, see core.fingerprint
+    exclude_cache: bool = False
+
+    def pragmas(self, *, writable: bool) -> list[str]:
+        res = []
+        if self.journal_mode is not None and writable:
+            # can't change journal mode on a readonly connection
+            res.append(f'PRAGMA journal_mode={self.journal_mode}')
+        if self.synchronous is not None:
+            res.append(f'PRAGMA synchronous={self.synchronous}')
+        if self.mmap_size is not None:
+            res.append(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        if self.cache_size is not None:
+            res.append(f'PRAGMA cache_size={int(self.cache_size)}')
+        return res
+
+
+DEFAULT_PROFILE = StorageProfile()
+
+# with wal, readers don't block the writer and see a consistent snapshot while crawl is writing
+# e.g. you can run 'axol feed' while 'axol crawl' is running
+# see https://www.sqlite.org/wal.html
+WAL_PROFILE = StorageProfile(
+    journal_mode='wal',
+    synchronous='normal',  # safe in wal mode, might only lose last transactions on power loss
+    busy_timeout=30.0,
+    mmap_size=256 * 1024 * 1024,
+    cache_size=-64 * 1024,
+    retries=5,
+)
+
+
+class UidLookup:
+    """
+    Checks whether items are in the database, e.g. to stop crawling once we reach items we've seen before.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection]) -> None:
+        self._connect = connect
+        # NOTE: sqlite connections can't be shared between threads
+        # connections are closed when the thread exits, or when the lookup is garbage collected
+        self._local = threading.local()
+
+    def __call__(self, uid: Uid) -> bool:
+        conn: sqlite3.Connection | None = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn.execute('SELECT 1 FROM results WHERE uid = ?', (uid,)).fetchone() is not None
+
+
+def _is_locked(e: Exception) -> bool:
+    return 'database is locked' in str(e)
+
+
 class Database(AbstractContextManager['Database']):
-    def __init__(self, db_path: Path, *, writable: bool = False, logger=None) -> None:
+    def __init__(
+        self,
+        db_path: Path,
+        *,
+        writable: bool = False,
+        logger=None,
+        profile: StorageProfile | None = None,
+    ) -> None:
         assert db_path.is_absolute(), db_path
 
-        parent_logger = logger if logger is not None else loguru.logger
+        if profile is None:
+            profile = DEFAULT_PROFILE
+        self.profile = profile
+
+        parent_logger = logger if logger is not None else main_logger
         # meh, it's too much text this way
         # self.logger = parent_logger.bind(db_path=db_path)
         self.logger = parent_logger
@@ -45,7 +156,16 @@ class Database(AbstractContextManager['Database']):
 
         self.db_path = db_path
         mode = '' if writable else '?mode=ro'
-        creator = lambda: sqlite3.connect(f'file:{db_path}{mode}', uri=True)
+        pragmas = profile.pragmas(writable=writable)
+
+        def creator() -> sqlite3.Connection:
+            conn = sqlite3.connect(f'file:{db_path}{mode}', uri=True, timeout=profile.busy_timeout)
+            for pragma in pragmas:
+                conn.execute(pragma)
+            # for Regex exclude rules, see core.rules
+            conn.create_function('regexp', 2, regexp, deterministic=True)
+            return conn
+
         self.engine = sqlalchemy.create_engine('sqlite://', creator=creator, echo=False)
 
         self.metadata = sqlalchemy.MetaData()
@@ -62,7 +182,17 @@ class Database(AbstractContextManager['Database']):
         # event.listen(self.engine, 'connect', do_connect)
 
         def _begin_immediate_transaction(conn) -> None:
-            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            for attempt in itertools.count(start=1):
+                try:
+                    conn.exec_driver_sql('BEGIN IMMEDIATE')
+                except sqlalchemy.exc.OperationalError as e:
+                    if not _is_locked(e) or attempt > profile.retries:
+                        raise
+                    delay = min(2**attempt, 30)
+                    self.logger.warning(f'[{db_path}] database is locked, retrying in {delay}s ({attempt=})')
+                    time.sleep(delay)
+                else:
+                    return
 
         event.listen(self.engine, 'begin', _begin_immediate_transaction)
 
@@ -74,115 +204,809 @@ class Database(AbstractContextManager['Database']):
             Column(Columns.DATA               , sqlalchemy.BLOB   , nullable=False),
         )  # fmt: skip
 
+        self.dicts_table = Table(
+            'zstd_dicts',
+            self.metadata,
+            Column('id'         , sqlalchemy.Integer, primary_key=True),
+            Column('dict_id'    , sqlalchemy.Integer, nullable=False, unique=True),
+            Column('created_utc', sqlalchemy.Integer, nullable=False),
+            Column('data'       , sqlalchemy.BLOB   , nullable=False),
+        )  # fmt: skip
+
+        self.parse_cache_table = Table(
+            'parse_cache',
+            self.metadata,
+            Column('uid'           , sqlalchemy.Text   , primary_key=True),
+            Column('parser_version', sqlalchemy.Integer, nullable=False),
+            Column('data'          , sqlalchemy.BLOB   , nullable=False),
+        )  # fmt: skip
+
+        self.exclude_cache_table = Table(
+            'exclude_cache',
+            self.metadata,
+            Column('hash'       , sqlalchemy.BLOB   , primary_key=True),  # see fingerprint.content_hash
+            Column('fingerprint', sqlalchemy.Text   , nullable=False),
+            Column('excluded'   , sqlalchemy.Integer, nullable=False),
+        )  # fmt: skip
+
+        # see Feed.prune_db, only has a single row
+        self.prune_state_table = Table(
+            'prune_state',
+            self.metadata,
+            Column('id'         , sqlalchemy.Integer, primary_key=True),
+            Column('crawl_ts'   , sqlalchemy.Integer, nullable=False),
+            Column('uid'        , sqlalchemy.Text   , nullable=False),
+            Column('fingerprint', sqlalchemy.Text   , nullable=False),
+        )  # fmt: skip
+
+        self.watermarks_table = Table(
+            'watermarks',
+            self.metadata,
+            Column('query'              , sqlalchemy.Text   , primary_key=True),
+            Column('last_crawl_utc'     , sqlalchemy.Integer, nullable=False),
+            Column('last_full_crawl_utc', sqlalchemy.Integer, nullable=True),
+            Column('new_per_day'        , sqlalchemy.REAL   , nullable=True),
+        )  # fmt: skip
+
+        # feed is read in this order, so it's important to have an index
+        self.crawl_ts_index = Index(
+            'results_crawl_ts_uid',
+            self.results_table.c[Columns.CRAWL_TIMESTAMP_UTC],
+            self.results_table.c[Columns.UID],
+        )
+
         with sqlalchemy_strict_sqlite():
             # NOTE: checkfirst=True is default -- if false it would complain if db already exists
-            self.metadata.create_all(self.engine)
+            # NOTE: other tables are created in migrations, otherwise would fail for readonly databases
+            self.metadata.create_all(self.engine, tables=[self.results_table])
+
+        if writable:
+            self._migrate()
+
+        self.codec = Codec(load_dict=self._load_dict, current_dict_id=self._current_dict_id)
 
     def __exit__(self, *args, **kwargs) -> None:
         self.engine.dispose()
 
+    def with_logger(self, logger) -> 'Database':
+        """
+        Same database (sharing connections), but logging to another logger, e.g. when shared between feeds
+        """
+        res = copy.copy(self)
+        res.logger = logger
+        return res
+
+    def _migrations(self) -> list[Callable[[Connection], None]]:
+        """
+        Schema changes for databases created by older versions.
+        Only append to this list! Position in the list is the schema version (stored as sqlite user_version).
+        """
+
+        def add_crawl_ts_index(conn: Connection) -> None:
+            self.crawl_ts_index.create(conn, checkfirst=True)
+
+        def add_zstd_dicts_table(conn: Connection) -> None:
+            with sqlalchemy_strict_sqlite():
+                self.dicts_table.create(conn, checkfirst=True)
+
+        def add_parse_cache_table(conn: Connection) -> None:
+            with sqlalchemy_strict_sqlite():
+                self.parse_cache_table.create(conn, checkfirst=True)
+
+        def add_watermarks_table(conn: Connection) -> None:
+            with sqlalchemy_strict_sqlite():
+                self.watermarks_table.create(conn, checkfirst=True)
+
+        def add_watermarks_rate_column(conn: Connection) -> None:
+            # NOTE: table created by add_watermarks_table already has it
+            columns = {name for _, name, *_ in conn.exec_driver_sql('PRAGMA table_info(watermarks)')}
+            if 'new_per_day' not in columns:
+                conn.exec_driver_sql('ALTER TABLE watermarks ADD COLUMN new_per_day REAL')
+
+        def add_fields_columns(conn: Connection) -> None:
+            # NOTE: values are filled in on insert, or backfilled by Feed.update_fields
+            # fields_version is NULL for items which weren't extracted yet
+            for column, type_ in [
+                ('created_utc', 'INTEGER'),
+                ('author', 'TEXT'),
+                ('kind', 'TEXT'),
+                ('extra', 'TEXT'),
+                ('fields_version', 'INTEGER'),
+            ]:
+                conn.exec_driver_sql(f'ALTER TABLE results ADD COLUMN {column} {type_}')
+            # NOTE: crawl timestamp and uid are included so ordering by creation time doesn't need a sort
+            conn.exec_driver_sql('CREATE INDEX results_created_utc ON results (created_utc, crawl_timestamp_utc, uid)')
+            conn.exec_driver_sql('CREATE INDEX results_author ON results (author)')
+            conn.exec_driver_sql('CREATE INDEX results_kind ON results (kind)')
+            conn.exec_driver_sql('CREATE INDEX results_fields_version ON results (fields_version)')
+
+        def add_exclude_cache_table(conn: Connection) -> None:
+            with sqlalchemy_strict_sqlite():
+                self.exclude_cache_table.create(conn, checkfirst=True)
+
+        def add_prune_state_table(conn: Connection) -> None:
+            with sqlalchemy_strict_sqlite():
+                self.prune_state_table.create(conn, checkfirst=True)
+
+        return [
+            add_crawl_ts_index,
+            add_zstd_dicts_table,
+            add_parse_cache_table,
+            add_watermarks_table,
+            add_watermarks_rate_column,
+            add_fields_columns,
+            add_exclude_cache_table,
+            add_prune_state_table,
+        ]
+
+    def _migrate(self) -> None:
+        migrations = self._migrations()
+        with self.engine.begin() as conn:
+            [(version,)] = conn.exec_driver_sql('PRAGMA user_version')
+            for target, migration in enumerate(migrations, start=1):
+                if version >= target:
+                    continue
+                self.logger.info(f'[{self.db_path}] migrating schema to version {target}: {migration.__name__}')
+                migration(conn)
+                # NOTE: can't use query parameters in pragmas
+                conn.exec_driver_sql(f'PRAGMA user_version={target}')
+                version = target
+
+    def _raw_connection(self) -> sqlite3.Connection:
+        # NOTE: separate connection, since engine connections are shared within a thread,
+        # so we can't use them while in the middle of iterating over another query
+        return sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, timeout=self.profile.busy_timeout)
+
+    def _load_dict(self, dict_id: int) -> bytes:
+        with closing(self._raw_connection()) as conn:
+            [(data,)] = conn.execute('SELECT data FROM zstd_dicts WHERE dict_id = ?', (dict_id,))
+        return data
+
+    def _current_dict_id(self) -> int | None:
+        with closing(self._raw_connection()) as conn:
+            [(has_table,)] = conn.execute("SELECT count(*) FROM sqlite_master WHERE name = 'zstd_dicts'")
+            if has_table == 0:
+                return None
+            res = conn.execute('SELECT dict_id FROM zstd_dicts ORDER BY id DESC LIMIT 1').fetchone()
+        return None if res is None else res[0]
+
+    def _has_table(self, conn: sqlite3.Connection, name: str) -> bool:
+        [(res,)] = conn.execute('SELECT count(*) FROM sqlite_master WHERE type = ? AND name = ?', ('table', name))
+        return res > 0
+
+    def _columns(self, conn: sqlite3.Connection, table: str) -> set[str]:
+        return {name for _, name, *_ in conn.execute(f'PRAGMA table_info({table})')}
+
+    def get_parsed(self, uids: Iterable[Uid], *, parser_version: int) -> tuple[dict[Uid, bytes], bool]:
+        """
+        Returns cached parsed objects for given uids (if present and parsed with the same parser version).
+        Second element is whether there are any cached objects from a different parser version.
+
+        Safe to use while iterating over select_all.
+        """
+        res: dict[Uid, bytes] = {}
+        stale = False
+        with closing(self._raw_connection()) as conn:
+            if not self._has_table(conn, 'parse_cache'):
+                # old database, or wasn't opened in writable mode yet
+                return res, stale
+            for chunk in chunked(uids, 500):
+                query = f'SELECT uid, parser_version, data FROM parse_cache WHERE uid IN ({",".join("?" * len(chunk))})'
+                for uid, version, data in conn.execute(query, chunk):
+                    if version == parser_version:
+                        res[make_uid(uid)] = data
+                    else:
+                        stale = True
+        return res, stale
+
+    def put_parsed(self, items: Iterable[tuple[Uid, bytes]], *, parser_version: int, purge_stale: bool = False) -> int:
+        """
+        Caches parsed objects, replacing whatever was cached for these uids.
+        purge_stale: also remove objects cached by a different parser version
+        """
+        table = self.parse_cache_table
+        upsert = sqlite_insert(table)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[table.c.uid],
+            set_={'parser_version': upsert.excluded.parser_version, 'data': upsert.excluded.data},
+        )
+        total = 0
+        with self.engine.begin() as conn:
+            if purge_stale:
+                res = conn.execute(table.delete().where(table.c.parser_version != parser_version))
+                self.logger.info(f'[{self.db_path}] parser version changed, purged {res.rowcount} cached items')
+            for chunk in chunked(items, INSERT_CHUNK_SIZE):
+                conn.execute(
+                    upsert,
+                    [{'uid': uid, 'parser_version': parser_version, 'data': data} for uid, data in chunk],
+                )
+                total += len(chunk)
+        return total
+
+    def get_verdicts(self, hashes: Iterable[bytes], *, fingerprint: str) -> tuple[dict[bytes, bool], bool]:
+        """
+        Returns cached exclusion results for given content hashes (if cached with the same fingerprint).
+        Second element is whether there are any results cached with a different fingerprint.
+
+        Safe to use while iterating over select_all.
+        """
+        res: dict[bytes, bool] = {}
+        stale = False
+        with closing(self._raw_connection()) as conn:
+            if not self._has_table(conn, 'exclude_cache'):
+                return res, stale
+            for chunk in chunked(hashes, 500):
+                query = f'SELECT hash, fingerprint, excluded FROM exclude_cache WHERE hash IN ({",".join("?" * len(chunk))})'
+                for h, fp, excluded in conn.execute(query, chunk):
+                    if fp == fingerprint:
+                        res[h] = bool(excluded)
+                    else:
+                        stale = True
+        return res, stale
+
+    def put_verdicts(self, items: Iterable[tuple[bytes, bool]], *, fingerprint: str, purge_stale: bool = False) -> int:
+        """
+        Caches exclusion results for content hashes.
+        purge_stale: remove everything cached with a different fingerprint (i.e. exclusion config changed)
+        """
+        table = self.exclude_cache_table
+        upsert = sqlite_insert(table)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[table.c.hash],
+            set_={'fingerprint': upsert.excluded.fingerprint, 'excluded': upsert.excluded.excluded},
+        )
+        total = 0
+        with self.engine.begin() as conn:
+            if purge_stale:
+                res = conn.execute(table.delete().where(table.c.fingerprint != fingerprint))
+                self.logger.info(f'[{self.db_path}] exclusion config changed, purged {res.rowcount} cached results')
+            for chunk in chunked(items, INSERT_CHUNK_SIZE):
+                conn.execute(
+                    upsert,
+                    [{'hash': h, 'fingerprint': fingerprint, 'excluded': int(excluded)} for h, excluded in chunk],
+                )
+                total += len(chunk)
+        return total
+
+    def uid_lookup(self) -> 'UidLookup':
+        """
+        Safe to use from other threads, while iterating over select_all, and after the database is closed.
+        """
+        return UidLookup(self._raw_connection)
+
+    def get_watermarks(self) -> dict[str, Watermark]:
+        with closing(self._raw_connection()) as conn:
+            if not self._has_table(conn, 'watermarks'):
+                return {}
+            # old database, or wasn't opened in writable mode yet
+            rate = 'new_per_day' if 'new_per_day' in self._columns(conn, 'watermarks') else 'NULL'
+            rows = conn.execute(f'SELECT query, last_crawl_utc, last_full_crawl_utc, {rate} FROM watermarks').fetchall()
+        return {
+            query: Watermark(last_crawl_utc=last, last_full_crawl_utc=last_full, new_per_day=new_per_day)
+            for query, last, last_full, new_per_day in rows
+        }
+
+    def set_watermarks(
+        self,
+        completed: Mapping[str, bool],
+        *,
+        crawl_dt: CrawlDt,
+        rates: Mapping[str, float | None] | None = None,
+    ) -> None:
+        """
+        completed: query -> whether it was crawled in full
+        rates: query -> new items per day, see core.adaptive
+        """
+        table = self.watermarks_table
+        ts = int(crawl_dt.timestamp())
+        rates = rates or {}
+        with self.engine.begin() as conn:
+            for query, full in completed.items():
+                upsert = sqlite_insert(table).values(
+                    query=query,
+                    last_crawl_utc=ts,
+                    last_full_crawl_utc=ts if full else None,
+                    new_per_day=rates.get(query),
+                )
+                set_ = {'last_crawl_utc': upsert.excluded.last_crawl_utc}
+                if query in rates:
+                    set_['new_per_day'] = upsert.excluded.new_per_day
+                if full:
+                    set_['last_full_crawl_utc'] = upsert.excluded.last_full_crawl_utc
+                conn.execute(upsert.on_conflict_do_update(index_elements=[table.c.query], set_=set_))
+
+    def _row(self, row) -> tuple[int, Uid, bytes]:
+        ts, uid, data = row
+        # just in case
+        assert isinstance(ts, int), row
+        assert isinstance(uid, str), row
+        assert isinstance(data, bytes), row
+        return ts, make_uid(uid), self.codec.decompress(data)
+
     def select_all(self) -> Iterator[tuple[int, Uid, bytes]]:
-        # TODO double check that simultaneous write and read work
+        # NOTE: rows are read lazily within a single statement, so we see a consistent snapshot
+        # however in rollback journal mode this keeps the writers from committing until we're done
+        # use WAL_PROFILE if you want to read while crawling
         query = self.results_table.select().order_by(Columns.CRAWL_TIMESTAMP_UTC, Columns.UID)
+        total = 0
         with self.engine.connect() as conn:
-            total_query = select(func.count()).select_from(self.results_table)
-            [(total,)] = list(conn.execute(total_query))
-            self.logger.info(f'total db items: {total}')
-
             for row in conn.execute(query):
-                ts, uid, data = row
-                # just in case
-                assert isinstance(ts, int), row
-                assert isinstance(uid, str), row
-                assert isinstance(data, bytes), row
-                yield ts, make_uid(uid), data
-
-    def delete(
+                total += 1
+                yield self._row(row)
+        self.logger.info(f'total db items: {total}')
+
+    def select_since(self, crawl_ts: int, uid: str, *, limit: int) -> list[tuple[int, Uid, bytes]]:
+        """
+        Returns up to limit items strictly after (crawl_ts, uid), in the same order as select_all.
+
+        To page through, pass timestamp and uid of the last returned item as the next cursor.
+        Uses crawl timestamp index, so each page is cheap regardless of the table size.
+        """
+        c = self.results_table.c
+        query = (
+            self.results_table.select()
+            .where(sqlalchemy.tuple_(c[Columns.CRAWL_TIMESTAMP_UTC], c[Columns.UID]) > (crawl_ts, uid))
+            .order_by(Columns.CRAWL_TIMESTAMP_UTC, Columns.UID)
+            .limit(limit)
+        )
+        with self.engine.connect() as conn:
+            return [self._row(row) for row in conn.execute(query)]
+
+    def select_uids(self, uids: Iterable[Uid]) -> list[tuple[int, Uid, bytes]]:
+        uid_column = self.results_table.c[Columns.UID]
+        res: list[tuple[int, Uid, bytes]] = []
+        with self.engine.connect() as conn:
+            for chunk in chunked(uids, INSERT_CHUNK_SIZE):
+                query = self.results_table.select().where(uid_column.in_(chunk))
+                res.extend(self._row(row) for row in conn.execute(query))
+        return res
+
+    def has_fields(self) -> bool:
+        """
+        Whether the database has columns for extracted fields (i.e. was opened in writable mode by a recent version)
+        """
+        with closing(self._raw_connection()) as conn:
+            return 'fields_version' in self._columns(conn, 'results')
+
+    def _update_fields(self, conn: Connection, items: Iterable[tuple[Uid, Fields | None]], *, version: int) -> int:
+        rows = [(*(Fields() if f is None else f).columns(), version, uid) for uid, f in items]
+        conn.exec_driver_sql(
+            'UPDATE results SET created_utc = ?, author = ?, kind = ?, extra = ?, fields_version = ? WHERE uid = ?',
+            rows,
+        )
+        return len(rows)
+
+    def put_fields(self, items: Iterable[tuple[Uid, Fields | None]], *, version: int) -> int:
+        """
+        Sets extracted fields for items (None means nothing could be extracted)
+        """
+        total = 0
+        with self.engine.begin() as conn:
+            for chunk in chunked(items, INSERT_CHUNK_SIZE):
+                total += self._update_fields(conn, chunk, version=version)
+        return total
+
+    def select_fields_pending(self, *, version: int, limit: int) -> list[tuple[int, Uid, bytes]]:
+        """
+        Returns up to limit items which don't have fields extracted by this version yet, in crawl order.
+        """
+        # NOTE: versions only go up, written this way so it can use the index
+        query = f"""
+        SELECT {Columns.CRAWL_TIMESTAMP_UTC}, {Columns.UID}, {Columns.DATA} FROM results
+        WHERE fields_version IS NULL OR fields_version < ?
+        ORDER BY {Columns.CRAWL_TIMESTAMP_UTC}, {Columns.UID}
+        LIMIT ?
+        """
+        with self.engine.connect() as conn:
+            return [self._row(row) for row in conn.exec_driver_sql(query, (version, limit))]
+
+    def select_where(
         self,
+        where: Where | None,
         *,
-        dry: bool,
-        predicate: Callable[[bytes], bool],
+        order: Order,
+        since_ts: int | None = None,
+        exclude: Sql | None = None,
     ) -> Iterator[tuple[int, Uid, bytes]]:
-        # fmt: off
-        select_query = self.results_table.select().where(func.predicate(self.results_table.c.data))
-        delete_query = self.results_table.delete().where(func.predicate(self.results_table.c.data))
-        # fmt: on
+        """
+        Same as select_all, but filtered and ordered by extracted fields, see core.fields.
+        Only returns items which had their fields extracted.
+
+        exclude: items matching this condition aren't returned, see core.rules
+        """
+        cond, params = (Where() if where is None else where).sql()
+        if since_ts is not None:
+            cond += f' AND {Columns.CRAWL_TIMESTAMP_UTC} >= ?'
+            params.append(since_ts)
+        if exclude is not None:
+            exclude_cond, exclude_params = exclude
+            cond += f' AND ({exclude_cond}) IS NOT 1'
+            params.extend(exclude_params)
+        cond += ' AND fields_version IS NOT NULL'
+        select = f'SELECT {Columns.CRAWL_TIMESTAMP_UTC}, {Columns.UID}, {Columns.DATA} FROM results'
+        crawl_order = f'{Columns.CRAWL_TIMESTAMP_UTC}, {Columns.UID}'
+        queries: list[str]
+        if order == 'crawl':
+            queries = [f'{select} WHERE {cond} ORDER BY {crawl_order}']
+        else:
+            # NOTE: not using 'ORDER BY created_utc IS NULL', that way it can't use the index
+            queries = [
+                f'{select} WHERE {cond} AND created_utc IS NOT NULL ORDER BY created_utc, {crawl_order}',
+                f'{select} WHERE {cond} AND created_utc IS NULL ORDER BY {crawl_order}',
+            ]
+        total = 0
+        with self.engine.connect() as conn:
+            for query in queries:
+                for row in conn.exec_driver_sql(query, tuple(params)):
+                    total += 1
+                    yield self._row(row)
+        self.logger.info(f'total selected db items: {total}')
+
+    def has_fts(self) -> bool:
+        with closing(self._raw_connection()) as conn:
+            return self._has_table(conn, 'fts')
+
+    def fts_cursor(self) -> tuple[int, str]:
+        """
+        (crawl timestamp, uid) of the last indexed item, items are indexed in the same order as select_all
+        """
+        with closing(self._raw_connection()) as conn:
+            if not self._has_table(conn, 'fts_state'):
+                return (-1, '')
+            row = conn.execute('SELECT crawl_ts, uid FROM fts_state').fetchone()
+        return (-1, '') if row is None else (row[0], row[1])
+
+    def put_fts(self, items: Iterable[tuple[Uid, str, str]], *, cursor: tuple[int, str]) -> int:
+        """
+        Adds (uid, title, body) to the full-text index (replacing what was indexed for the uid before),
+        and moves the cursor. Creates the index if it doesn't exist.
+        """
+        total = 0
         with self.engine.begin() as conn:
-            dbapi_connection = conn.connection  # meh
-            dbapi_connection.create_function("predicate", 1, predicate)
-            to_prune = list(conn.execute(select_query))
-            if not dry:
-                res = conn.execute(delete_query)
-                deleted = res.rowcount
-                assert deleted == len(to_prune), (deleted, len(to_prune))  # just in case
-        for row in to_prune:
-            ts, uid, data = row
-            yield ts, make_uid(uid), data
+            # NOTE: fts rowid refers to fts_docs, since rowids of results might change after VACUUM
+            conn.exec_driver_sql(
+                'CREATE TABLE IF NOT EXISTS fts_docs (id INTEGER PRIMARY KEY, uid TEXT NOT NULL UNIQUE) STRICT'
+            )
+            conn.exec_driver_sql(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5(title, body, tokenize='porter unicode61 remove_diacritics 2')"
+            )
+            conn.exec_driver_sql(
+                'CREATE TABLE IF NOT EXISTS fts_state (id INTEGER PRIMARY KEY CHECK (id = 0), crawl_ts INTEGER NOT NULL, uid TEXT NOT NULL) STRICT'
+            )
+            for chunk in chunked(items, INSERT_CHUNK_SIZE):
+                uids = tuple(uid for uid, _, _ in chunk)
+                placeholders = ','.join('?' * len(uids))
+                conn.exec_driver_sql(
+                    f'DELETE FROM fts WHERE rowid IN (SELECT id FROM fts_docs WHERE uid IN ({placeholders}))', uids
+                )
+                conn.exec_driver_sql('INSERT OR IGNORE INTO fts_docs (uid) VALUES (?)', [(uid,) for uid in uids])
+                conn.exec_driver_sql(
+                    'INSERT INTO fts (rowid, title, body) SELECT id, ?, ? FROM fts_docs WHERE uid = ?',
+                    [(title, body, uid) for uid, title, body in chunk],
+                )
+                total += len(chunk)
+            conn.exec_driver_sql('INSERT OR REPLACE INTO fts_state (id, crawl_ts, uid) VALUES (0, ?, ?)', cursor)
+        return total
+
+    def drop_fts(self) -> None:
+        with self.engine.begin() as conn:
+            for table in ['fts', 'fts_docs', 'fts_state']:
+                conn.exec_driver_sql(f'DROP TABLE IF EXISTS {table}')
+
+    def fts_search(self, query: str, *, limit: int, offset: int = 0) -> list[tuple[Uid, float, str, str]]:
+        """
+        Returns (uid, rank, title, snippet) for best matches, query uses FTS5 syntax.
+
+        Raises QueryError if the query isn't valid FTS5 syntax.
+        """
+        with closing(self._raw_connection()) as conn:
+            if not self._has_table(conn, 'fts'):
+                return []
+            try:
+                rows = conn.execute(
+                    """
+                    SELECT d.uid, bm25(fts, 5.0, 1.0) AS rank, fts.title, snippet(fts, -1, '[', ']', '...', 16)
+                    FROM fts JOIN fts_docs AS d ON d.id = fts.rowid
+                    WHERE fts MATCH ?
+                    ORDER BY rank
+                    LIMIT ? OFFSET ?
+                    """,
+                    (query, limit, offset),
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                # e.g. 'node.js' -> 'fts5: syntax error near "."', 'foo-bar' -> 'no such column: bar'
+                if str(e).startswith(('fts5:', 'no such column', 'unknown special query')):
+                    raise QueryError(f'{query!r}: {e}') from e
+                raise
+        return [(make_uid(uid), rank, title, snippet) for uid, rank, title, snippet in rows]
+
+    def select_page(
+        self,
+        crawl_ts: int,
+        uid: str,
+        *,
+        limit: int,
+        exclude: Sql | None = None,
+    ) -> list[tuple[int, Uid, bytes, bool]]:
+        """
+        Same as select_since, but also returns whether each item matches the exclude condition (see core.rules)
+        """
+        flag, params = '0', []
+        if exclude is not None:
+            exclude_cond, exclude_params = exclude
+            flag = f'({exclude_cond}) IS 1'
+            params.extend(exclude_params)
+        query = f"""
+        SELECT {Columns.CRAWL_TIMESTAMP_UTC}, {Columns.UID}, {Columns.DATA}, {flag} FROM results
+        WHERE ({Columns.CRAWL_TIMESTAMP_UTC}, {Columns.UID}) > (?, ?)
+        ORDER BY {Columns.CRAWL_TIMESTAMP_UTC}, {Columns.UID}
+        LIMIT ?
+        """
+        with self.engine.connect() as conn:
+            rows = conn.exec_driver_sql(query, (*params, crawl_ts, uid, limit))
+            return [(*self._row(row[:3]), bool(row[3])) for row in rows]
+
+    def get_prune_state(self) -> tuple[tuple[int, str], str] | None:
+        """
+        (crawl timestamp, uid) of the last item checked by prune, and exclude fingerprint it was checked with
+        """
+        with closing(self._raw_connection()) as conn:
+            if not self._has_table(conn, 'prune_state'):
+                return None
+            row = conn.execute('SELECT crawl_ts, uid, fingerprint FROM prune_state').fetchone()
+        if row is None:
+            return None
+        crawl_ts, uid, fingerprint = row
+        return (crawl_ts, uid), fingerprint
+
+    def prune(self, uids: Sequence[Uid], *, cursor: tuple[int, str], fingerprint: str) -> int:
+        """
+        Deletes items (along with anything derived from them), and moves prune cursor, in a single transaction
+        """
+        uid_column = self.results_table.c[Columns.UID]
+        deleted = 0
+        with self.engine.begin() as conn:
+            [(has_fts,)] = conn.exec_driver_sql("SELECT count(*) FROM sqlite_master WHERE name = 'fts'")
+            for chunk in chunked(uids, INSERT_CHUNK_SIZE):
+                res = conn.execute(self.results_table.delete().where(uid_column.in_(chunk)))
+                deleted += res.rowcount
+                # writable database always has this table (created during migration)
+                conn.execute(self.parse_cache_table.delete().where(self.parse_cache_table.c.uid.in_(chunk)))
+                if has_fts > 0:
+                    placeholders = ','.join('?' * len(chunk))
+                    conn.exec_driver_sql(
+                        f'DELETE FROM fts WHERE rowid IN (SELECT id FROM fts_docs WHERE uid IN ({placeholders}))',
+                        tuple(chunk),
+                    )
+                    conn.exec_driver_sql(f'DELETE FROM fts_docs WHERE uid IN ({placeholders})', tuple(chunk))
+            assert deleted == len(uids), (deleted, len(uids))  # just in case
+            crawl_ts, uid = cursor
+            table = self.prune_state_table
+            upsert = sqlite_insert(table).values(id=0, crawl_ts=crawl_ts, uid=uid, fingerprint=fingerprint)
+            conn.execute(
+                upsert.on_conflict_do_update(
+                    index_elements=[table.c.id],
+                    set_={'crawl_ts': crawl_ts, 'uid': uid, 'fingerprint': fingerprint},
+                )
+            )
+        return deleted
+
+    def drop_excluded_verdicts(self) -> None:
+        # excluded items are gone after prune, so no point keeping results for them
+        with self.engine.begin() as conn:
+            conn.execute(self.exclude_cache_table.delete().where(self.exclude_cache_table.c.excluded == 1))
 
     def _insert(
         self,
         items: Iterable[tuple[CrawlDt, Uid, bytes]],
         *,
         dry: bool,
+        chunk_size: int = INSERT_CHUNK_SIZE,
+        extractor: Extractor | None = None,
     ) -> Iterator[tuple[CrawlDt, Uid, bytes]]:
-        new = 0
-        exist = 0
-        with self.engine.begin() as conn:
-            uids_in_db = {uid for (uid,) in conn.execute(select(self.results_table.c[Columns.UID]))}
-            seen = set()
-            for_db = []
+        uid_column = self.results_table.c[Columns.UID]
+        # NOTE: we let sqlite check which uids are already present
+        # loading all uids from the db into memory would be O(table size) on every insert
+        # also RETURNING clause lets us know which items were actually inserted
+        insert_query = (
+            sqlite_insert(self.results_table)
+            .on_conflict_do_nothing(index_elements=[uid_column])
+            .returning(uid_column)
+            .execution_options(insertmanyvalues_page_size=chunk_size)
+        )
+
+        seen: set[Uid] = set()
+
+        def checked() -> Iterator[tuple[CrawlDt, Uid, bytes]]:
             for crawl_dt, uid, jb in items:
                 # make sure we aren't passed down dupes from search
                 # (search is better suited to deal with them properly)
                 assert uid not in seen, (uid, jb)
                 seen.add(uid)
+                assert isinstance(jb, bytes), jb  # todo temporary for refactoring period
+                yield crawl_dt, uid, jb
 
-                if uid in uids_in_db:
-                    exist += 1
-                    continue
-
-                crawl_timestamp_utc = int(crawl_dt.timestamp())
+        compress = self.profile.compress or self._current_dict_id() is not None
+        encode = self.codec.compress if compress else lambda data: data
 
-                # todo store as jsonb? not sure if there is any benefit?
-                new += 1
-                assert isinstance(jb, bytes), jb  # todo temporary for refactoring period
-                for_db.append(
-                    {
-                        Columns.UID: uid,
-                        Columns.CRAWL_TIMESTAMP_UTC: crawl_timestamp_utc,
-                        Columns.DATA: jb,
-                    }
-                )
-            # todo old axol had batch insertion? (in 1000 items chunks)
-            # figure out whether I still need it (ideally via a test?)
-            if len(for_db) > 0:
-                if not dry:
-                    conn.execute(self.results_table.insert(), for_db)
+        total = 0
+        inserted: list[tuple[CrawlDt, Uid, bytes]] = []
+        start = time.perf_counter()
+        with self.engine.begin() as conn:
+            for chunk in chunked(checked(), chunk_size):
+                total += len(chunk)
+                new_uids: set[Uid]
+                if dry:
+                    # can't insert anything, so check for existing uids explicitly
+                    chunk_uids = [uid for _, uid, _ in chunk]
+                    existing_query = select(uid_column).where(uid_column.in_(chunk_uids))
+                    existing = {uid for (uid,) in conn.execute(existing_query)}
+                    new_uids = {uid for uid in chunk_uids if uid not in existing}
                 else:
-                    self.logger.warning(f'[{self.db_path}] dry mode, not updating the db')
+                    # todo store as jsonb? not sure if there is any benefit?
+                    for_db = [
+                        {
+                            Columns.UID: uid,
+                            Columns.CRAWL_TIMESTAMP_UTC: int(crawl_dt.timestamp()),
+                            Columns.DATA: encode(jb),
+                        }
+                        for crawl_dt, uid, jb in chunk
+                    ]
+                    new_uids = {uid for (uid,) in conn.execute(insert_query, for_db)}
+                    if extractor is not None:
+                        # NOTE: only extracting for new items, existing ones already have fields (or will be backfilled)
+                        extracted = [(uid, extractor.extract(uid, jb)) for _, uid, jb in chunk if uid in new_uids]
+                        self._update_fields(conn, extracted, version=extractor.version)
+                # NOTE: order of RETURNING rows isn't guaranteed, so preserving the original order here
+                inserted.extend(item for item in chunk if item[1] in new_uids)
 
-        total = exist + new
+        new = len(inserted)
+        exist = total - new
+        # NOTE: feed label comes from the caller, see metrics.labels
+        metrics.inc('axol_insert_seconds_total', time.perf_counter() - start)
+        metrics.inc('axol_insert_items_total', new, result='new')
+        metrics.inc('axol_insert_items_total', exist, result='existing')
+        if dry and new > 0:
+            self.logger.warning(f'[{self.db_path}] dry mode, not updating the db')
         self.logger.info(f'[{self.db_path}] stats -- {total} crawled, {exist} existed, {new} new')
 
-        for d in for_db:
-            uid = cast(Uid, d[Columns.UID])
-            jb = cast(bytes, d[Columns.DATA])
-            yield crawl_dt, uid, jb  # meh
+        yield from inserted
+
+    def recompress(
+        self,
+        *,
+        dict_size: int = 112640,  # zstd --train default
+        samples: int = 10_000,
+        chunk_size: int = INSERT_CHUNK_SIZE,
+        vacuum: bool = True,
+    ) -> tuple[int, int]:
+        """
+        Trains a new zstd dictionary on stored items and recompresses all items with it.
+        Afterwards new items are compressed with this dictionary as well.
+
+        Each chunk is recompressed in a separate transaction, so it's safe to interrupt.
+        Returns total size of the data column before and after.
+        """
+        import zstandard
+
+        def data_size() -> int:
+            with closing(self._raw_connection()) as conn:
+                [(size,)] = conn.execute('SELECT coalesce(sum(length(data)), 0) FROM results')
+            return size
+
+        size_before = data_size()
+
+        with closing(self._raw_connection()) as sqlite_conn:
+            query = 'SELECT data FROM results ORDER BY random() LIMIT ?'
+            sample_data = [self.codec.decompress(data) for (data,) in sqlite_conn.execute(query, (samples,))]
+
+        try:
+            dict_id, dict_data = train_dict(sample_data, dict_size=dict_size)
+        except zstandard.ZstdError as e:
+            # e.g. if there aren't enough samples
+            self.logger.warning(f'[{self.db_path}] failed to train dictionary, compressing without it: {e}')
+        else:
+            with self.engine.begin() as conn:
+                conn.execute(
+                    self.dicts_table.insert(),
+                    {'dict_id': dict_id, 'created_utc': int(datetime.now(tz=UTC).timestamp()), 'data': dict_data},
+                )
+            self.logger.info(f'[{self.db_path}] trained dictionary {dict_id} on {len(sample_data)} samples')
+        self.codec.reset()
+
+        last_rowid = -1
+        while True:
+            with self.engine.begin() as conn:
+                rows = list(
+                    conn.exec_driver_sql(
+                        'SELECT rowid, data FROM results WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                        (last_rowid, chunk_size),
+                    )
+                )
+                if len(rows) == 0:
+                    break
+                updates = [(self.codec.compress(self.codec.decompress(data)), rowid) for rowid, data in rows]
+                conn.exec_driver_sql('UPDATE results SET data = ? WHERE rowid = ?', updates)
+            last_rowid = rows[-1][0]
+
+        if vacuum:
+            # otherwise the file size stays the same
+            with closing(self.engine.raw_connection()) as raw:
+                raw.execute('VACUUM')
+
+        size_after = data_size()
+        self.logger.info(f'[{self.db_path}] recompressed: {size_before} -> {size_after} bytes')
+        return size_before, size_after
 
     def insert(
         self,
         results: Iterable[tuple[Uid, bytes]],
         *,
         dry: bool,
+        crawl_dt: CrawlDt | None = None,
+        chunk_size: int = INSERT_CHUNK_SIZE,
+        extractor: Extractor | None = None,
     ) -> Iterator[tuple[CrawlDt, Uid, bytes]]:
         """
         Yields actually inserted items, along with the crawl timestamp
+
+        crawl_dt: pass explicitly if you're inserting a single crawl in multiple chunks
+        chunk_size: number of rows per INSERT statement
+        extractor: if set, fields of new items are extracted and stored along with them, see core.fields
         """
-        now_dt = datetime.now(tz=UTC)
+        now_dt = datetime.now(tz=UTC) if crawl_dt is None else crawl_dt
         self.logger.info(f'[{self.db_path}] inserting crawled items, dt {now_dt}')
 
         items = ((now_dt, uid, jb) for uid, jb in results)
-        return self._insert(items, dry=dry)
+        return self._insert(items, dry=dry, chunk_size=chunk_size, extractor=extractor)
+
+
+# databases kept open between uses, see keep_open
+_open: dict[tuple[Path, bool, StorageProfile | None], Database] | None = None
+_open_lock = threading.Lock()
+
+
+@contextmanager
+def keep_open() -> Iterator[None]:
+    """
+    While in the context, open_database returns already open databases instead of opening them every time.
+    Useful for long running processes (e.g. crawl daemon), so each crawl doesn't have to reconnect/check migrations.
+    """
+    global _open
+    with _open_lock:
+        assert _open is None, 'keep_open is not reentrant'
+        _open = {}
+    try:
+        yield
+    finally:
+        with _open_lock:
+            opened = list(_open.values())
+            _open = None
+        for db in opened:
+            db.__exit__(None, None, None)
+
+
+def open_database(
+    db_path: Path,
+    *,
+    writable: bool = False,
+    logger=None,
+    profile: StorageProfile | None = None,
+) -> AbstractContextManager[Database]:
+    with _open_lock:
+        if _open is None:
+            return Database(db_path, writable=writable, logger=logger, profile=profile)
+        key = (db_path, writable, profile)
+        db = _open.get(key)
+        if db is None:
+            db = Database(db_path, writable=writable, logger=logger, profile=profile)
+            _open[key] = db
+        # NOTE: the database might be shared by feeds using the same db_path, so logging to the caller's logger
+        parent_logger = logger if logger is not None else main_logger
+        if db.logger is not parent_logger:
+            db = db.with_logger(parent_logger)
+        # NOTE: nullcontext so it's not closed after use
+        return nullcontext(db)
 
 
 def test_insert(tmp_path: Path) -> None:
@@ -262,3 +1086,332 @@ def test_insert_atomic(tmp_path: Path) -> None:
     # error during insertion should leave the db intact
     with Database(db_path, writable=False) as db:
         assert len(list(db.select_all())) == 10
+
+
+def test_insert_large_db(tmp_path: Path) -> None:
+    """
+    Inserting a handful of new items into a big table, see 'axol bench' for timings.
+
+    Set AXOL_BENCH_ROWS to run against a bigger table.
+    """
+    import os
+
+    rows = int(os.environ.get('AXOL_BENCH_ROWS', '2000'))
+    blob = b'x' * 200
+
+    db_path = tmp_path / 'db.sqlite'
+    with Database(db_path, writable=True) as db:
+        inserted = sum(1 for _ in db.insert(((make_uid(f'{i:09d}'), blob) for i in range(rows)), dry=False))
+        assert inserted == rows
+
+    def recrawl() -> Iterator[tuple[Uid, bytes]]:
+        # typical crawl: mostly items we've already seen, and a few new ones
+        for i in range(rows - 990, rows + 10):
+            yield make_uid(f'{i:09d}'), blob
+
+    for chunk_size in [100, INSERT_CHUNK_SIZE]:
+        with Database(db_path, writable=True) as db:
+            new = [uid for _, uid, _ in db.insert(recrawl(), dry=True, chunk_size=chunk_size)]
+            assert len(new) == 10
+            new = [uid for _, uid, _ in db.insert(recrawl(), dry=False, chunk_size=chunk_size)]
+            assert new == [f'{i:09d}' for i in range(rows, rows + 10)]
+        rows += 10
+
+
+def test_concurrent_select_insert(tmp_path: Path) -> None:
+    import threading
+
+    import pytest
+
+    db_path = tmp_path / 'db.sqlite'
+
+    def batch(b: int) -> Iterator[tuple[Uid, bytes]]:
+        for i in range(100):
+            yield make_uid(f'{b:03d}_{i:03d}'), b'whatever'
+
+    with Database(db_path, writable=True) as db:
+        list(db.insert(batch(0), dry=False))
+
+    impatient = StorageProfile(busy_timeout=0.1)
+
+    # in default (rollback journal) mode, an active reader prevents writer from committing
+    with Database(db_path) as reader, Database(db_path, writable=True, profile=impatient) as writer:
+        it = reader.select_all()
+        next(it)
+        with pytest.raises(sqlalchemy.exc.OperationalError, match='database is locked'):
+            list(writer.insert(batch(1), dry=False))
+        assert len(list(it)) == 99
+
+    # whereas in wal mode the writer can proceed, and reader keeps seeing a consistent snapshot
+    impatient_wal = StorageProfile(journal_mode='wal', busy_timeout=0.1)
+    with Database(db_path, writable=True, profile=WAL_PROFILE):
+        pass  # switch to wal
+    with (
+        Database(db_path, profile=WAL_PROFILE) as reader,
+        Database(db_path, writable=True, profile=impatient_wal) as writer,
+    ):
+        it = reader.select_all()
+        next(it)
+        assert len(list(writer.insert(batch(1), dry=False))) == 100
+        assert len(list(it)) == 99
+        assert len(list(reader.select_all())) == 200
+
+    # now hammer it from multiple threads
+    batches = range(2, 50)
+    errors: list[Exception] = []
+    done = threading.Event()
+    counts: list[int] = []
+
+    def write() -> None:
+        try:
+            with Database(db_path, writable=True, profile=WAL_PROFILE) as db:
+                for b in batches:
+                    list(db.insert(batch(b), dry=False))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def read() -> None:
+        try:
+            with Database(db_path, profile=WAL_PROFILE) as db:
+                while not done.is_set():
+                    counts.append(sum(1 for _ in db.select_all()))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write), *(threading.Thread(target=read) for _ in range(3))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert len(counts) > 0
+    # each insert is a single transaction, so readers should never see a partially inserted batch
+    assert all(c % 100 == 0 for c in counts), counts
+    with Database(db_path, profile=WAL_PROFILE) as db:
+        assert len(list(db.select_all())) == 100 * (2 + len(batches))
+
+
+def test_select_since(tmp_path: Path) -> None:
+    from datetime import timedelta
+
+    db_path = tmp_path / 'db.sqlite'
+    dt = datetime(2024, 1, 1, tzinfo=UTC)
+    with Database(db_path, writable=True) as db:
+        for day in range(3):
+            items = [(make_uid(f'{day}_{i:02d}'), b'whatever') for i in range(10)]
+            list(db.insert(items, dry=False, crawl_dt=dt + timedelta(days=day)))
+
+    with Database(db_path) as db:
+        expected = list(db.select_all())
+        assert len(expected) == 30
+
+        # page through in chunks that don't align with crawl timestamps
+        pages = []
+        cursor: tuple[int, str] = (0, '')
+        while len(page := db.select_since(*cursor, limit=7)) > 0:
+            pages.append(page)
+            ts, uid, _ = page[-1]
+            cursor = (ts, uid)
+        assert [len(p) for p in pages] == [7, 7, 7, 7, 2]
+        assert [x for p in pages for x in p] == expected
+
+        second_day = int((dt + timedelta(days=1)).timestamp())
+        assert [uid for _, uid, _ in db.select_since(second_day, '', limit=100)] == [uid for _, uid, _ in expected[10:]]
+
+        with db.engine.connect() as conn:
+            plan = str(
+                list(conn.exec_driver_sql('EXPLAIN QUERY PLAN SELECT * FROM results ORDER BY crawl_timestamp_utc, uid'))
+            )
+        assert 'USING INDEX results_crawl_ts_uid' in plan, plan
+
+
+def test_migrate_crawl_ts_index(tmp_path: Path) -> None:
+    db_path = tmp_path / 'db.sqlite'
+
+    # database as it was created by older versions, without the index
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            'CREATE TABLE results (crawl_timestamp_utc INTEGER NOT NULL, uid TEXT NOT NULL UNIQUE, data BLOB NOT NULL) STRICT'
+        )
+        conn.execute("INSERT INTO results VALUES (1, 'a', X'00')")
+    conn.close()
+
+    def indexes() -> set[str]:
+        with sqlite3.connect(db_path) as conn:
+            res = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        conn.close()
+        return res
+
+    # readonly access shouldn't modify the database
+    with Database(db_path) as db:
+        assert len(list(db.select_all())) == 1
+    assert 'results_crawl_ts_uid' not in indexes()
+
+    with Database(db_path, writable=True) as db:
+        assert len(list(db.select_all())) == 1
+    assert 'results_crawl_ts_uid' in indexes()
+
+
+def test_recompress(tmp_path: Path) -> None:
+    import pytest
+
+    pytest.importorskip('zstandard')
+
+    from .compression import is_compressed
+
+    db_path = tmp_path / 'db.sqlite'
+
+    def items(start: int, end: int) -> list[tuple[Uid, bytes]]:
+        return [
+            (make_uid(f'{i:05d}'), f'{{"id": {i}, "title": "item {i}", "author": "user{i % 13}"}}'.encode())
+            for i in range(start, end)
+        ]
+
+    def raw_data() -> list[bytes]:
+        with sqlite3.connect(db_path) as conn:
+            res = [data for (data,) in conn.execute('SELECT data FROM results ORDER BY uid')]
+        conn.close()
+        return res
+
+    with Database(db_path, writable=True) as db:
+        list(db.insert(items(0, 2000), dry=False))
+        expected = list(db.select_all())
+    assert not any(is_compressed(d) for d in raw_data())
+
+    with Database(db_path, writable=True) as db:
+        before, after = db.recompress(dict_size=4096, chunk_size=300)
+    assert after < before
+    assert all(is_compressed(d) for d in raw_data())
+
+    # decompression is transparent
+    with Database(db_path) as db:
+        assert list(db.select_all()) == expected
+        assert db.select_since(0, '', limit=5) == expected[:5]
+
+    # new items use the dictionary as well, even though compression isn't enabled in the profile
+    with Database(db_path, writable=True) as db:
+        inserted = list(db.insert(items(1990, 2010), dry=False))
+        assert [data for _, _, data in inserted] == [data for _, data in items(2000, 2010)]
+        page = db.select_page(-1, '', limit=10_000)
+        pruned = [uid for _, uid, data, _ in page if b'"user0"' in data]
+        assert len(pruned) > 0
+        db.prune(pruned, cursor=page[-1][:2], fingerprint='test')
+    assert all(is_compressed(d) for d in raw_data())
+
+    with Database(db_path) as db:
+        res = list(db.select_all())
+    assert len(res) == 2010 - len(pruned)
+    assert [data for _, _, data in res] == [data for _, data in items(0, 2010) if b'"user0"' not in data]
+
+
+def test_keep_open(tmp_path: Path) -> None:
+    db_path = tmp_path / 'db.sqlite'
+    with open_database(db_path, writable=True) as db1, open_database(db_path, writable=True) as db2:
+        assert db1 is not db2
+
+    with keep_open():
+        with open_database(db_path, writable=True) as db1:
+            list(db1.insert([(make_uid('a'), b'1')], dry=False))
+        with open_database(db_path, writable=True) as db2:
+            assert db2 is db1
+            assert db2.uid_lookup()(make_uid('a'))
+        with open_database(db_path) as db3:
+            assert db3 is not db1  # readonly
+
+        # same database, but logs are attributed to the feed using it
+        logger = main_logger.bind(feed='other')
+        with open_database(db_path, writable=True, logger=logger) as db4:
+            assert db4.logger is logger
+            assert db4.engine is db1.engine
+            assert db4.uid_lookup()(make_uid('a'))
+        with open_database(db_path, writable=True) as db5:
+            assert db5 is db1
+
+
+def test_uid_lookup(tmp_path: Path) -> None:
+    db_path = tmp_path / 'db.sqlite'
+    with Database(db_path, writable=True) as db:
+        list(db.insert([(make_uid('a'), b'1')], dry=False))
+        assert db.uid_lookup()(make_uid('a'))
+
+    connections = []
+
+    def connect() -> sqlite3.Connection:
+        conn = db._raw_connection()
+        connections.append(conn)
+        return conn
+
+    known = UidLookup(connect)
+    assert [known(make_uid(uid)) for uid in ['a', 'b', 'a']] == [True, False, True]
+    assert len(connections) == 1  # reused between calls
+
+    # other threads get their own connection
+    res = []
+    thread = threading.Thread(target=lambda: res.append(known(make_uid('a'))))
+    thread.start()
+    thread.join()
+    assert res == [True]
+    assert len(connections) == 2
+
+
+def test_migrate_watermarks_rate(tmp_path: Path) -> None:
+    from .incremental import Watermark
+
+    db_path = tmp_path / 'db.sqlite'
+    # watermarks table as it was created before rates were added
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            'CREATE TABLE results (crawl_timestamp_utc INTEGER NOT NULL, uid TEXT NOT NULL UNIQUE, data BLOB NOT NULL) STRICT'
+        )
+        conn.execute(
+            'CREATE TABLE watermarks (query TEXT NOT NULL PRIMARY KEY, last_crawl_utc INTEGER NOT NULL, last_full_crawl_utc INTEGER) STRICT'
+        )
+        conn.execute("INSERT INTO watermarks VALUES ('q', 10, 5)")
+        conn.execute('PRAGMA user_version=4')
+    conn.close()
+
+    with Database(db_path) as db:
+        assert db.get_watermarks() == {'q': Watermark(last_crawl_utc=10, last_full_crawl_utc=5)}
+
+    now = datetime.now(tz=UTC)
+    with Database(db_path, writable=True) as db:
+        db.set_watermarks({'q': False, 'r': True}, crawl_dt=now, rates={'q': 1.5})
+        wms = db.get_watermarks()
+    ts = int(now.timestamp())
+    assert wms == {
+        'q': Watermark(last_crawl_utc=ts, last_full_crawl_utc=5, new_per_day=1.5),
+        'r': Watermark(last_crawl_utc=ts, last_full_crawl_utc=ts),
+    }
+
+
+def test_migrate_fields(tmp_path: Path) -> None:
+    db_path = tmp_path / 'db.sqlite'
+    with Database(db_path, writable=True) as db:
+        list(db.insert([(make_uid('a'), b'{"a": 1}')], dry=False))
+    # as if created before fields columns were added
+    with sqlite3.connect(db_path) as conn:
+        for index in ['results_created_utc', 'results_author', 'results_kind', 'results_fields_version']:
+            conn.execute(f'DROP INDEX {index}')
+        for column in ['created_utc', 'author', 'kind', 'extra', 'fields_version']:
+            conn.execute(f'ALTER TABLE results DROP COLUMN {column}')
+        conn.execute('PRAGMA user_version=5')
+    conn.close()
+
+    with Database(db_path) as db:
+        assert not db.has_fields()
+
+    with Database(db_path, writable=True) as db:
+        assert db.has_fields()
+        [(_, uid, _)] = db.select_fields_pending(version=1, limit=10)
+        assert uid == 'a'
+        assert db.put_fields([(uid, Fields(author='me', extra={'tags': ['x']}))], version=1) == 1
+        assert db.select_fields_pending(version=1, limit=10) == []
+        assert [uid for _, uid, _ in db.select_where(Where(authors=['me']), order='created')] == ['a']
+        assert list(db.select_where(Where(authors=['you']), order='crawl')) == []
+    with sqlite3.connect(db_path) as conn:
+        [(extra,)] = conn.execute("SELECT json_extract(extra, '$.tags[0]') FROM results")
+    conn.close()
+    assert extra == 'x'
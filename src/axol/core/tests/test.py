@@ -1,12 +1,24 @@
+import copy
+import dataclasses
+import sqlite3
+import time
 from collections.abc import Callable, Iterator
 from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
 from pathlib import Path
+from typing import ClassVar
 
 import orjson
+import pytest
 
-from axol.core.common import Json, Uid
+from axol.core import metrics
+from axol.core.aio import Budget
+from axol.core.common import Json, Uid, make_uid
 from axol.core.feed import Feed as BaseFeed
 from axol.core.feed import SearchF
+from axol.core.fields import Fields, Where
+from axol.core.fts import Text
+from axol.core.incremental import Incremental
 from axol.core.query import Compilable
 
 
@@ -66,6 +78,23 @@ def make_feed(
     )
 
 
+@pytest.fixture(autouse=True)
+def _restore_feed_state() -> Iterator[None]:
+    """
+    Some test feeds below keep counters/results in class variables, so restoring them after each test.
+    Otherwise tests would depend on which tests ran before them.
+    """
+    feeds = [IncrementalFeed, OverlappingFeed, AdaptiveFeed, SharedFeed, CountingFeed, TextFeed, FieldsFeed]
+    saved = {cls: {k: copy.copy(v) for k, v in vars(cls).items() if isinstance(v, int | list)} for cls in feeds}
+    yield
+    for cls, state in saved.items():
+        for k, v in list(vars(cls).items()):
+            if isinstance(v, int | list) and k not in state:
+                delattr(cls, k)  # e.g. overridden version, should be inherited again
+        for k, v in state.items():
+            setattr(cls, k, copy.copy(v))
+
+
 def test_crawl(tmp_path: Path) -> None:
     feed = make_feed(tmp_path=tmp_path)
     crawled = list(feed.crawl())
@@ -75,6 +104,535 @@ def test_crawl(tmp_path: Path) -> None:
     assert len(data) == 100
 
 
+def test_feed_since(tmp_path: Path) -> None:
+    from datetime import timedelta
+
+    feed = make_feed(tmp_path=tmp_path)
+    list(feed.crawl())
+    [(crawl_dt, _, _), *_] = list(feed.feed())
+
+    assert len(list(feed.feed(since=crawl_dt))) == 100
+    assert len(list(feed.feed(since=crawl_dt + timedelta(seconds=1)))) == 0
+
+
+def test_crawl_streaming(tmp_path: Path) -> None:
+    feed = make_feed(tmp_path=tmp_path)
+    # each item is ~20 bytes, so this should result in multiple chunks
+    crawled = [x for x in feed.crawl(max_buffer_bytes=100) if not isinstance(x, Exception)]
+    assert len(crawled) == 100
+    # all chunks should share the same crawl timestamp
+    assert len({crawl_dt for crawl_dt, _, _ in crawled}) == 1
+
+    data = list(feed.feed())
+    assert len(data) == 100
+
+    crawled = list(feed.crawl(max_buffer_bytes=100))
+    assert len(crawled) == 0
+
+
+@dataclass
+class FlakyFeed(DummyFeed):
+    PREFIX = 'flaky'
+
+    @property
+    def search(self) -> SearchF:
+        def _search(query: SearchQuery, *, limit: int | None):
+            yield from list(super(FlakyFeed, self).search(query=query, limit=limit))[:50]
+            raise RuntimeError('BOOM')
+
+        return _search
+
+
+def test_crawl_streaming_error(tmp_path: Path) -> None:
+    feed = FlakyFeed.make(query_name='testing', queries=[Query('whatever')], db_path=tmp_path / 'test.sqlite')
+
+    # non-streaming crawl doesn't insert anything on error
+    [err] = list(feed.crawl())
+    assert isinstance(err, RuntimeError)
+    assert not feed.db_path.exists()
+
+    # whereas streaming crawl keeps chunks inserted before the error
+    crawled = list(feed.crawl(max_buffer_bytes=100))
+    err = crawled[-1]
+    assert isinstance(err, RuntimeError)
+    assert len(crawled) == 51
+
+    assert len(list(feed.feed())) == 50
+
+
+@dataclass
+class SlowFeed(DummyFeed):
+    PREFIX = 'slow'
+    SEARCH_BUDGET = Budget(concurrency=3)
+
+    @property
+    def search(self) -> SearchF:
+        def _search(query: SearchQuery, *, limit: int | None):
+            for i, res in enumerate(super(SlowFeed, self).search(query=query, limit=limit)):
+                if i % 20 == 0:
+                    time.sleep(0.05)  # simulate waiting between pages
+                yield res
+
+        return _search
+
+
+def test_crawl_concurrent(tmp_path: Path) -> None:
+    feed = SlowFeed.make(
+        query_name='testing',
+        queries=[Query(q) for q in ['a', 'b', 'c']],
+        db_path=tmp_path / 'test.sqlite',
+    )
+
+    start = time.monotonic()
+    # all queries return the same items, so should be deduplicated
+    crawled = [x for x in feed.crawl(concurrent=True) if not isinstance(x, Exception)]
+    elapsed = time.monotonic() - start
+    assert len(crawled) == 100
+    # sequential search would take 3 * 5 * 0.05 = 0.75s
+    assert elapsed < 0.6
+
+    assert [uid for _, uid, _ in feed.feed()] == sorted(uid for _, uid, _ in crawled)
+
+    feed = FlakyFeed.make(query_name='testing', queries=[Query('whatever')], db_path=tmp_path / 'flaky.sqlite')
+    [err] = list(feed.crawl(concurrent=True))
+    assert isinstance(err, RuntimeError)
+
+
+@dataclass
+class RequestingFeed(DummyFeed):
+    PREFIX = 'requesting'
+
+    @property
+    def search(self) -> SearchF:
+        def _search(query: SearchQuery, *, limit: int | None):
+            for i, res in enumerate(super(RequestingFeed, self).search(query=query, limit=limit)):
+                if i % 20 == 0:
+                    # pretend to fetch a page, like http clients do
+                    metrics.inc('axol_http_requests_total', host='example.com', status='200')
+                yield res
+
+        return _search
+
+
+@pytest.mark.parametrize('concurrent', [False, True])
+def test_crawl_metrics(tmp_path: Path, *, concurrent: bool) -> None:
+    metrics.reset()
+    feed = RequestingFeed.make(
+        query_name='testing',
+        queries=[Query(q) for q in ['a', 'b']],
+        db_path=tmp_path / 'test.sqlite',
+    )
+    list(feed.crawl(concurrent=concurrent))
+
+    counters = metrics.registry().counters
+    for q in ['a', 'b']:
+        lbls = (('feed', feed.name), ('query', repr(SearchQuery(query=q))))
+        assert counters[('axol_searches_total', lbls)] == 1
+        assert counters[('axol_search_results_total', lbls)] == 100
+        # labels from the search are picked up by requests made inside, even in other threads
+        http_lbls = tuple(sorted((*lbls, ('host', 'example.com'), ('status', '200'))))
+        assert counters[('axol_http_requests_total', http_lbls)] == 5
+    feed_lbls = (('feed', feed.name),)
+    assert counters[('axol_insert_items_total', (*feed_lbls, ('result', 'new')))] == 100
+    assert counters[('axol_parsed_items_total', feed_lbls)] == 100
+    assert ('axol_crawl_seconds_total', feed_lbls) in counters
+
+    prom = tmp_path / 'axol.prom'
+    metrics.write_prometheus(prom)
+    assert f'axol_insert_items_total{{feed="{feed.name}",result="new"}} 100\n' in prom.read_text()
+    assert list(tmp_path.glob('*.tmp')) == []
+
+
+def test_daemon(tmp_path: Path) -> None:
+    import threading
+    from datetime import timedelta
+
+    from axol.core import storage
+    from axol.core.daemon import Daemon, DaemonSettings, load_status
+
+    feeds = [
+        make_feed(tmp_path=tmp_path, query_name='a'),
+        make_feed(tmp_path=tmp_path, query_name='b'),
+        FlakyFeed.make(query_name='testing', queries=[Query('whatever')], db_path=tmp_path / 'flaky.sqlite'),
+    ]
+    settings = DaemonSettings(
+        every=timedelta(hours=1),
+        schedules={'dummy_b': timedelta(hours=2)},
+        retry_after=timedelta(seconds=0.1),
+    )
+    status_path = tmp_path / 'status.json'
+
+    def run_until(d: Daemon, done: Callable[[], bool]) -> None:
+        t = threading.Thread(target=d.run)
+        t.start()
+        deadline = time.monotonic() + 10
+        while not done() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        d.stop()
+        t.join()
+
+    d = Daemon(feeds, settings=settings, status_path=status_path)
+    with storage.keep_open():
+        run_until(d, lambda: d.status['flaky_testing'].failures >= 3)
+
+    a, b, flaky = (d.status[f.name] for f in feeds)
+    assert (a.crawls, a.last_new, a.last_error) == (1, 100, None)
+    assert (b.crawls, b.last_new, b.last_error) == (1, 100, None)
+    assert b.next_crawl - a.next_crawl > 3000  # different schedule
+    # feeds of the same provider aren't crawled at the same time
+    first, second = sorted([a, b], key=lambda st: st.last_crawl or 0)
+    assert first.last_crawl is not None
+    assert first.last_duration is not None
+    assert second.last_crawl is not None
+    assert first.last_crawl + first.last_duration <= second.last_crawl
+    # flaky feed doesn't affect others, and is retried sooner
+    assert flaky.crawls >= 3
+    assert 'BOOM' in str(flaky.last_error)
+
+    status = load_status(status_path)
+    assert status is not None
+    assert {st['name']: st['crawls'] for st in status['feeds']}['dummy_a'] == 1
+
+    # schedule is kept after restart
+    d = Daemon(feeds, settings=settings, status_path=status_path)
+    assert d.status['dummy_a'].next_crawl == a.next_crawl
+    run_until(d, lambda: d.status['flaky_testing'].crawls > flaky.crawls)
+    assert d.status['dummy_a'].crawls == 1
+
+
+@dataclass
+class IncrementalFeed(DummyFeed):
+    PREFIX = 'incremental'
+    INCREMENTAL = True
+    # newest items come first
+    total: ClassVar[int] = 100
+    fetched: ClassVar[int] = 0
+
+    @property
+    def search(self) -> SearchF:
+        def _search(query: SearchQuery, *, limit: int | None, incremental: Incremental | None = None):  # noqa: ARG001
+            stop = None if incremental is None else incremental.stopper()
+            for n, i in enumerate(reversed(range(IncrementalFeed.total))):
+                if limit is not None and n >= limit:
+                    return
+                IncrementalFeed.fetched += 1
+                uid = make_uid(f'{i:03d}')
+                if stop is not None and stop(uid):
+                    return
+                yield uid, orjson.dumps({'text': f'item {uid}'})
+
+        return _search
+
+
+def test_crawl_incremental(tmp_path: Path) -> None:
+    from datetime import timedelta
+
+    from axol.core.incremental import IncrementalSettings
+
+    feed = IncrementalFeed.make(query_name='testing', queries=[Query('whatever')], db_path=tmp_path / 'test.sqlite')
+    settings = IncrementalSettings(stop_after=5)
+
+    def crawl(settings: IncrementalSettings | None = settings) -> int:
+        IncrementalFeed.fetched = 0
+        return len([x for x in feed.crawl(incremental=settings) if not isinstance(x, Exception)])
+
+    # never crawled, so has to crawl in full
+    assert crawl() == 100
+    assert IncrementalFeed.fetched == 100
+
+    IncrementalFeed.total = 110
+    assert crawl() == 10
+    assert IncrementalFeed.fetched == 15
+
+    # full crawl still works as before
+    assert crawl(None) == 0
+    assert IncrementalFeed.fetched == 110
+
+    # full crawls are forced once in a while
+    assert crawl(IncrementalSettings(stop_after=5, full_every=timedelta(0))) == 0
+    assert IncrementalFeed.fetched == 110
+
+    # limited crawl doesn't count as full, but doesn't reset previous full crawl either
+    IncrementalFeed.total = 120
+    IncrementalFeed.fetched = 0
+    assert len(list(feed.crawl(limit=3, incremental=settings))) == 3
+    assert crawl() == 7
+    assert IncrementalFeed.fetched == 15
+
+    # streaming crawl keeps track of watermarks too
+    feed = dataclasses.replace(feed, db_path=tmp_path / 'streaming.sqlite')
+    assert len(list(feed.crawl(max_buffer_bytes=100, incremental=settings))) == 120
+    IncrementalFeed.fetched = 0
+    assert list(feed.crawl(max_buffer_bytes=100, incremental=settings)) == []
+    assert IncrementalFeed.fetched == 5
+
+
+@dataclass
+class OverlappingFeed(DummyFeed):
+    PREFIX = 'overlapping'
+    INCREMENTAL = True
+    # on the second round both queries get the same new items first, then 'b' gets some of its own
+    round: ClassVar[int] = 0
+    fetched: ClassVar[list[str]] = []
+
+    @property
+    def search(self) -> SearchF:
+        def _search(query: SearchQuery, *, limit: int | None, incremental: Incremental | None = None):  # noqa: ARG001
+            q = query.query
+            names = [f'{q}_old_{i}' for i in range(20)]
+            if OverlappingFeed.round > 0:
+                own = [f'{q}_new_{i}' for i in range(5)] if q == 'b' else []
+                names = [f'shared_{i}' for i in range(10)] + own + names
+            stop = None if incremental is None else incremental.stopper()
+            for name in names:
+                OverlappingFeed.fetched.append(name)
+                uid = make_uid(name)
+                if stop is not None and stop(uid):
+                    return
+                yield uid, orjson.dumps({'text': f'item {uid}'})
+
+        return _search
+
+
+def test_crawl_incremental_overlapping(tmp_path: Path) -> None:
+    from axol.core.incremental import IncrementalSettings
+
+    feed = OverlappingFeed.make(
+        query_name='testing', queries=[Query('a'), Query('b')], db_path=tmp_path / 'test.sqlite'
+    )
+    settings = IncrementalSettings(stop_after=5)
+    assert len(list(feed.crawl(max_buffer_bytes=100, incremental=settings))) == 40
+
+    # shared items are inserted while 'a' is searched, but they are still new for 'b'
+    OverlappingFeed.round = 1
+    OverlappingFeed.fetched = []
+    crawled = [x[1] for x in feed.crawl(max_buffer_bytes=100, incremental=settings) if not isinstance(x, Exception)]
+    assert sorted(crawled) == sorted([f'shared_{i}' for i in range(10)] + [f'b_new_{i}' for i in range(5)])
+    assert 'b_old_4' in OverlappingFeed.fetched
+    assert 'b_old_5' not in OverlappingFeed.fetched
+
+
+@dataclass
+class AdaptiveFeed(DummyFeed):
+    PREFIX = 'adaptive'
+    # 'hot' query gets 10 new items on every search, 'cold' one never gets anything new
+    searched: ClassVar[list[str]] = []
+    generation: ClassVar[int] = 0
+
+    @property
+    def search(self) -> SearchF:
+        def _search(query: SearchQuery, *, limit: int | None):  # noqa: ARG001
+            AdaptiveFeed.searched.append(query.query)
+            n = AdaptiveFeed.generation if query.query == 'hot' else 0
+            for i in range(10):
+                uid = make_uid(f'{query.query}_{n}_{i}')
+                yield uid, orjson.dumps({'text': f'item {uid}'})
+
+        return _search
+
+
+@pytest.mark.parametrize('concurrent', [False, True])
+def test_crawl_adaptive(tmp_path: Path, *, concurrent: bool) -> None:
+    from datetime import timedelta
+
+    from axol.core.adaptive import AdaptiveSettings
+
+    feed = AdaptiveFeed.make(
+        query_name='testing',
+        queries=[Query('hot'), Query('cold')],
+        db_path=tmp_path / 'test.sqlite',
+    )
+    adaptive = AdaptiveSettings(min_interval=timedelta(hours=1), max_interval=timedelta(days=7), target_new=1)
+
+    def crawl() -> list[str]:
+        AdaptiveFeed.searched.clear()
+        AdaptiveFeed.generation += 1
+        list(feed.crawl(adaptive=adaptive, concurrent=concurrent))
+        return sorted(AdaptiveFeed.searched)
+
+    def time_travel(hours: float) -> None:
+        with sqlite3.connect(feed.db_path) as conn:
+            conn.execute('UPDATE watermarks SET last_crawl_utc = last_crawl_utc - ?', (int(hours * 60 * 60),))
+        conn.close()
+
+    def rates() -> dict[str, float | None]:
+        return {k: wm.new_per_day for k, wm in feed.watermarks().items()}
+
+    # first crawl doesn't tell anything about the rate, and everything is crawled until then
+    assert crawl() == ['cold', 'hot']
+    assert set(rates().values()) == {None}
+    assert crawl() == []  # within min interval
+
+    time_travel(hours=24)
+    assert crawl() == ['cold', 'hot']
+    assert sorted(rate or 0 for rate in rates().values()) == [0, pytest.approx(10, rel=0.01)]  # new items per day
+
+    # hot query is due every 2.4 hours, cold one only once a week
+    time_travel(hours=3)
+    assert crawl() == ['hot']
+    assert feed.next_crawl(adaptive) < feed.next_crawl(dataclasses.replace(adaptive, target_new=100))
+
+
+@dataclass
+class SharedFeed(DummyFeed):
+    PREFIX = 'shared'
+    searched: ClassVar[list[str]] = []
+
+    @property
+    def search(self) -> SearchF:
+        def _search(query: SearchQuery, *, limit: int | None):
+            SharedFeed.searched.append(query.query)
+            yield from super(SharedFeed, self).search(query=query, limit=limit)
+
+        return _search
+
+
+def test_crawl_planner(tmp_path: Path) -> None:
+    from axol.core.planner import SearchPlanner
+
+    feed1 = SharedFeed.make(
+        query_name='one',
+        queries=[Query('a'), Query('b')],
+        db_path=tmp_path / 'one.sqlite',
+        exclude=lambda j: j['text'].endswith('0'),
+    )
+    feed2 = SharedFeed.make(
+        query_name='two',
+        queries=[Query('b'), Query('c')],
+        db_path=tmp_path / 'two.sqlite',
+    )
+    feeds = [feed1, feed2]
+    planner = SearchPlanner(feeds)
+    for feed in feeds:
+        list(feed.crawl(planner=planner))
+    assert sorted(SharedFeed.searched) == ['a', 'b', 'c']
+    assert planner.saved == 1
+
+    # each feed still gets its own exclude
+    assert len(list(feed1.feed())) == 90
+    assert len(list(feed2.feed())) == 100
+
+    # concurrent search goes through the planner as well
+    SharedFeed.searched.clear()
+    planner = SearchPlanner(feeds)
+    for feed in feeds:
+        list(feed.crawl(planner=planner, concurrent=True))
+    assert sorted(SharedFeed.searched) == ['a', 'b', 'c']
+
+
+def test_planner_search_error() -> None:
+    from axol.core.planner import SearchPlanner
+
+    class FailingFeed:
+        queries: ClassVar = [Query('a')]
+
+        def search(self, *, query: SearchQuery, limit: int | None) -> Iterator[tuple[Uid, bytes]]:  # noqa: ARG002
+            raise RuntimeError('BOOM')
+
+    feeds = [FailingFeed(), FailingFeed()]
+    planner = SearchPlanner(feeds)
+    for feed in feeds:
+        with pytest.raises(RuntimeError, match='BOOM'):
+            list(planner.search(feed, query=SearchQuery('a'), limit=None))
+    assert planner._pending[(FailingFeed, SearchQuery('a'))] == 0
+
+
+def test_storage_profile(tmp_path: Path) -> None:
+    from axol.core.storage import WAL_PROFILE
+
+    feed = make_feed(tmp_path=tmp_path)
+    feed = dataclasses.replace(feed, storage=WAL_PROFILE)
+    assert len(list(feed.crawl())) == 100
+
+    # should be able to read while crawl is writing
+    it = feed.feed()
+    next(it)
+    assert len(list(feed._insert([(make_uid('new_item'), b'{"text": "new"}')], dry=False))) == 1
+    assert len(list(it)) == 99
+
+    with sqlite3.connect(feed.db_path) as conn:
+        [(journal_mode,)] = conn.execute('PRAGMA journal_mode')
+    assert journal_mode == 'wal'
+
+
+@dataclass
+class CountingFeed(DummyFeed):
+    PREFIX = 'counting'
+    PARSER_VERSION = 1
+    parsed: ClassVar[int] = 0
+
+    def parse(self, data: bytes) -> Json:
+        type(self).parsed += 1
+        return super().parse(data)
+
+
+def test_parse_cache(tmp_path: Path) -> None:
+    from axol.core.storage import StorageProfile
+
+    feed = CountingFeed.make(
+        query_name='testing',
+        queries=[Query('whatever')],
+        db_path=tmp_path / 'test.sqlite',
+        storage=StorageProfile(parse_cache=True),
+    )
+
+    def parses(it) -> tuple[int, list]:
+        before = CountingFeed.parsed
+        res = [(uid, o) for _, uid, o in it]
+        return CountingFeed.parsed - before, res
+
+    # parsed items are cached while crawling
+    count, crawled = parses(feed.crawl())
+    assert count == 100
+    count, items = parses(feed.feed())
+    assert count == 0
+    assert items == crawled
+
+    # changing parser version invalidates the cache
+    CountingFeed.PARSER_VERSION = 2
+    try:
+        count, items = parses(feed.feed())
+        assert count == 100
+        assert items == crawled
+        count, _ = parses(feed.feed())
+        assert count == 0
+    finally:
+        CountingFeed.PARSER_VERSION = 1
+
+    # pruned items are removed from the cache too
+    feed = dataclasses.replace(feed, exclude_raw=lambda bs: b'00' in bs)
+    assert len(list(feed.prune_db())) == 10
+    with sqlite3.connect(feed.db_path) as conn:
+        [(cached,)] = conn.execute('SELECT count(*) FROM parse_cache')
+    conn.close()
+    assert cached == 90
+
+
+def test_parse_once(tmp_path: Path) -> None:
+    def exclude(o: Json) -> bool:
+        return '9' in o['text']
+
+    feed = CountingFeed.make(
+        query_name='testing',
+        queries=[Query('whatever')],
+        db_path=tmp_path / 'test.sqlite',
+        exclude=exclude,
+    )
+
+    def parses(it) -> tuple[int, int]:
+        before = CountingFeed.parsed
+        res = list(it)
+        return CountingFeed.parsed - before, len(res)
+
+    # objects parsed during exclusion are reused
+    assert parses(feed.crawl()) == (100, 81)
+    assert parses(feed.feed()) == (81, 81)
+
+    feed = dataclasses.replace(feed, exclude=lambda o: '8' in o['text'])
+    assert parses(feed.feed()) == (81, 64)
+    assert parses(feed.prune_db()) == (81, 17)
+
+
 def test_prune_db(tmp_path: Path) -> None:
     feed = make_feed(tmp_path=tmp_path)
     crawled = list(feed.crawl())
@@ -93,6 +651,285 @@ def test_prune_db(tmp_path: Path) -> None:
     assert len(items) == 90
 
 
+def test_prune_incremental(tmp_path: Path) -> None:
+    from axol.core.storage import Database
+
+    def make(exclude: Callable[[Json], bool] | None) -> CountingFeed:
+        return CountingFeed.make(
+            query_name='testing',
+            queries=[Query('whatever')],
+            db_path=tmp_path / 'test.sqlite',
+            exclude=exclude,
+        )
+
+    def prune(feed: CountingFeed, **kwargs) -> tuple[int, int]:
+        before = CountingFeed.parsed
+        pruned = len(list(feed.prune_db(**kwargs)))
+        return CountingFeed.parsed - before, pruned
+
+    assert len(list(make(None).crawl())) == 100
+    feed = make(lambda o: o['text'].endswith('9'))
+
+    # dry run doesn't remember anything
+    assert prune(feed, dry=True) == (100, 10)
+    assert prune(feed, dry=True, page_size=7) == (100, 10)
+    assert prune(feed, page_size=7) == (100, 10)
+    # nothing new since the previous prune
+    assert prune(feed) == (0, 0)
+    assert prune(feed, full=True) == (90, 0)
+
+    # only items crawled since then are checked
+    with Database(feed.db_path, writable=True) as db:
+        new = [(make_uid(f'new{i}'), orjson.dumps({'text': f'new {i}'})) for i in range(10)]
+        list(db.insert(new, dry=False, crawl_dt=datetime.now(tz=UTC) + timedelta(seconds=10)))
+    assert prune(feed) == (10, 1)
+    assert prune(feed) == (0, 0)
+
+    # changed exclusion rechecks everything
+    feed = make(lambda o: o['text'].endswith('8'))
+    assert prune(feed, workers=2) == (0, 11)  # parsed in worker processes, so not counted here
+    assert prune(feed) == (0, 0)
+    assert len(list(feed.feed())) == 88
+
+
+@dataclass
+class TextFeed(DummyFeed):
+    PREFIX = 'text'
+    words: ClassVar[list[str]] = ['apple', 'banana', 'cherry']
+
+    def text(self, o: Json) -> Text:
+        return Text(title=o['title'], body=o['text'])
+
+    @property
+    def search(self) -> SearchF:
+        def _search(query: SearchQuery, *, limit: int | None):  # noqa: ARG001
+            for i, word in enumerate(TextFeed.words):
+                j = {'title': f'about {word}', 'text': f'item {i} <b>mentions</b> {TextFeed.words[i - 1]}'}
+                yield make_uid(word), orjson.dumps(j)
+
+        return _search
+
+
+def test_fts(tmp_path: Path) -> None:
+    from axol.core.fts import QueryError, grep, terms
+
+    def make(**kwargs) -> TextFeed:
+        return TextFeed.make(
+            query_name='testing', queries=[Query('whatever')], db_path=tmp_path / 'test.sqlite', **kwargs
+        )
+
+    def uids(query: str, feed: TextFeed | None = None) -> list[str]:
+        return [m.uid for m in grep([feed or make()], query, limit=10)]
+
+    feed = make()
+    list(feed.crawl())
+    # no index unless created explicitly
+    assert feed.update_index() == 0
+    assert uids('apple') == []
+
+    assert feed.update_index(create=True) == 3
+    assert feed.update_index(create=True) == 0  # nothing new
+    # title is ranked higher
+    assert uids('apple') == ['apple', 'banana']
+    assert uids('mentions AND body:cherry') == ['apple']
+    assert uids('title:cherry') == ['cherry']
+    [m] = grep([feed], 'banana', limit=1)
+    assert m.title == 'about banana'
+
+    # punctuation isn't valid FTS5 syntax, unless quoted as plain terms
+    with pytest.raises(QueryError, match='syntax error'):
+        uids('banana.')
+    assert uids(terms('banana.')) == ['banana', 'cherry']
+
+    # crawl keeps the index up to date
+    TextFeed.words = [*TextFeed.words, 'durian']
+    try:
+        list(feed.crawl())
+    finally:
+        TextFeed.words = TextFeed.words[:-1]
+    assert uids('durian') == ['durian']
+
+    # excluded items aren't returned, and pruned items are removed from the index
+    excluding = make(exclude=lambda o: 'apple' in o['title'])
+    assert uids('apple', excluding) == ['banana']
+    # best match is excluded, but there are still enough results
+    assert [m.uid for m in grep([excluding], 'apple', limit=1)] == ['banana']
+    assert len(list(excluding.prune_db())) == 1
+    with feed._database() as db:
+        assert [uid for uid, _, _, _ in db.fts_search('apple', limit=10)] == ['banana']
+
+
+@dataclass
+class FieldsFeed(DummyFeed):
+    PREFIX = 'fields'
+    extracted: ClassVar[int] = 0
+    parsed: ClassVar[int] = 0
+
+    def parse(self, data: bytes) -> Json:
+        FieldsFeed.parsed += 1
+        return super().parse(data)
+
+    def fields(self, o: Json) -> Fields:
+        FieldsFeed.extracted += 1
+        created_at = None if o['ts'] is None else datetime.fromtimestamp(o['ts'], tz=UTC)
+        return Fields(created_at=created_at, author=o['author'], kind=o['kind'], extra={'tags': o['tags']})
+
+    @property
+    def search(self) -> SearchF:
+        def _search(query: SearchQuery, *, limit: int | None):  # noqa: ARG001
+            for i in range(6):
+                # older items are returned later, one has no timestamp
+                ts = None if i == 3 else 1000 - i * 100
+                j = {'ts': ts, 'author': 'ab'[i % 2], 'kind': 'story' if i < 2 else 'comment', 'tags': [f'tag{i}']}
+                yield make_uid(f'{i:03d}'), orjson.dumps(j)
+
+        return _search
+
+
+def test_fields(tmp_path: Path) -> None:
+    from axol.core.rules import Eq
+
+    feed = FieldsFeed.make(query_name='testing', queries=[Query('whatever')], db_path=tmp_path / 'test.sqlite')
+
+    def uids(**kwargs) -> list[str]:
+        return [uid for _, uid, _ in feed.feed(**kwargs)]
+
+    # as if crawled by an older version, without extracting fields
+    results = list(feed.search_all(limit=None))
+    list(feed._insert(results[:4], dry=False))
+    assert uids() == ['000', '001', '002', '003']
+
+    # reading doesn't backfill fields (so doesn't need a write lock), they are extracted in python instead
+    FieldsFeed.extracted = 0
+    assert uids(order='created') == ['002', '001', '000', '003']
+    assert uids(where=Where(kinds=['story'])) == ['000', '001']
+    assert FieldsFeed.extracted == 8
+    excluding = dataclasses.replace(feed, exclude_rules=Eq('author', 'a'))
+    assert [uid for _, uid, _ in excluding.feed()] == ['001', '003']
+    # neither does dry prune
+    assert [uid for _, uid, _ in excluding.prune_db(dry=True)] == ['000', '002']
+    assert feed._fields_pending()
+    FieldsFeed.extracted = 0
+    assert feed.update_fields() == 4
+
+    # new items get fields on insert, without the need for backfill
+    list(feed.crawl())
+    assert FieldsFeed.extracted == 6
+    assert uids(order='created') == ['005', '004', '002', '001', '000', '003']
+    assert uids(where=Where(kinds=['story'])) == ['000', '001']
+    assert uids(where=Where(authors=['b'], kinds=['comment']), order='created') == ['005', '003']
+    assert uids(where=Where(created_before=datetime.fromtimestamp(700, tz=UTC))) == ['004', '005']
+
+    # changed fields implementation, so everything is extracted again
+    FieldsFeed.FIELDS_VERSION = 2
+    try:
+        assert feed.update_fields() == 6
+    finally:
+        FieldsFeed.FIELDS_VERSION = 1
+
+    dummy = make_feed(tmp_path=tmp_path)
+    list(dummy.crawl())
+    with pytest.raises(RuntimeError, match="doesn't extract fields"):
+        list(dummy.feed(order='created'))
+
+
+def test_exclude_rules(tmp_path: Path) -> None:
+    from axol.core.rules import Eq, In, Or, Predicate, Regex
+
+    def make(rules) -> FieldsFeed:
+        return FieldsFeed.make(
+            query_name='testing', queries=[Query('whatever')], db_path=tmp_path / 'test.sqlite', exclude_rules=rules
+        )
+
+    def uids(feed: FieldsFeed) -> list[str]:
+        return [uid for _, uid, _ in feed.feed()]
+
+    list(make(None).crawl())
+
+    # excluded by the database, without parsing
+    FieldsFeed.parsed = 0
+    assert uids(make(Or(Eq('author', 'a'), In('tags', {'tag1', 'tag9'})))) == ['003', '005']
+    assert FieldsFeed.parsed == 2
+    assert uids(make(Regex('tags', r'[1-3]$'))) == ['000', '004', '005']
+
+    # predicate is evaluated in python, along with whatever can't be compiled
+    rules = Or(Eq('author', 'a'), Predicate(lambda o: o['kind'] == 'story'))
+    assert uids(make(rules)) == ['003', '005']
+
+    # same rules apply to search results during crawl
+    assert [uid for uid, _ in make(rules).search_all(limit=None)] == ['003', '005']
+
+    assert [uid for _, uid, _ in make(rules).prune_db(dry=True)] == ['000', '001', '002', '004']
+    assert uids(make(None)) == ['000', '001', '002', '003', '004', '005']
+    assert [uid for _, uid, _ in make(Eq('kind', 'story')).prune_db()] == ['000', '001']
+    assert len(list(make(rules).prune_db())) == 2
+    assert uids(make(None)) == ['003', '005']
+
+    with pytest.raises(AssertionError, match="doesn't support exclude_rules"):
+        DummyFeed.make(
+            query_name='testing',
+            queries=[Query('whatever')],
+            db_path=tmp_path / 'dummy.sqlite',
+            exclude_rules=Eq('author', 'a'),
+        )
+
+
+class Calls:
+    # NOTE: plain object, so it's described by identity and doesn't change exclude fingerprint within the test
+    def __init__(self) -> None:
+        self.n = 0
+
+
+def test_exclude_cache(tmp_path: Path) -> None:
+    from axol.core.storage import StorageProfile
+
+    calls = Calls()
+
+    def exclude(o: Json) -> bool:
+        calls.n += 1
+        return '00' in o['text']
+
+    def make(exclude, **kwargs) -> CountingFeed:
+        return CountingFeed.make(
+            query_name='testing',
+            queries=[Query('whatever')],
+            db_path=tmp_path / 'test.sqlite',
+            storage=StorageProfile(exclude_cache=True),
+            exclude=exclude,
+            **kwargs,
+        )
+
+    def read(feed: CountingFeed) -> tuple[int, int, int]:
+        calls.n = 0
+        before = CountingFeed.parsed
+        count = sum(1 for _ in feed.feed())
+        return count, calls.n, CountingFeed.parsed - before
+
+    list(make(None).crawl())
+
+    # first time everything is evaluated, then excluded items aren't even parsed
+    assert read(make(exclude)) == (90, 100, 100)
+    assert read(make(exclude)) == (90, 0, 90)
+
+    # different exclude function, so evaluated again
+    def other(o: Json) -> bool:
+        calls.n += 1
+        return o['text'].endswith('9')
+
+    assert read(make(other)) == (90, 100, 100)
+    assert read(make(other)) == (90, 0, 90)
+
+    # unless it has the same declared version
+    assert read(make(exclude, exclude_version=1)) == (90, 100, 100)
+    assert read(make(other, exclude_version=1)) == (90, 0, 90)
+
+    assert len(list(make(exclude, exclude_version=1).prune_db())) == 10
+    with sqlite3.connect(tmp_path / 'test.sqlite') as conn:
+        [(excluded,)] = conn.execute('SELECT count(*) FROM exclude_cache WHERE excluded = 1')
+    conn.close()
+    assert excluded == 0
+
+
 def test_search_excludes(tmp_path: Path) -> None:
     """
     If exclude is defined, search should respect it
@@ -206,3 +1043,68 @@ def test_parse_errors(tmp_path: Path) -> None:
     # make sure items are present in the db despite the errors during parsing
     db_items = [(uid, x) for _, uid, x in feed._select_all()]
     assert db_items == sorted([(str(i), str(i).encode('utf8')) for i in range(1, 100)])
+
+
+def test_feed_workers(tmp_path: Path) -> None:
+    feed = ErrorFeed.make(
+        query_name='testing',
+        queries=[Query('whatever')],
+        db_path=tmp_path / 'test.sqlite',
+        exclude=lambda x: x % 10 == 0,  # lambdas can't be pickled, but shouldn't get in the way
+    )
+    list(feed.crawl())
+
+    expected = list(feed.feed())
+    assert len(expected) == 90
+    for workers in [1, 3]:
+        res = list(feed.feed(workers=workers))
+        # order and exclusion should be same as for sequential parsing
+        assert [(uid, o) for _, uid, o in res if not isinstance(o, Exception)] == [
+            (uid, o) for _, uid, o in expected if not isinstance(o, Exception)
+        ]
+        errors = [o for _, _, o in res if isinstance(o, Exception)]
+        assert len(errors) == 10
+        assert all('^ while parsing' in e.__notes__[0] for e in errors)
+
+
+# modules loaded by any cli command (user config imports feed modules of all providers it uses)
+STARTUP_MODULES = [
+    'axol.core.__main__',
+    *(f'axol.modules.{m}.feed' for m in ['github', 'hackernews', 'lobsters', 'pinboard', 'reddit']),
+]
+# these should only be imported when they are actually needed
+HEAVY_MODULES = {'sqlalchemy', 'bs4', 'loguru', 'asyncio', 'github', 'praw', 'requests', 'html2text', 'zstandard'}
+# timings depend too much on the machine, so only checked if AXOL_CHECK_STARTUP_TIME=1
+STARTUP_BUDGET_S = 0.3
+
+
+def test_import_time() -> None:
+    import os
+    import subprocess
+    import sys
+
+    def run() -> dict[str, int]:
+        res = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {", ".join(STARTUP_MODULES)}'],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        # lines look like 'import time:       self [us] |  cumulative | imported package'
+        cumulative: dict[str, int] = {}
+        for line in res.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cum, name = line.removeprefix('import time:').split('|')
+            cumulative[name.strip()] = int(cum)
+        return cumulative
+
+    imported = run()
+    assert HEAVY_MODULES & imported.keys() == set()
+
+    if os.environ.get('AXOL_CHECK_STARTUP_TIME') != '1':
+        return
+    # first run might include compiling bytecode, and timings are noisy in general
+    runs = [imported, *(run() for _ in range(2))]
+    took = min(sum(r[m] for m in STARTUP_MODULES) for r in runs) / 1_000_000
+    assert took < STARTUP_BUDGET_S, f'startup imports took {took:.3f}s'
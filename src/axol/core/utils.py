@@ -1,4 +1,7 @@
+import os
+from collections.abc import Callable, Iterable, Iterator
 from contextlib import contextmanager
+from pathlib import Path
 
 
 @contextmanager
@@ -18,3 +21,39 @@ def sqlalchemy_strict_sqlite():
         @compiles(CreateTable, "sqlite")
         def tables_are_strict(create_table, compiler, **kw):
             return compiler.visit_create_table(create_table, **kw)
+
+
+def chunked_by_size[T](items: Iterable[T], *, max_bytes: int, size: Callable[[T], int]) -> Iterator[list[T]]:
+    """
+    Like more_itertools.chunked, but chunks are bounded by total size rather than count.
+    Each chunk contains at least one item, even if it exceeds max_bytes on its own.
+    """
+    assert max_bytes > 0, max_bytes
+    chunk: list[T] = []
+    chunk_bytes = 0
+    for item in items:
+        item_bytes = size(item)
+        if len(chunk) > 0 and chunk_bytes + item_bytes > max_bytes:
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(item)
+        chunk_bytes += item_bytes
+    if len(chunk) > 0:
+        yield chunk
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """
+    Writes via a temporary file, so readers never see a partially written file
+    """
+    tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+    tmp.write_bytes(data)
+    tmp.replace(path)
+
+
+def test_chunked_by_size() -> None:
+    chunks = list(chunked_by_size([b'aa', b'bbb', b'c', b'dddddd', b'e'], max_bytes=4, size=len))
+    assert chunks == [[b'aa'], [b'bbb', b'c'], [b'dddddd'], [b'e']]
+
+    assert list(chunked_by_size([], max_bytes=4, size=len)) == []
@@ -1,10 +1,13 @@
 from collections.abc import Sequence
 from dataclasses import dataclass
 from datetime import datetime
+from typing import assert_never
 
 import orjson
 
 from axol.core.common import _check, datetime_aware
+from axol.core.fields import Fields
+from axol.core.fts import Text, join
 
 
 @dataclass(unsafe_hash=True)
@@ -49,6 +52,37 @@ class Repository(Base):
 Model = Code | Commit | Issue | Repository
 
 
+PARSER_VERSION = 1
+
+
+def text(o: Model) -> Text:
+    if isinstance(o, Code):
+        return Text(title=o.path, body=o.repo)
+    elif isinstance(o, Commit):
+        return Text(title='', body=o.message)
+    elif isinstance(o, Issue):
+        return Text(title=o.title, body=join(o.body))
+    elif isinstance(o, Repository):
+        return Text(title=o.repo, body=join(o.description, o.topics))
+    else:
+        assert_never(o)
+
+
+def fields(o: Model) -> Fields:
+    if isinstance(o, Code):
+        kind = 'code'
+    elif isinstance(o, Commit):
+        kind = 'commit'
+    elif isinstance(o, Issue):
+        kind = 'issue'
+    elif isinstance(o, Repository):
+        kind = 'repository'
+    else:
+        assert_never(o)
+    author = None if o.user is None else o.user.login
+    return Fields(created_at=o.created_at, author=author, kind=kind, extra={'repo': o.repo})
+
+
 def parse(data: bytes) -> Model:
     j = orjson.loads(data)
 
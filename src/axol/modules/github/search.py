@@ -15,15 +15,22 @@ from github.ContentFile import ContentFile
 from github.GithubObject import NotSet, Opt
 from github.Issue import Issue
 from github.Repository import Repository
-from loguru import logger
 
+from axol.core import clients, ratelimit
 from axol.core.common import Json, SearchResults, Uid, make_uid
+from axol.core.incremental import Incremental
+from axol.core.logger import logger
 from axol.credentials import github_token
 
 from .query import Kind, SearchQuery
 
 REQUIRES = ['PyGithub']
 
+# couldn't find what's the max allowed search per_page
+# if we pass value bigger than 100 it works
+# but seems to still return only 100 results per batch
+PER_PAGE = 100
+
 
 def _get_sorts(sorts: Sequence[str]) -> Sequence[tuple[Opt[str], Opt[str]]]:
     # github trims api results to 1000 (last checked 20240626)
@@ -37,6 +44,8 @@ def _get_sorts(sorts: Sequence[str]) -> Sequence[tuple[Opt[str], Opt[str]]]:
 
 class Mixin(Protocol):
     sorts: tuple[str, ...]
+    # sort that returns newly added items first, None means incremental search isn't possible
+    newest: tuple[str, str] | None
     method: Callable  # meh
     KIND: Kind
 
@@ -49,8 +58,14 @@ class Search(Mixin):  # todo make it typed?
     def get_uid(self, x: Any) -> Uid:
         raise NotImplementedError
 
-    def search(self, *, query: str, limit: int | None) -> SearchResults:
+    def search(self, *, query: str, limit: int | None, incremental: Incremental | None = None) -> SearchResults:
         sorts = _get_sorts(self.sorts)
+        if incremental is not None and self.newest is None:
+            logger.debug(f'kind={self.KIND} -- no newest-first sort, incremental search is not possible')
+            incremental = None
+        if incremental is not None:
+            assert self.newest is not None  # meh, for mypy
+            sorts = [self.newest]
         method = self.__class__.method  # hmm otherwise python binds it??
         searcher = partial(method, self.api)
 
@@ -59,7 +74,9 @@ class Search(Mixin):  # todo make it typed?
 
         def _search(*, sort: Opt[str], order: Opt[str]) -> Iterator[tuple[Uid, Any]]:
             uids: dict[Uid, Any] = {}
-            for i, x in enumerate(searcher(query=query, sort=sort, order=order)):
+            results = searcher(query=query, sort=sort, order=order)
+            # NOTE: PyGithub paginates internally, so pacing by the page size
+            for i, x in enumerate(ratelimit.paced(results, host='api.github.com', page_size=PER_PAGE)):
                 if limit is not None and i >= limit:
                     return
 
@@ -90,9 +107,14 @@ class Search(Mixin):  # todo make it typed?
             # kinda tricky since we don't want to convert dupes to json prematurely..
             found = 0
             added = 0
+            stop = None if incremental is None else incremental.stopper()
             for uid, x in _search(sort=sort, order=order):
                 found += 1
 
+                if stop is not None and stop(uid):
+                    logger.debug(f'{qstr2}: reached already crawled items, stopping')
+                    break
+
                 if found > 50 and added == 0:
                     # seems like we're not hitting any new results in this batch
                     if sort in done_sort:
@@ -130,6 +152,7 @@ class SearchCode(Search):
     # - https://github.blog/changelog/2023-03-10-changes-to-the-code-search-api/
     # - https://github.com/orgs/community/discussions/52932
     sorts: tuple[str, ...] = ()
+    newest: tuple[str, str] | None = None
 
     def get_uid(self, x: ContentFile) -> Uid:
         # hmm, so sha here seems to be literal hash of the matched blob?
@@ -146,6 +169,8 @@ class SearchRepositories(Search):
     method = Github.search_repositories
 
     sorts: tuple[str, ...] = ('stars', 'forks', 'updated')
+    # 'updated' isn't good enough, recently updated old repositories would make it stop early
+    newest: tuple[str, str] | None = None
 
     def get_uid(self, x: Repository) -> Uid:
         name = x.full_name.replace('/', '_')
@@ -162,6 +187,7 @@ class SearchIssues(Search):
     # TODO these aren't working in github library due to a hard assert
     # 'reactions',
     # 'interactions',
+    newest: tuple[str, str] | None = ('created', 'desc')
 
     def get_uid(self, x: Issue) -> Uid:
         return make_uid('issue_' + str(x.id))
@@ -173,6 +199,8 @@ class SearchCommits(Search):
     method = Github.search_commits
 
     sorts: tuple[str, ...] = ('author-date', 'committer-date')
+    # NOTE: author date can be way in the past for recently pushed commits
+    newest: tuple[str, str] | None = ('committer-date', 'desc')
 
     def get_uid(self, x: Commit) -> Uid:
         return make_uid('commit_' + x.sha)
@@ -189,18 +217,22 @@ SEARCHERS = {
 }
 
 
-def search(query: SearchQuery, *, limit: int | None) -> SearchResults:
+def search(query: SearchQuery, *, limit: int | None, incremental: Incremental | None = None) -> SearchResults:
     # NOTE: hmm a bit too spammy, would be nice to disable response bodies?
     # github.enable_console_debug_logging()
 
-    api = Github(
-        auth=Auth.Token(github_token()),
-        # couldn't find what's the max allowed search per_page
-        # if we pass value bigger than 100 it works
-        # but seems to still return only 100 results per batch
-        per_page=100,
-    )
-
-    Searcher = SEARCHERS[query.kind]
-    searcher = Searcher(api=api)  # type: ignore[abstract]
-    yield from searcher.search(query=query.query, limit=limit)
+    def make() -> Github:
+        settings = clients.settings()
+        return Github(
+            auth=Auth.Token(github_token()),
+            base_url=clients.resolve('https://api.github.com'),
+            per_page=PER_PAGE,
+            pool_size=settings.pool_size,
+            timeout=int(settings.timeout),
+        )
+
+    # NOTE: not sure if Github client is thread safe, so not sharing between concurrent queries
+    with clients.borrow('github', make, close=lambda api: api.close()) as api:
+        Searcher = SEARCHERS[query.kind]
+        searcher = Searcher(api=api)  # type: ignore[abstract]
+        yield from searcher.search(query=query.query, limit=limit, incremental=incremental)
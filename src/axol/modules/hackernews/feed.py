@@ -2,20 +2,36 @@ from dataclasses import dataclass
 from datetime import UTC
 from pathlib import Path
 
+from axol.core.aio import Budget
 from axol.core.feed import Feed as BaseFeed
 from axol.core.feed import SearchF
+from axol.core.fields import Fields
+from axol.core.fts import Text
 
 from . import markdown, model, query
 
+# recorded responses for tests, see core.standin.replay
+FIXTURES = Path(__file__).parent / 'fixtures'
+
 
 @dataclass
 class Feed(BaseFeed[model.Model, query.Query]):
     PREFIX = 'hackernews'
     QueryCls = query.Query
+    PARSER_VERSION = model.PARSER_VERSION
+    # algolia api is pretty generous
+    SEARCH_BUDGET = Budget(concurrency=4)
+    INCREMENTAL = True
 
     def parse(self, data: bytes) -> model.Model:
         return model.parse(data)
 
+    def text(self, o: model.Model) -> Text:
+        return model.text(o)
+
+    def fields(self, o: model.Model) -> Fields:
+        return model.fields(o)
+
     @property
     def search(self) -> SearchF:
         from . import search
@@ -26,20 +42,17 @@ class Feed(BaseFeed[model.Model, query.Query]):
 
 
 def test_feed(tmp_path: Path) -> None:
-    import os
     from datetime import datetime
 
-    import pytest
-
-    if 'CI' in os.environ:
-        pytest.skip('skipping to prevent potentially hammering the website')
+    from axol.core import standin
 
     feed = Feed.make(
         query_name='test_hn',
         queries=[query.Query('unexpected return')],
         db_path=tmp_path / 'test.sqlite',
     )
-    crawled = [x for x in feed.crawl() if not isinstance(x, Exception)]
+    with standin.replay(FIXTURES, hosts=['hn.algolia.com']):
+        crawled = [x for x in feed.crawl() if not isinstance(x, Exception)]
 
     assert len(crawled) > 10
 
@@ -1,9 +1,12 @@
 from dataclasses import dataclass
 from datetime import datetime
+from typing import assert_never
 
 import orjson
 
 from axol.core.common import _check, datetime_aware, html
+from axol.core.fields import Fields
+from axol.core.fts import Text, join, strip_html
 
 from .common import hn_link
 
@@ -37,6 +40,28 @@ class Story(Base):
 Model = Comment | Story
 
 
+PARSER_VERSION = 1
+
+
+def text(o: Model) -> Text:
+    if isinstance(o, Story):
+        return Text(title=o.title, body=join(o.url, None if o.text is None else strip_html(o.text.html)))
+    elif isinstance(o, Comment):
+        return Text(title='', body=strip_html(o.text.html))
+    else:
+        assert_never(o)
+
+
+def fields(o: Model) -> Fields:
+    if isinstance(o, Story):
+        kind = 'story'
+    elif isinstance(o, Comment):
+        kind = 'comment'
+    else:
+        assert_never(o)
+    return Fields(created_at=o.created_at, author=o.author, kind=kind)
+
+
 # todo add uid here? not sure it should be inside the entity...
 def parse(data: bytes) -> Model:
     j = orjson.loads(data)
@@ -1,33 +1,47 @@
 # NOTE: for hn crawling same query may give different sets of results at a very short timespan
 # try querying the same thing every 5 mins to check
-import hn  # type: ignore[import-untyped]
+from collections.abc import Iterator
+
 import orjson
 
+from axol.core import http
 from axol.core.common import Json, SearchResults, _check, make_uid
+from axol.core.incremental import Incremental
 
 # todo don't remember what type of imports I decided is best? absolute imports in modules??
 from axol.core.logger import logger as global_logger
 
 from .query import SearchQuery
 
-REQUIRES = ['python-hn']
-
-
-def fix_date_format() -> None:
-    ## ugh. hasn't been updated for a while
-    ## TODO maybe use algolia api directly?
-    from hn.utils import AVAILABLE_DATE_FORMATS  # type: ignore[import-untyped]
-
-    _date_format = '%Y-%m-%dT%H:%M:%SZ'
-    if _date_format not in AVAILABLE_DATE_FORMATS:
-        AVAILABLE_DATE_FORMATS.append(_date_format)
-
-
-fix_date_format()
+# max allowed by algolia
+HITS_PER_PAGE = 1000
+
+
+def search_by_date(query: str) -> Iterator[Json]:
+    """
+    Sorted by date, most recent first.
+
+    NOTE: used to use python-hn for that, but it hasn't been updated for a while, and uses requests directly,
+    so we can't cache responses
+    """
+    params = {
+        'query': query,
+        'hitsPerPage': str(HITS_PER_PAGE),
+    }
+    while True:
+        resp = http.get('https://hn.algolia.com/api/v1/search_by_date', params=params)
+        resp.raise_for_status()
+        hits = resp.json()['hits']
+        if len(hits) == 0:
+            return
+        yield from hits
+        # algolia doesn't let you paginate past 1000 results, so instead ask for items older than the last one
+        last = _check(hits[-1]['created_at_i'], int)
+        params['numericFilters'] = f'created_at_i<{last}'
 
 
 # todo would be nice to use some existing query language?
-def _search(query: str, *, limit: int | None) -> SearchResults:
+def _search(query: str, *, limit: int | None, incremental: Incremental | None = None) -> SearchResults:
     assert isinstance(query, str), query  # should be mypy checked, but just in case
 
     logger = global_logger.bind(query=query)
@@ -37,10 +51,12 @@ def _search(query: str, *, limit: int | None) -> SearchResults:
     # ok, so single quotes definitely don't work the same way double quotes are
     assert "'" not in query, query
 
+    # search_by_date is the only pass, and it's newest first, so works well with incremental crawling
+    stop = None if incremental is None else incremental.stopper()
     total = 0
     # search_by_date (from Algolia) means sorted by date, most recent first
     r: Json
-    for r in hn.search_by_date(query):
+    for r in search_by_date(query):
         if limit is not None and total >= limit:
             break
 
@@ -49,21 +65,29 @@ def _search(query: str, *, limit: int | None) -> SearchResults:
         r.pop('_tags', None)
         ##
 
-        uid = _check(r['objectID'], str)  # just in case
+        uid = make_uid(_check(r['objectID'], str))  # just in case
+        if stop is not None and stop(uid):
+            logger.info(f'{query=} -- reached already crawled items, stopping')
+            break
 
         total += 1
-        yield make_uid(uid), orjson.dumps(r)
+        yield uid, orjson.dumps(r)
 
     logger.info(f'{query=} -- got {total} results')
 
 
-def search(query: SearchQuery, *, limit: int | None) -> SearchResults:
-    yield from _search(query=query.query, limit=limit)
+def search(query: SearchQuery, *, limit: int | None, incremental: Incremental | None = None) -> SearchResults:
+    yield from _search(query=query.query, limit=limit, incremental=incremental)
 
 
 def test() -> None:
+    from axol.core import standin
+
+    from .feed import FIXTURES
+
     def check(query: str) -> int:
-        slist = list(search(query=SearchQuery(query), limit=None))
+        with standin.replay(FIXTURES, hosts=['hn.algolia.com']):
+            slist = list(search(query=SearchQuery(query), limit=None))
         return len(slist)
 
     # NOTE: seems like it returns fuzzy results
@@ -3,9 +3,9 @@ from dataclasses import dataclass
 from datetime import UTC, datetime, timedelta, timezone
 from typing import Any, assert_never, cast
 
-from bs4 import BeautifulSoup, NavigableString
-
 from axol.core.common import datetime_aware, html
+from axol.core.fields import Fields
+from axol.core.fts import Text, join, strip_html
 
 from .common import extract_uid, lobsters_link
 from .query import Kind
@@ -40,7 +40,32 @@ class Comment(_Base):
 Model = Story | Comment
 
 
+PARSER_VERSION = 1
+
+
+def text(o: Model) -> Text:
+    if isinstance(o, Story):
+        return Text(title=o.title, body=join(o.url, o.tags))
+    elif isinstance(o, Comment):
+        # NOTE: title is the story title here
+        return Text(title=o.title, body=strip_html(o.text.html))
+    else:
+        assert_never(o)
+
+
+def fields(o: Model) -> Fields:
+    if isinstance(o, Story):
+        return Fields(created_at=o.dt, author=o.author, kind='story', extra={'tags': list(o.tags)})
+    elif isinstance(o, Comment):
+        return Fields(created_at=o.dt, author=o.author, kind='comment')
+    else:
+        assert_never(o)
+
+
 def parse(data: bytes) -> Model:
+    # NOTE: bs4 takes a while to import, so only importing when actually parsing
+    from bs4 import BeautifulSoup, NavigableString
+
     bs = BeautifulSoup(data, 'html.parser')
     [_soup] = bs.children
     soup = cast(Any, _soup)  # ugh. seems like bs4 has wrong type annotations
@@ -1,19 +1,25 @@
 import itertools
 import re
 import time
+from collections.abc import Callable
 from typing import assert_never
 
 import loguru
-import requests
 from bs4 import BeautifulSoup
 
+from axol.core import http
 from axol.core.common import SearchResults, Uid, make_uid
+from axol.core.incremental import Incremental
 from axol.core.logger import logger as main_logger
 
 from .common import extract_uid
 from .query import Kind, SearchQuery
 
 
+def _throttled(html: str) -> bool:
+    return re.search('Throttled, sleep.* between hits', html) is not None
+
+
 def _search_order(
     query: str,
     *,
@@ -22,6 +28,7 @@ def _search_order(
     limit: int | None,
     total_so_far: int,
     logger: 'loguru.Logger',
+    stop: Callable[[Uid], bool] | None = None,
 ) -> SearchResults:
     logger = logger.bind(order=order)
 
@@ -37,7 +44,7 @@ def _search_order(
             break
 
         while True:
-            r = requests.get(
+            r = http.get(
                 'https://lobste.rs/search',
                 params={
                     'q': query,
@@ -45,8 +52,9 @@ def _search_order(
                     'page': str(page),
                     'what': kind,
                 },
+                cacheable=lambda r: not _throttled(r.text),
             )
-            if re.search('Throttled, sleep.* between hits', r.text):
+            if _throttled(r.text):
                 logger.debug('lobste.rs suggested to sleep between hits, waiting...')
                 time.sleep(5)
             else:
@@ -94,13 +102,16 @@ def _search_order(
                 # TODO subtract from expected total??
                 continue
 
+            if stop is not None and stop(uid):
+                logger.info('reached already crawled items, stopping')
+                return
+
             yield uid, item
 
         if len(item_els) == 0:
             logger.debug('no more results')
             break
         logger.debug(f'fetched {len(uids)} results so far')
-        time.sleep(2)  # seems that it sometimes suggests to sleep(1), so doing 2 just in case
 
     total = len(uids)
     logger.info(f'got {total} results')
@@ -108,15 +119,18 @@ def _search_order(
         assert total / expected_total > 0.7, (total, expected_total)  # just in case, maybe make defensive later
 
 
-def _search(query: str, *, kind: Kind, limit: int | None) -> SearchResults:
+def _search(query: str, *, kind: Kind, limit: int | None, incremental: Incremental | None = None) -> SearchResults:
     logger = main_logger.bind(query=query, kind=kind)
 
     logger.info('fetching...')
     uids: set[Uid] = set()
-    for order in ['newest', 'relevance', 'score']:
+    # other orders are unlikely to have anything new if we've already crawled the newest items
+    orders = ['newest', 'relevance', 'score'] if incremental is None else ['newest']
+    for order in orders:
         total_so_far = len(uids)
+        stop = None if incremental is None else incremental.stopper()
         for uid, item in _search_order(
-            query=query, kind=kind, order=order, limit=limit, total_so_far=total_so_far, logger=logger
+            query=query, kind=kind, order=order, limit=limit, total_so_far=total_so_far, logger=logger, stop=stop
         ):
             if uid in uids:
                 continue
@@ -125,5 +139,5 @@ def _search(query: str, *, kind: Kind, limit: int | None) -> SearchResults:
     logger.info(f'fetched {len(uids)} results total')
 
 
-def search(query: SearchQuery, *, limit: int | None) -> SearchResults:
-    yield from _search(query=query.query, kind=query.kind, limit=limit)
+def search(query: SearchQuery, *, limit: int | None, incremental: Incremental | None = None) -> SearchResults:
+    yield from _search(query=query.query, kind=query.kind, limit=limit, incremental=incremental)
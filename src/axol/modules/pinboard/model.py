@@ -4,6 +4,8 @@ from datetime import UTC, datetime
 import orjson
 
 from axol.core.common import _check, datetime_aware
+from axol.core.fields import Fields
+from axol.core.fts import Text, join
 
 from .common import pinboard_link
 
@@ -27,6 +29,17 @@ class Bookmark:
 Model = Bookmark
 
 
+PARSER_VERSION = 1
+
+
+def text(o: Model) -> Text:
+    return Text(title=o.title, body=join(o.url, o.description, o.tags))
+
+
+def fields(o: Model) -> Fields:
+    return Fields(created_at=o.created_at, author=o.author, kind='bookmark', extra={'tags': list(o.tags)})
+
+
 def parse(data: bytes) -> Model:
     j = orjson.loads(data)
 
@@ -1,12 +1,12 @@
 import re
-import time
 from typing import Any
 
 import orjson
 import requests
-from loguru import logger
 
+from axol.core import http
 from axol.core.common import Json, SearchResults, Uid, make_uid, notnone
+from axol.core.logger import logger
 
 from .query import Kind, SearchQuery
 
@@ -103,7 +103,6 @@ def _search(
             uids[uid] = bs
             yield uid, bs
         logger.debug(f'{qstr} -- fetched {len(uids)} results so far')
-        time.sleep(5)  # to avoid spam
 
     total = len(uids)
     logger.info(f'{qstr} -- got {total} results')
@@ -120,8 +119,8 @@ def _do_request_regular(*, query: str, start: int) -> requests.Response:
         'all': 'Search All',
         'start': str(start),
     }
-    return requests.get(
-        url='https://pinboard.in/search',
+    return http.get(
+        'https://pinboard.in/search',
         params=params,
     )
 
@@ -130,8 +129,8 @@ def _do_request_tag(*, query: str, start: int) -> requests.Response:
     params = {
         'start': str(start),
     }
-    return requests.get(
-        url=f'https://pinboard.in/t:{query}',
+    return http.get(
+        f'https://pinboard.in/t:{query}',
         params=params,
     )
 
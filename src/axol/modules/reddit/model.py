@@ -4,6 +4,8 @@ from datetime import UTC, datetime
 import orjson
 
 from axol.core.common import _check, datetime_aware
+from axol.core.fields import Fields
+from axol.core.fts import Text, join
 
 from .common import reddit_link
 
@@ -35,6 +37,19 @@ class Submission:
 Model = Submission
 
 
+PARSER_VERSION = 1
+
+
+def text(o: Model) -> Text:
+    return Text(title=o.title, body=join(o.url, o.selftext_md))
+
+
+def fields(o: Model) -> Fields:
+    return Fields(
+        created_at=o.created_at, author=o.author_name, kind='submission', extra={'subreddit': o.subreddit_name}
+    )
+
+
 def parse(data: bytes) -> Model:
     j = orjson.loads(data)
 
@@ -3,7 +3,7 @@ from typing import Any
 
 import orjson
 import praw
-from loguru import logger
+import prawcore
 from praw.models import (
     PollData,
     PollOption,
@@ -12,7 +12,10 @@ from praw.models import (
     Subreddit,
 )
 
+from axol.core import clients, ratelimit
 from axol.core.common import Json, SearchResults, Uid, make_uid
+from axol.core.incremental import Incremental
+from axol.core.logger import logger
 from axol.credentials import reddit_praw
 
 from .query import SearchQuery
@@ -20,6 +23,13 @@ from .query import SearchQuery
 REQUIRES = ['praw']
 
 
+class RateLimitedRequestor(prawcore.Requestor):
+    # NOTE: this also counts auth requests, but they are rare so whatever
+    def request(self, *args, **kwargs):
+        ratelimit.wait('oauth.reddit.com')
+        return super().request(*args, **kwargs)
+
+
 def debug_praw() -> None:
     import logging
 
@@ -73,16 +83,30 @@ def _uid(r: Submission) -> Uid:
     return make_uid(u)
 
 
-def _search(*, query: str, limit: int | None) -> SearchResults:
+def _make_api() -> praw.Reddit:
+    return praw.Reddit(
+        user_agent='axol',
+        requestor_class=RateLimitedRequestor,
+        requestor_kwargs={
+            # keep-alive connections, closed by the registry
+            'session': clients.session('oauth.reddit.com'),
+            'timeout': clients.settings().timeout,
+        },
+        # NOTE: praw passes these to the requestor itself, so can't be in requestor_kwargs
+        oauth_url=clients.resolve('https://oauth.reddit.com'),
+        reddit_url=clients.resolve('https://www.reddit.com'),
+        **reddit_praw(),
+    )
+
+
+def _search(
+    *, api: praw.Reddit, query: str, limit: int | None, incremental: Incremental | None = None
+) -> SearchResults:
     qstr = f'{query=}'
     # note limit is purely to somewhat limit number of api calls
     # e.g. here it would likely return more results
     logger.debug(f'{qstr} -- fetching...')
 
-    api = praw.Reddit(
-        user_agent='axol',
-        **reddit_praw(),
-    )
     searcher = api.subreddit('all')
 
     def _search(sort_by: str) -> Iterator[Submission]:
@@ -106,14 +130,21 @@ def _search(*, query: str, limit: int | None) -> SearchResults:
     # what is more, when there are hundreds of results, overlap can be basically 0
     # so we merge the results to get as much as we can
     sort_bys = ['relevance', 'hot', 'top', 'new', 'comments']
+    if incremental is not None:
+        # 'new' is the only newest-first order, others are unlikely to have anything new
+        sort_bys = ['new']
 
     # TODO different queries might result in same results as well
     # TODO merge should be shared, merge via uid?
     # might be easier to ignore on database level? not sure
     uids: dict[Uid, Submission] = {}
     for sort_by in sort_bys:
+        stop = None if incremental is None else incremental.stopper()
         for r in _search(sort_by=sort_by):
             uid = _uid(r)
+            if stop is not None and stop(uid):
+                logger.debug(f'{qstr} {sort_by=!r:<10} -- reached already crawled items, stopping')
+                break
             if uid in uids:
                 continue
             uids[uid] = r
@@ -123,8 +154,11 @@ def _search(*, query: str, limit: int | None) -> SearchResults:
     logger.debug(f'{qstr} -- got {total} results')
 
 
-def search(query: SearchQuery, *, limit: int | None) -> SearchResults:
-    yield from _search(query=query.query, limit=limit)
+def search(query: SearchQuery, *, limit: int | None, incremental: Incremental | None = None) -> SearchResults:
+    # NOTE: praw isn't thread safe, so not sharing between concurrent queries
+    # session is shared and closed separately, so nothing to close here
+    with clients.borrow('reddit', _make_api, close=lambda _api: None) as api:
+        yield from _search(api=api, query=query.query, limit=limit, incremental=incremental)
 
 
 # TODO maybe search should be named after specific search provier? like praw
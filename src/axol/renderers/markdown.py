@@ -1,11 +1,15 @@
 import re
 from abc import abstractmethod
+from collections.abc import Iterator
 from dataclasses import dataclass
 from html import unescape as html_unescape
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 from ..core.common import datetime_aware, html
 
+if TYPE_CHECKING:
+    from ..core.feed import Feed
+
 
 @dataclass
 class Author:
@@ -92,3 +96,65 @@ def make_title(
         assert '://' in url, url
         parts.append(f'    [#]({url})')
     return ' '.join(parts)
+
+
+def render_feed(feed: 'Feed', *, workers: int | None = None) -> Iterator[str | Exception]:
+    """
+    Renders feed items as markdown, sorted by creation time
+    """
+    MdAdapter: type[MarkdownAdapterT] = feed.MarkdownAdapter
+
+    if feed.extracts_fields:
+        # the database returns items ordered by creation time, so no need to keep them all in memory
+        for _crawl_dt, _uid, o in feed.feed(workers=workers, order='created'):
+            if isinstance(o, Exception):
+                yield o
+                continue
+            try:
+                mdo = MdAdapter(o)
+            except Exception as e:
+                yield e
+                continue
+            yield _render(mdo)
+        return
+
+    adapters = []
+    for _crawl_dt, _uid, o in feed.feed(workers=workers):
+        # TODO maybe use uid?
+        if isinstance(o, Exception):
+            yield o
+            continue
+        try:
+            mdo = MdAdapter(o)
+            _created_at = mdo.created_at  # check it works, otherwise sorting below would fail
+        except Exception as e:
+            yield e
+            continue
+        adapters.append(mdo)
+
+    # sort items so that ones that don't have date go last
+    def key(a: MarkdownAdapterT):
+        dt = a.created_at
+        if dt is not None:
+            return (False, dt)
+        else:
+            return (True,)
+
+    adapters = sorted(adapters, key=key)
+
+    for a in adapters:
+        yield _render(a)
+
+
+def _render(a: MarkdownAdapterT) -> str | Exception:
+    # TODO include uid?
+    try:
+        created_at = a.created_at
+        author = a.author
+        content = a.content
+    except Exception as e:
+        return e
+
+    created_str = 'no timestamp' if created_at is None else created_at.strftime('%Y-%m-%d %H:%M')
+    by = f'by [{author.name}]({author.url})'
+    return f'{content}\n\n`{created_str}` {by}'
@@ -9,6 +9,24 @@ assert 'PYTEST_CURRENT_TEST' not in os.environ  # to make sure we don't test aga
 
 STORAGE_DIR: Path
 
+# optional: sqlite settings for feed databases, e.g. axol.core.storage.WAL_PROFILE
+# STORAGE_PROFILE: StorageProfile
+
+# optional: override request rates per host, see axol.core.ratelimit.DEFAULT_RATES
+# RATE_LIMITS: dict[str, Rate]
+# optional: where to keep shared rate limiter state (temporary directory by default)
+# RATE_LIMIT_DB: Path
+
+# optional: settings for cached HTTP requests (lobsters/pinboard/hackernews), see axol.core.http.HttpCacheSettings
+# HTTP_CACHE: HttpCacheSettings
+# optional: connection pool size/timeouts for HTTP sessions and API clients, see axol.core.clients.ClientSettings
+# CLIENTS: ClientSettings
+
+# optional: how often queries are crawled with 'axol crawl --adaptive', see axol.core.adaptive.AdaptiveSettings
+# ADAPTIVE: AdaptiveSettings
+# optional: crawl schedules and per-provider concurrency for 'axol daemon', see axol.core.daemon.DaemonSettings
+# DAEMON: DaemonSettings
+
 
 def feeds() -> Iterator[Feed]:
     raise NotImplementedError